@@ -0,0 +1,66 @@
+"""Compare announcement decoding with ryu.lib.packet and construct against
+the fixed offset decoder of sdnmpi.protocol.decoder
+
+Usage:
+    python -m benchmarks.bench_announcement [--number N] [--batch N]"""
+import argparse
+import sys
+import timeit
+
+from ryu.lib.packet import packet, udp
+
+from sdnmpi.simulator import (build_frame, build_announcement,
+                              build_batch_announcement)
+from sdnmpi.protocol import decoder
+from sdnmpi.protocol.announcement import announcement, batch_announcement
+from benchmarks.traces import sdn_mpi_mac
+
+
+def construct_decode(data, parser):
+    pkt = packet.Packet(data)
+    udp_pkt = pkt.get_protocol(udp.udp)
+    if udp_pkt and udp_pkt.dst_port == decoder.ANNOUNCEMENT_PORT:
+        return parser.parse(pkt.protocols[-1])
+    return None
+
+
+def fast_decode(data, decode):
+    offset = decoder.payload_offset(data)
+    if offset is not None:
+        return decode(data, offset)
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--number", type=int, default=10000,
+                        help="number of decodings of each frame")
+    parser.add_argument("--batch", type=int, default=100,
+                        help="number of entries of the batch announcement")
+    args = parser.parse_args(argv)
+
+    src = "04:00:00:00:00:01"
+    processes = [(rank, src) for rank in range(args.batch)]
+    cases = [
+        ("announcement", build_announcement(src, 0), announcement,
+         decoder.decode_announcement),
+        ("batch", build_batch_announcement(src, 1, processes),
+         batch_announcement, decoder.decode_batch),
+        # Packet-ins which are not announcements are rejected
+        ("unicast", build_frame(src, sdn_mpi_mac(0, 1)), announcement,
+         decoder.decode_announcement),
+    ]
+
+    for name, data, construct_parser, decode in cases:
+        slow = timeit.timeit(lambda: construct_decode(data, construct_parser),
+                             number=args.number)
+        fast = timeit.timeit(lambda: fast_decode(data, decode),
+                             number=args.number)
+        sys.stdout.write(
+            "%s\tconstruct %.2f us\tdecoder %.2f us\t%.1fx\n" % (
+                name, slow / args.number * 1e6, fast / args.number * 1e6,
+                slow / fast if fast else 0.0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Runs the controller apps in-process against mock datapaths"""
+from sdnmpi.simulator import (Simulator, build_announcement,
+                              build_batch_announcement, msg_type)
+from sdnmpi.protocol.announcement import MAX_BATCH_ENTRIES
+from sdnmpi.topology import TopologyManager
+from sdnmpi.router import Router
+from sdnmpi.process import ProcessManager
+
+
+class Harness(Simulator):
+    """Simulator whose topology is loaded directly from a Topology"""
+    APPS = [TopologyManager, Router, ProcessManager]
+
+    def __init__(self, topology, admission=False):
+        super(Harness, self).__init__(admission=admission)
+        self.topology = topology
+        self.topology_manager = self.app("TopologyManager")
+        self.process_manager = self.app("ProcessManager")
+
+        topology.load(self.topology_manager.topologydb)
+        for switch in topology.switches.values():
+            self.attach_datapath(switch.dp)
+
+    def launch_ranks(self, hosts):
+        """Announce the launch of rank i on hosts[i]"""
+        for rank, host in enumerate(hosts):
+            self.packet_in(host.port.dpid, host.port.port_no,
+                           build_announcement(host.mac, rank))
+
+    def launch_job(self, hosts, job_id):
+        """Announce the launch of rank i on hosts[i] in batches, all sent
+        from the first host"""
+        launcher = hosts[0]
+        processes = [(rank, host.mac) for rank, host in enumerate(hosts)]
+        for i in range(0, len(processes), MAX_BATCH_ENTRIES):
+            self.packet_in(launcher.port.dpid, launcher.port.port_no,
+                           build_batch_announcement(
+                               launcher.mac, job_id,
+                               processes[i:i + MAX_BATCH_ENTRIES]))
+
+    def count_msgs(self, type_):
+        """Count the sent messages of an OpenFlow message type"""
+        return sum(1 for msg in self.sent_msgs() if msg_type(msg) == type_)
@@ -0,0 +1,47 @@
+"""Generate a trace for sdnmpi.simulator
+
+Usage:
+    python -m benchmarks.make_trace --topology NAME --switches N
+                                    [--trace random|alltoall|bcast] OUTPUT"""
+import argparse
+import json
+
+from benchmarks.topologies import build, TOPOLOGIES
+from benchmarks.traces import (random_pairs, all_to_all, broadcast,
+                               rank_hosts, simulator_records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--topology", choices=TOPOLOGIES, required=True)
+    parser.add_argument("--switches", type=int, required=True)
+    parser.add_argument("--trace", choices=["random", "alltoall", "bcast"],
+                        default="random")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="number of packet-ins of the random trace")
+    parser.add_argument("--ranks", type=int, default=32,
+                        help="number of ranks of the alltoall and bcast "
+                             "traces")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    topology = build(args.topology, args.switches, args.seed)
+    ranks = None
+    if args.trace in ("alltoall", "bcast"):
+        num_ranks = min(args.ranks, len(topology.hosts))
+        ranks = rank_hosts(topology, num_ranks)
+        if args.trace == "alltoall":
+            trace = all_to_all(topology, num_ranks)
+        else:
+            trace = broadcast(topology, num_ranks)
+    else:
+        trace = random_pairs(topology, args.count, args.seed)
+
+    with open(args.output, "w") as f:
+        for record in simulator_records(topology, trace, ranks):
+            f.write(json.dumps(record, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
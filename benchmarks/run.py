@@ -0,0 +1,118 @@
+"""Benchmark TopologyDB and Router on synthetic topologies and traces
+
+Usage:
+    python -m benchmarks.run [--topology NAME] [--switches N]
+                             [--trace random|alltoall|bcast] [--json FILE]
+
+Without --topology and --switches, every topology is run at 10, 100, 1000
+and 10000 switches. Peak memory is that of the whole process, so run a
+single configuration per process to compare it between revisions."""
+import argparse
+import json
+import resource
+import sys
+import time
+
+from ryu import cfg
+from ryu.ofproto import ofproto_v1_0
+
+from sdnmpi.simulator import build_frame, percentile
+from benchmarks.harness import Harness
+from benchmarks.topologies import build, TOPOLOGIES
+from benchmarks.traces import (random_pairs, all_to_all, broadcast,
+                               rank_hosts)
+
+SIZES = [10, 100, 1000, 10000]
+
+
+def peak_memory_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run(topology_name, num_switches, trace_name, count, num_ranks, seed=0):
+    topology = build(topology_name, num_switches, seed)
+    harness = Harness(topology)
+
+    try:
+        if trace_name in ("alltoall", "bcast"):
+            num_ranks = min(num_ranks, len(topology.hosts))
+            harness.launch_job(rank_hosts(topology, num_ranks), 1)
+            if trace_name == "alltoall":
+                trace = all_to_all(topology, num_ranks)
+            else:
+                trace = broadcast(topology, num_ranks)
+        else:
+            trace = random_pairs(topology, count, seed)
+        harness.clear_msgs()
+        del harness.packet_in_latencies[:]
+
+        frames = [build_frame(record.src, record.dst) for record in trace]
+        route_setups = harness.router.counters["route_setup"]
+
+        start = time.time()
+        for record, frame in zip(trace, frames):
+            harness.packet_in(record.dpid, record.in_port, frame)
+        elapsed = time.time() - start
+        latencies = harness.packet_in_latencies
+
+        route_setups = harness.router.counters["route_setup"] - route_setups
+        return {
+            "topology": topology_name,
+            "switches": len(topology.switches),
+            "links": len(topology.links),
+            "hosts": len(topology.hosts),
+            "trace": trace_name,
+            "packet_ins": len(trace),
+            "elapsed": elapsed,
+            "route_setups": route_setups,
+            "routes_per_sec": route_setups / elapsed if elapsed else 0.0,
+            "latency_p50": percentile(latencies, 50),
+            "latency_p99": percentile(latencies, 99),
+            "flow_mods": harness.count_msgs(ofproto_v1_0.OFPT_FLOW_MOD),
+            "packet_outs": harness.count_msgs(ofproto_v1_0.OFPT_PACKET_OUT),
+            "max_port_flows": harness.port_flow_report()["max"],
+            "multicast_links_saved": harness.multicast_report()["saved"],
+            "peak_memory_kb": peak_memory_kb(),
+        }
+    finally:
+        harness.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--topology", choices=TOPOLOGIES)
+    parser.add_argument("--switches", type=int)
+    parser.add_argument("--trace", choices=["random", "alltoall", "bcast"],
+                        default="random")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="number of packet-ins of the random trace")
+    parser.add_argument("--ranks", type=int, default=32,
+                        help="number of ranks of the alltoall and bcast "
+                             "traces")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    cfg.CONF(args=[], project="ryu")
+
+    topologies = [args.topology] if args.topology else TOPOLOGIES
+    sizes = [args.switches] if args.switches else SIZES
+
+    results = []
+    for topology_name in topologies:
+        for num_switches in sizes:
+            result = run(topology_name, num_switches, args.trace, args.count,
+                         args.ranks, args.seed)
+            results.append(result)
+            sys.stdout.write(
+                "%(topology)s\t%(switches)d\t%(routes_per_sec).1f routes/s\t"
+                "p99 %(latency_p99).6fs\t%(flow_mods)d FlowMods\t"
+                "%(peak_memory_kb)d KB\n" % result)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
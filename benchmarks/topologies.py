@@ -0,0 +1,217 @@
+"""Synthetic topology generators built from the tests.mock objects"""
+import random
+
+from tests.mock import MockSwitch, MockPort, MockLink, MockHost
+
+
+def host_mac(idx):
+    # Locally administered bit is clear, so that hosts are not mistaken for
+    # SDN-MPI addresses
+    return "04:00:%02x:%02x:%02x:%02x" % ((idx >> 24) & 0xff,
+                                          (idx >> 16) & 0xff,
+                                          (idx >> 8) & 0xff, idx & 0xff)
+
+
+class Topology(object):
+    def __init__(self, name):
+        super(Topology, self).__init__()
+        self.name = name
+        # DPID -> MockSwitch
+        self.switches = {}
+        self.links = []
+        self.hosts = []
+        # DPID -> last allocated port number
+        self._port_nos = {}
+
+    def add_switch(self, dpid):
+        self.switches[dpid] = MockSwitch(dpid)
+        self._port_nos[dpid] = 0
+
+    def _new_port(self, dpid):
+        self._port_nos[dpid] += 1
+        port = MockPort(dpid, self._port_nos[dpid])
+        self.switches[dpid].ports.append(port)
+        return port
+
+    def connect(self, dpid1, dpid2):
+        """Add a bidirectional link between two switches"""
+        port1 = self._new_port(dpid1)
+        port2 = self._new_port(dpid2)
+        self.links.append(MockLink(port1, port2))
+        self.links.append(MockLink(port2, port1))
+
+    def add_host(self, dpid):
+        host = MockHost(host_mac(len(self.hosts)), self._new_port(dpid))
+        self.hosts.append(host)
+        return host
+
+    def load(self, topologydb):
+        """Populate a TopologyDB with this topology"""
+        for switch in self.switches.values():
+            topologydb.add_switch(switch)
+        for link in self.links:
+            topologydb.add_link(link)
+        for host in self.hosts:
+            topologydb.add_host(host)
+
+
+def fat_tree(k, hosts_per_edge=None):
+    """k-ary fat-tree with 5k^2/4 switches"""
+    if hosts_per_edge is None:
+        hosts_per_edge = k // 2
+    topology = Topology("fat_tree")
+    half = k // 2
+
+    core = list(range(1, half * half + 1))
+    for dpid in core:
+        topology.add_switch(dpid)
+
+    next_dpid = len(core) + 1
+    for pod in range(k):
+        aggs = list(range(next_dpid, next_dpid + half))
+        edges = list(range(next_dpid + half, next_dpid + k))
+        next_dpid += k
+        for dpid in aggs + edges:
+            topology.add_switch(dpid)
+
+        for i, agg in enumerate(aggs):
+            for j in range(half):
+                topology.connect(agg, core[i * half + j])
+            for edge in edges:
+                topology.connect(agg, edge)
+
+        for edge in edges:
+            for _ in range(hosts_per_edge):
+                topology.add_host(edge)
+
+    return topology
+
+
+def torus(dims, hosts_per_switch=1):
+    """Torus with the given number of switches per dimension"""
+    topology = Topology("torus")
+
+    num_switches = 1
+    for size in dims:
+        num_switches *= size
+
+    def coords_to_dpid(coords):
+        idx = 0
+        for size, coord in zip(dims, coords):
+            idx = idx * size + coord
+        return idx + 1
+
+    def dpid_to_coords(dpid):
+        idx = dpid - 1
+        coords = []
+        for size in reversed(dims):
+            coords.append(idx % size)
+            idx //= size
+        return list(reversed(coords))
+
+    for dpid in range(1, num_switches + 1):
+        topology.add_switch(dpid)
+
+    for dpid in range(1, num_switches + 1):
+        coords = dpid_to_coords(dpid)
+        for dim, size in enumerate(dims):
+            # Connect each switch to its successor in every dimension
+            if size < 2 or (size == 2 and coords[dim] == 1):
+                continue
+            neighbor = list(coords)
+            neighbor[dim] = (coords[dim] + 1) % size
+            topology.connect(dpid, coords_to_dpid(neighbor))
+        for _ in range(hosts_per_switch):
+            topology.add_host(dpid)
+
+    return topology
+
+
+def dragonfly(a, h, p=1):
+    """Dragonfly with a routers per group, h global links per router and p
+    hosts per router. There are a * h + 1 groups, fully connected."""
+    topology = Topology("dragonfly")
+    num_groups = a * h + 1
+
+    def router_dpid(group, router):
+        return group * a + router + 1
+
+    for group in range(num_groups):
+        for router in range(a):
+            topology.add_switch(router_dpid(group, router))
+
+    for group in range(num_groups):
+        # Routers in a group are fully connected
+        for r1 in range(a):
+            for r2 in range(r1 + 1, a):
+                topology.connect(router_dpid(group, r1),
+                                 router_dpid(group, r2))
+        # The i-th global link of a group connects to the group (i + 1)
+        # groups ahead
+        for i in range(a * h):
+            peer_group = (group + i + 1) % num_groups
+            if peer_group < group:
+                continue
+            peer_i = (group - peer_group - 1) % num_groups
+            topology.connect(router_dpid(group, i // h),
+                             router_dpid(peer_group, peer_i // h))
+        for router in range(a):
+            for _ in range(p):
+                topology.add_host(router_dpid(group, router))
+
+    return topology
+
+
+def random_graph(num_switches, degree=4, hosts_per_switch=1, seed=0):
+    """Random connected graph: a ring plus random extra links"""
+    rng = random.Random(seed)
+    topology = Topology("random")
+
+    for dpid in range(1, num_switches + 1):
+        topology.add_switch(dpid)
+
+    edges = set()
+    for dpid in range(1, num_switches + 1):
+        peer = dpid % num_switches + 1
+        if peer != dpid:
+            edges.add((min(dpid, peer), max(dpid, peer)))
+
+    num_edges = num_switches * degree // 2
+    attempts = 0
+    while len(edges) < num_edges and attempts < num_edges * 10:
+        attempts += 1
+        dpid1 = rng.randint(1, num_switches)
+        dpid2 = rng.randint(1, num_switches)
+        if dpid1 != dpid2:
+            edges.add((min(dpid1, dpid2), max(dpid1, dpid2)))
+
+    for dpid1, dpid2 in sorted(edges):
+        topology.connect(dpid1, dpid2)
+    for dpid in range(1, num_switches + 1):
+        for _ in range(hosts_per_switch):
+            topology.add_host(dpid)
+
+    return topology
+
+
+def build(name, num_switches, seed=0):
+    """Build a topology of the given kind with about num_switches switches"""
+    if name == "fat_tree":
+        # 5k^2/4 switches, k even
+        k = max(2, int(round((num_switches * 4.0 / 5) ** 0.5 / 2)) * 2)
+        return fat_tree(k, hosts_per_edge=1)
+    elif name == "torus":
+        side = max(2, int(round(num_switches ** (1.0 / 3))))
+        return torus([side, side, max(1, num_switches // (side * side))])
+    elif name == "dragonfly":
+        # a * (a * h + 1) switches, h = a / 2
+        a = 2
+        while (a + 2) * ((a + 2) * (a + 2) // 2 + 1) <= num_switches:
+            a += 2
+        return dragonfly(a, a // 2)
+    elif name == "random":
+        return random_graph(num_switches, seed=seed)
+    raise ValueError("Unknown topology: %s" % name)
+
+
+TOPOLOGIES = ["fat_tree", "torus", "dragonfly", "random"]
@@ -0,0 +1,105 @@
+"""Packet-in trace generators"""
+import random
+
+from sdnmpi.util.multicast import ALL_RANKS, COLL_BCAST
+
+
+def sdn_mpi_mac(src_rank, dst_rank, coll_type=0):
+    """Encode an SDN-MPI destination MAC address"""
+    return "%02x:00:%02x:%02x:%02x:%02x" % (
+        (coll_type << 2) | 0x02,
+        src_rank & 0xff, (src_rank >> 8) & 0xff,
+        dst_rank & 0xff, (dst_rank >> 8) & 0xff)
+
+
+class PacketInRecord(object):
+    def __init__(self, dpid, in_port, src, dst):
+        super(PacketInRecord, self).__init__()
+        self.dpid = dpid
+        self.in_port = in_port
+        self.src = src
+        self.dst = dst
+
+
+def _from_host(host, dst):
+    return PacketInRecord(host.port.dpid, host.port.port_no, host.mac, dst)
+
+
+def random_pairs(topology, count, seed=0):
+    """Unicast packet-ins between random pairs of hosts"""
+    rng = random.Random(seed)
+    hosts = topology.hosts
+    trace = []
+    for _ in range(count):
+        src, dst = rng.sample(hosts, 2)
+        trace.append(_from_host(src, dst.mac))
+    return trace
+
+
+def rank_hosts(topology, num_ranks):
+    """Assign ranks to hosts in a round-robin fashion"""
+    hosts = topology.hosts
+    return [hosts[rank % len(hosts)] for rank in range(num_ranks)]
+
+
+def all_to_all(topology, num_ranks):
+    """SDN-MPI packet-ins of an MPI all-to-all among num_ranks ranks"""
+    hosts = rank_hosts(topology, num_ranks)
+    trace = []
+    for src_rank in range(num_ranks):
+        for dst_rank in range(num_ranks):
+            if src_rank == dst_rank:
+                continue
+            trace.append(_from_host(hosts[src_rank],
+                                    sdn_mpi_mac(src_rank, dst_rank)))
+    return trace
+
+
+def broadcast(topology, num_ranks):
+    """SDN-MPI packet-ins of an MPI broadcast from every rank to all
+    num_ranks ranks"""
+    hosts = rank_hosts(topology, num_ranks)
+    return [_from_host(hosts[src_rank],
+                       sdn_mpi_mac(src_rank, ALL_RANKS, COLL_BCAST))
+            for src_rank in range(num_ranks)]
+
+
+def simulator_records(topology, trace, ranks=None):
+    """Convert a topology and a trace to sdnmpi.simulator trace records
+    ranks is the list of hosts whose ranks are announced before the trace"""
+    records = []
+    for dpid, switch in sorted(topology.switches.items()):
+        records.append({
+            "type": "switch_enter",
+            "dpid": dpid,
+            "ports": [port.port_no for port in switch.ports],
+        })
+    for link in topology.links:
+        records.append({
+            "type": "link_add",
+            "src": [link.src.dpid, link.src.port_no],
+            "dst": [link.dst.dpid, link.dst.port_no],
+        })
+    for host in topology.hosts:
+        records.append({
+            "type": "host_add",
+            "mac": host.mac,
+            "port": [host.port.dpid, host.port.port_no],
+        })
+    for rank, host in enumerate(ranks or []):
+        records.append({
+            "type": "announcement",
+            "dpid": host.port.dpid,
+            "in_port": host.port.port_no,
+            "src": host.mac,
+            "rank": rank,
+        })
+    for record in trace:
+        records.append({
+            "type": "packet_in",
+            "dpid": record.dpid,
+            "in_port": record.in_port,
+            "src": record.src,
+            "dst": record.dst,
+        })
+    return records
@@ -0,0 +1,2 @@
+#!/bin/sh
+ryu-manager --observe-links --noexplicit-drop --log-config-file=logging.ini --config-file=warm_start.conf sdnmpi.rpc_interface sdnmpi.monitor sdnmpi.snapshot
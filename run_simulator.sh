@@ -0,0 +1,2 @@
+#!/bin/sh
+python -c 'import sys; from sdnmpi.simulator import main; main(sys.argv[1:])' "$@"
@@ -4,9 +4,12 @@ import time
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
+from ryu.controller.event import EventBase, EventRequestBase, EventReplyBase
 from ryu.ofproto import ofproto_v1_0
 from ryu.lib import hub
 
+from util.traffic_matrix import TrafficMatrix, decode_sdn_mpi_addr
+
 
 class PortStats(object):
     def __init__(self, timestamp):
@@ -18,7 +21,29 @@ class PortStats(object):
         self.tx_bytes = 0
 
 
+class EventTrafficMatrixUpdate(EventBase):
+    def __init__(self, rows, deleted):
+        super(EventTrafficMatrixUpdate, self).__init__()
+        # TrafficMatrix.to_rows() of the changed entries
+        self.rows = rows
+        # List of (src_rank, dst_rank, coll_type) of the deleted entries
+        self.deleted = deleted
+
+
+class CurrentTrafficMatrixRequest(EventRequestBase):
+    def __init__(self):
+        super(CurrentTrafficMatrixRequest, self).__init__()
+        self.dst = "Monitor"
+
+
+class CurrentTrafficMatrixReply(EventReplyBase):
+    def __init__(self, dst, traffic_matrix):
+        super(CurrentTrafficMatrixReply, self).__init__(dst)
+        self.traffic_matrix = traffic_matrix
+
+
 class Monitor(app_manager.RyuApp):
+    _EVENTS = [EventTrafficMatrixUpdate, CurrentTrafficMatrixRequest]
     OFP_VERSIONS = [ofproto_v1_0.OFP_VERSION]
 
     MONITOR_INTERVAL = 1
@@ -29,6 +54,10 @@ class Monitor(app_manager.RyuApp):
         self.datapaths = {}
         # DPID -> Port Number -> PortStats
         self.datapath_stats = {}
+        # Traffic between MPI ranks
+        self.traffic_matrix = TrafficMatrix()
+        # DPID -> counters of the flow stats replies received so far
+        self._flow_stats = {}
         self.monitor_thread = hub.spawn(self._monitor)
 
     @set_ev_cls(ofp_event.EventOFPStateChange,
@@ -43,14 +72,23 @@ class Monitor(app_manager.RyuApp):
             if datapath.id in self.datapaths:
                 del self.datapaths[datapath.id]
                 del self.datapath_stats[datapath.id]
+                self._flow_stats.pop(datapath.id, None)
+                self.traffic_matrix.delete_datapath(datapath.id)
 
     def _monitor(self):
         self.logger.debug("Starting monitor thread")
         while True:
+            self._refresh_traffic_matrix()
             for datapath in self.datapaths.values():
                 self._request_stats(datapath)
             hub.sleep(self.MONITOR_INTERVAL)
 
+    def _refresh_traffic_matrix(self):
+        changed, deleted = self.traffic_matrix.refresh(time.time())
+        if changed or deleted:
+            self.send_event_to_observers(EventTrafficMatrixUpdate(
+                self.traffic_matrix.to_rows(changed), deleted))
+
     def _request_stats(self, datapath):
         self.logger.debug("Sending port stats request to: %016x", datapath.id)
         ofproto = datapath.ofproto
@@ -59,6 +97,44 @@ class Monitor(app_manager.RyuApp):
         req = parser.OFPPortStatsRequest(datapath, 0, ofproto.OFPP_NONE)
         datapath.send_msg(req)
 
+        # OpenFlow 1.0 aggregate stats cannot be grouped by rank pair, so
+        # all flows of the switch are requested at once
+        req = parser.OFPFlowStatsRequest(datapath, 0, parser.OFPMatch(),
+                                         0xff, ofproto.OFPP_NONE)
+        datapath.send_msg(req)
+
+    @set_ev_cls(CurrentTrafficMatrixRequest)
+    def _current_traffic_matrix_request_handler(self, req):
+        reply = CurrentTrafficMatrixReply(req.src, self.traffic_matrix)
+        self.reply_to_request(req, reply)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        msg = ev.msg
+        dpid = msg.datapath.id
+        flows = self._flow_stats.setdefault(dpid, {})
+        parser = msg.datapath.ofproto_parser
+
+        for stat in msg.body:
+            # Flows installed by Router for an SDN-MPI address rewrite it
+            # to the MAC of the receiving host at the last hop; flows of
+            # other applications are not accounted
+            if not any(isinstance(action, parser.OFPActionSetDlDst)
+                       for action in stat.actions):
+                continue
+            key = decode_sdn_mpi_addr(stat.match.dl_dst)
+            if key is None:
+                continue
+            # A rank may have moved, leaving the flows of both hosts
+            byte_count, packet_count = flows.get(key, (0, 0))
+            flows[key] = (byte_count + stat.byte_count,
+                          packet_count + stat.packet_count)
+
+        # Wait for the last reply of a multipart reply
+        if msg.flags & msg.datapath.ofproto.OFPSF_REPLY_MORE:
+            return
+        self.traffic_matrix.update_datapath(dpid, self._flow_stats.pop(dpid))
+
     @set_ev_cls(ofp_event.EventOFPPortStatsReply, MAIN_DISPATCHER)
     def _port_stats_reply_handler(self, ev):
         dpid = ev.msg.datapath.id
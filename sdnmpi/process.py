@@ -3,13 +3,12 @@ from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
 from ryu.controller.event import EventBase, EventRequestBase, EventReplyBase
 from ryu.ofproto import ofproto_v1_0
-from ryu.lib.mac import BROADCAST_STR
-from ryu.lib.packet import packet, ethernet, ether_types, udp
 from ryu.lib.packet.ether_types import ETH_TYPE_IP
 from ryu.lib.packet.in_proto import IPPROTO_UDP
 
-from util.rank_allocation_db import RankAllocationDB
-from protocol.announcement import announcement
+from util.rank_allocation_db import RankAllocationDB, MAX_RANK
+from protocol import decoder
+from topology import EventHostDelete
 
 
 class EventProcessAdd(EventBase):
@@ -25,6 +24,23 @@ class EventProcessDelete(EventBase):
         self.rank = rank
 
 
+class EventProcessBatchAdd(EventBase):
+    def __init__(self, job_id, processes):
+        super(EventProcessBatchAdd, self).__init__()
+        self.job_id = job_id
+        # List of (rank, mac)
+        self.processes = processes
+
+
+class EventProcessBatchDelete(EventBase):
+    """job_id is None if the ranks were deleted because their host was
+    lost, and may then belong to several jobs"""
+    def __init__(self, job_id, ranks):
+        super(EventProcessBatchDelete, self).__init__()
+        self.job_id = job_id
+        self.ranks = ranks
+
+
 class RankResolutionRequest(EventRequestBase):
     def __init__(self, rank):
         super(RankResolutionRequest, self).__init__()
@@ -51,13 +67,19 @@ class CurrentProcessAllocationReply(EventReplyBase):
 
 
 class ProcessManager(app_manager.RyuApp):
-    _EVENTS = [EventProcessAdd, EventProcessDelete]
+    _EVENTS = [EventProcessAdd, EventProcessDelete, EventProcessBatchAdd,
+               EventProcessBatchDelete]
     OFP_VERSIONS = [ofproto_v1_0.OFP_VERSION]
 
     def __init__(self, *args, **kwargs):
         super(ProcessManager, self).__init__(*args, **kwargs)
         self._rankdb = RankAllocationDB()
 
+    @property
+    def rankdb(self):
+        """RankAllocationDB, for apps that read it without a request"""
+        return self._rankdb
+
     @set_ev_cls(ofp_event.EventOFPStateChange, MAIN_DISPATCHER)
     def _state_change_handler(self, ev):
         datapath = ev.datapath
@@ -67,7 +89,7 @@ class ProcessManager(app_manager.RyuApp):
         match = ofproto_parser.OFPMatch(
             dl_type=ETH_TYPE_IP,
             nw_proto=IPPROTO_UDP,
-            tp_dst=61000)
+            tp_dst=decoder.ANNOUNCEMENT_PORT)
 
         actions = [ofproto_parser.OFPActionOutput(ofproto.OFPP_CONTROLLER)]
 
@@ -80,13 +102,23 @@ class ProcessManager(app_manager.RyuApp):
 
     @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
     def _packet_in_handler(self, ev):
-        msg = ev.msg
-        pkt = packet.Packet(msg.data)
-        eth = pkt.get_protocol(ethernet.ethernet)
-
-        if eth.dst == BROADCAST_STR:
-            if eth.ethertype == ether_types.ETH_TYPE_IP:
-                self._broadcast_handler(eth, pkt)
+        data = ev.msg.data
+        # Announcements are recognized without decoding the whole packet
+        offset = decoder.payload_offset(data)
+        if offset is not None:
+            self._announcement_handler(data, offset)
+
+    @set_ev_cls(EventHostDelete)
+    def _event_host_delete_handler(self, ev):
+        # An idle host is only forgotten until it sends again: its
+        # processes are still running
+        if ev.reason == "idle":
+            return
+        ranks = self._rankdb.delete_mac(ev.host.mac)
+        if ranks:
+            self.send_event_to_observers(EventProcessBatchDelete(None, ranks))
+            self.logger.info("MPI processes %s lost with host %s",
+                             ranks, ev.host.mac)
 
     @set_ev_cls(RankResolutionRequest)
     def _rank_resolution_handler(self, req):
@@ -98,22 +130,50 @@ class ProcessManager(app_manager.RyuApp):
         reply = CurrentProcessAllocationReply(req.src, self._rankdb)
         self.reply_to_request(req, reply)
 
-    def _broadcast_handler(self, eth, pkt):
-        udp_pkt = pkt.get_protocol(udp.udp)
-        if udp_pkt and udp_pkt.dst_port == 61000:
-            payload = pkt.protocols[-1]
-            ann = announcement.parse(payload)
-
-            if ann.type == "LAUNCH":
-                rank = ann.args.rank
-                self._rankdb.add_process(rank, eth.src)
-                self.send_event_to_observers(EventProcessAdd(rank, eth.src))
-                self.logger.info("MPI process %s started at %s", rank, eth.src)
-            elif ann.type == "EXIT":
-                rank = ann.args.rank
-                self._rankdb.delete_prcess(rank)
-                self.send_event_to_observers(EventProcessDelete(rank))
-                self.logger.info("MPI process %s exited at %s", rank, eth.src)
-            return True
-
-        return False
+    def _announcement_handler(self, data, offset):
+        ann_type = decoder.announcement_type(data, offset)
+        if ann_type in (decoder.LAUNCH_BATCH, decoder.EXIT_BATCH):
+            batch = decoder.decode_batch(data, offset)
+            if batch is not None:
+                self._batch_handler(*batch)
+            return
+
+        ann = decoder.decode_announcement(data, offset)
+        if ann is None:
+            return
+        ann_type, rank = ann
+        src = decoder.src_mac(data)
+        if not 0 <= rank <= MAX_RANK:
+            self.logger.warning("Invalid rank %s announced", rank)
+            return
+
+        if ann_type == decoder.LAUNCH:
+            self._rankdb.add_process(rank, src)
+            self.send_event_to_observers(EventProcessAdd(rank, src))
+            self.logger.info("MPI process %s started at %s", rank, src)
+        elif ann_type == decoder.EXIT:
+            self._rankdb.delete_prcess(rank)
+            self.send_event_to_observers(EventProcessDelete(rank))
+            self.logger.info("MPI process %s exited at %s", rank, src)
+
+    def _batch_handler(self, ann_type, job_id, entries):
+        if any(not 0 <= rank <= MAX_RANK for rank, mac in entries):
+            self.logger.warning("Invalid rank announced for job %s", job_id)
+            return
+
+        if ann_type == decoder.LAUNCH_BATCH:
+            self._rankdb.add_processes(job_id, entries)
+            self.send_event_to_observers(
+                EventProcessBatchAdd(job_id, entries))
+            self.logger.info("MPI job %s: %d processes started",
+                             job_id, len(entries))
+        else:
+            if entries:
+                ranks = self._rankdb.delete_processes(
+                    [rank for rank, mac in entries])
+            else:
+                ranks = self._rankdb.delete_job(job_id)
+            self.send_event_to_observers(
+                EventProcessBatchDelete(job_id, ranks))
+            self.logger.info("MPI job %s: %d processes exited",
+                             job_id, len(ranks))
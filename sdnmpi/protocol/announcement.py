@@ -1,9 +1,11 @@
-from construct import Struct, Union, Enum, SLInt32
+from construct import (Struct, Union, Enum, Array, Bytes, SLInt32, ULInt32)
 
 announcement_type = Enum(
     SLInt32("type"),
     LAUNCH=0,
     EXIT=1,
+    LAUNCH_BATCH=2,
+    EXIT_BATCH=3,
 )
 
 announcement = Struct(
@@ -16,3 +18,25 @@ announcement = Struct(
 )
 
 ANNOUNCEMENT_PACKET_LEN = announcement.sizeof()
+
+# Processes of a job launched or exited together. An EXIT_BATCH without
+# entries ends every process of the job.
+batch_announcement = Struct(
+    "batch_announcement",
+    announcement_type,
+    ULInt32("job_id"),
+    ULInt32("count"),
+    Array(
+        lambda ctx: ctx.count,
+        Struct(
+            "entries",
+            SLInt32("rank"),
+            Bytes("mac", 6),
+        ),
+    ),
+)
+
+BATCH_HEADER_LEN = 12
+BATCH_ENTRY_LEN = 10
+# Entries fitting in the UDP payload of a 1500 bytes MTU frame
+MAX_BATCH_ENTRIES = (1472 - BATCH_HEADER_LEN) // BATCH_ENTRY_LEN
@@ -0,0 +1,95 @@
+"""Decoding of announcement frames at fixed offsets
+
+Equivalent to decoding the frame with ryu.lib.packet and the payload with
+the construct definitions of protocol.announcement, for the frames
+ProcessManager receives: untagged Ethernet, IPv4 and UDP to port 61000.
+Every field is read with precompiled structs straight from the raw frame,
+so non-announcement packet-ins are rejected after a few byte reads."""
+import binascii
+import struct
+
+LAUNCH = 0
+EXIT = 1
+LAUNCH_BATCH = 2
+EXIT_BATCH = 3
+
+ANNOUNCEMENT_PORT = 61000
+
+_ETH_HEADER_LEN = 14
+_BROADCAST = b"\xff" * 6
+_ETH_TYPE_IP = 0x0800
+_IPPROTO_UDP = 17
+_UDP_HEADER_LEN = 8
+
+_ETH_TYPE = struct.Struct("!H")
+_BYTE = struct.Struct("!B")
+_PORT = struct.Struct("!H")
+_ANNOUNCEMENT = struct.Struct("<ii")
+_BATCH_HEADER = struct.Struct("<iII")
+_BATCH_ENTRY = struct.Struct("<i6s")
+
+
+def mac_to_text(mac_bin):
+    mac_hex = binascii.hexlify(mac_bin).decode("ascii")
+    return ":".join(mac_hex[i:i + 2] for i in range(0, 12, 2))
+
+
+def payload_offset(data):
+    """Returns the offset of the announcement in a frame, or None if the
+    frame is not a broadcast UDP datagram to the announcement port"""
+    if len(data) < _ETH_HEADER_LEN + 20 + _UDP_HEADER_LEN:
+        return None
+    if data[:6] != _BROADCAST:
+        return None
+    if _ETH_TYPE.unpack_from(data, 12)[0] != _ETH_TYPE_IP:
+        return None
+
+    version_ihl = _BYTE.unpack_from(data, _ETH_HEADER_LEN)[0]
+    if _BYTE.unpack_from(data, _ETH_HEADER_LEN + 9)[0] != _IPPROTO_UDP:
+        return None
+    udp_offset = _ETH_HEADER_LEN + (version_ihl & 0x0f) * 4
+    if len(data) < udp_offset + _UDP_HEADER_LEN:
+        return None
+    if _PORT.unpack_from(data, udp_offset + 2)[0] != ANNOUNCEMENT_PORT:
+        return None
+    return udp_offset + _UDP_HEADER_LEN
+
+
+def announcement_type(data, offset):
+    """Returns the type of the announcement at offset, or None if the
+    payload is too short"""
+    if len(data) < offset + 4:
+        return None
+    return struct.unpack_from("<i", data, offset)[0]
+
+
+def decode_announcement(data, offset):
+    """Returns (type, rank) of a LAUNCH or EXIT announcement"""
+    if len(data) < offset + _ANNOUNCEMENT.size:
+        return None
+    return _ANNOUNCEMENT.unpack_from(data, offset)
+
+
+def decode_batch(data, offset):
+    """Returns (type, job_id, entries) of a LAUNCH_BATCH or EXIT_BATCH
+    announcement, where entries is a list of (rank, mac)
+
+    Batches whose entries are truncated are rejected."""
+    if len(data) < offset + _BATCH_HEADER.size:
+        return None
+    ann_type, job_id, count = _BATCH_HEADER.unpack_from(data, offset)
+    offset += _BATCH_HEADER.size
+    if len(data) < offset + count * _BATCH_ENTRY.size:
+        return None
+
+    entries = []
+    unpack_from = _BATCH_ENTRY.unpack_from
+    for i in range(offset, offset + count * _BATCH_ENTRY.size,
+                   _BATCH_ENTRY.size):
+        rank, mac_bin = unpack_from(data, i)
+        entries.append((rank, mac_to_text(mac_bin)))
+    return (ann_type, job_id, entries)
+
+
+def src_mac(data):
+    return mac_to_text(data[6:12])
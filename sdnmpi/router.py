@@ -1,25 +1,77 @@
 import struct
 
+from ryu import cfg
 from ryu.base import app_manager
 from ryu.controller import ofp_event
 from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER, set_ev_cls
 from ryu.controller.event import EventBase, EventRequestBase, EventReplyBase
 from ryu.ofproto import ofproto_v1_0
-from ryu.lib.mac import haddr_to_bin, BROADCAST_STR
+from ryu.lib.mac import haddr_to_bin, haddr_to_str, BROADCAST_STR
 from ryu.lib.packet import packet, ethernet, ether_types
+from ryu.lib import hub
 
+from util.identity import frame_ids
 from util.switch_fdb import SwitchFDB
-from topology import FindRouteRequest, BroadcastRequest
-from process import RankResolutionRequest, ProcessManager
+from util.admission import RateLimiter, PendingTable
+from util.packet_buffer import PacketBufferPool
+from util.path_selection import make_path_policy
+from util.multicast import is_multicast, MulticastTree
+from util.traffic_matrix import decode_sdn_mpi_addr
+from topology import (FindRouteRequest, FindAllRoutesRequest, BroadcastRequest,
+                      FindMulticastTreeRequest, EventHostDelete, EventHostIdle,
+                      EventTopologyChanged)
+from process import (CurrentProcessAllocationRequest, EventProcessAdd,
+                     EventProcessDelete, EventProcessBatchAdd,
+                     EventProcessBatchDelete, ProcessManager)
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt("mpi_path_policy", default="dfs",
+               help="route selection among equal-cost routes for MPI flows "
+                    "(dfs, hash, round_robin or least_loaded)"),
+    cfg.IntOpt("packet_in_concurrency", default=0,
+               help="number of packet-ins whose route setup may be in "
+                    "flight at once (0 sets up routes one at a time in the "
+                    "event loop)"),
+    cfg.FloatOpt("src_packet_in_rate", default=100,
+                 help="packet-ins per second admitted from a source MAC"),
+    cfg.IntOpt("src_packet_in_burst", default=200,
+               help="packet-ins admitted in a burst from a source MAC"),
+    cfg.FloatOpt("dpid_packet_in_rate", default=1000,
+                 help="packet-ins per second admitted from a datapath"),
+    cfg.IntOpt("dpid_packet_in_burst", default=2000,
+               help="packet-ins admitted in a burst from a datapath"),
+    cfg.IntOpt("packet_in_max_sources", default=65536,
+               help="number of source MACs whose packet-in rate is tracked"),
+    cfg.FloatOpt("packet_in_stats_interval", default=1,
+                 help="seconds between EventPacketInStats"),
+])
 
 
 class EventFDBUpdate(EventBase):
-    def __init__(self, dpid, src, dst, port):
+    def __init__(self, dpid, src, dst, port, true_dst=None, branches=None):
         super(EventFDBUpdate, self).__init__()
         self.dpid = dpid
         self.src = src
         self.dst = dst
         self.port = port
+        # Destination MAC address rewritten by the flow, if any
+        self.true_dst = true_dst
+        # (output port, dst MAC or None) of a flow replicating packets along
+        # a multicast tree, if any
+        self.branches = branches
+
+
+class EventFlowInstall(EventBase):
+    """Request to install a flow computed by another controller shard"""
+    def __init__(self, dpid, src, dst, port, true_dst=None, branches=None):
+        super(EventFlowInstall, self).__init__()
+        self.dpid = dpid
+        self.src = src
+        self.dst = dst
+        self.port = port
+        self.true_dst = true_dst
+        self.branches = branches
 
 
 class CurrentFDBRequest(EventRequestBase):
@@ -34,31 +86,135 @@ class CurrentFDBReply(EventReplyBase):
         self.fdb = fdb
 
 
+class EventPacketInStats(EventBase):
+    """Packet-in counters of Router, sent when they changed"""
+    def __init__(self, counters):
+        super(EventPacketInStats, self).__init__()
+        self.counters = counters
+
+
+class PacketInStatsRequest(EventRequestBase):
+    def __init__(self):
+        super(PacketInStatsRequest, self).__init__()
+        self.dst = "Router"
+
+
+class PacketInStatsReply(EventReplyBase):
+    def __init__(self, dst, counters):
+        super(PacketInStatsReply, self).__init__(dst)
+        self.counters = counters
+
+
 class Router(app_manager.RyuApp):
-    _EVENTS = [EventFDBUpdate, CurrentFDBRequest]
+    _EVENTS = [EventFDBUpdate, EventPacketInStats, CurrentFDBRequest,
+               PacketInStatsRequest]
     _CONTEXTS = {
         "process_manager": ProcessManager,
     }
     OFP_VERSIONS = [ofproto_v1_0.OFP_VERSION]
 
+    # Seconds a (src, dst) pair stays pending after a route setup started
+    PENDING_ROUTE_TIMEOUT = 1
+    # Number and size of the slots holding packets received for a pending
+    # route, and number of packets held per (src, dst) pair
+    PACKET_BUFFER_SLOTS = 1024
+    PACKET_BUFFER_SLOT_SIZE = 2048
+    PACKET_BUFFER_PER_ROUTE = 64
+
     def __init__(self, *args, **kwargs):
         super(Router, self).__init__(*args, **kwargs)
         self.fdb = SwitchFDB()
         self.dps = {}
+        # True MAC -> set of SDN-MPI MACs of the flows rewritten to it
+        self.virtual_dsts = {}
+        # SDN-MPI MAC -> true MAC its flows are rewritten to
+        self.true_dsts = {}
+        # (src, dst) -> MulticastTree of the broadcast-style collectives
+        self.trees = {}
+        # (src, dst) -> (job ID, ranks) of the job a tree was built for
+        self.tree_ranks = {}
+        # Links crossed by one packet of each installed tree, and by the
+        # same packet sent with one unicast flow per receiver
+        self.multicast_stats = {
+            "trees": 0,
+            "links": 0,
+            "unicast_links": 0,
+        }
+        # RankAllocationDB of ProcessManager, read directly to resolve ranks
+        process_manager = kwargs.get("process_manager")
+        self.rankdb = process_manager.rankdb if process_manager else None
+        # None if MPI flows use the single route found by DFS
+        self.path_policy = make_path_policy(CONF.mpi_path_policy, self.fdb)
+        self.src_limiter = RateLimiter(CONF.src_packet_in_rate,
+                                       CONF.src_packet_in_burst,
+                                       max_keys=CONF.packet_in_max_sources)
+        self.dpid_limiter = RateLimiter(CONF.dpid_packet_in_rate,
+                                        CONF.dpid_packet_in_burst)
+        # (src, dst) pairs whose route setup is in flight
+        self.pending_routes = PendingTable(self.PENDING_ROUTE_TIMEOUT)
+        # Packets of the pending routes, sent once the flows are installed
+        self.packet_buffers = PacketBufferPool(self.PACKET_BUFFER_SLOTS,
+                                               self.PACKET_BUFFER_SLOT_SIZE,
+                                               self.PACKET_BUFFER_PER_ROUTE)
+        # Slots of the route setups running in their own greenthread, or
+        # None if they run in the event loop
+        self.route_setup_slots = None
+        if CONF.packet_in_concurrency > 0:
+            self.route_setup_slots = hub.BoundedSemaphore(
+                CONF.packet_in_concurrency)
+        self.route_setups_in_flight = 0
+        self.counters = {
+            "received": 0,
+            "dropped_src": 0,
+            "dropped_dpid": 0,
+            "deduplicated": 0,
+            "buffered": 0,
+            "released": 0,
+            "discarded": 0,
+            "fdb_hit": 0,
+            "route_setup": 0,
+            "max_in_flight": 0,
+        }
+        self.stats_thread = hub.spawn(self._stats_loop)
+
+    def _stats_loop(self):
+        sent = None
+        while True:
+            hub.sleep(CONF.packet_in_stats_interval)
+            # Pending routes also expire when no packet-in comes
+            self._expire_pending_routes()
+            if self.counters != sent:
+                sent = dict(self.counters)
+                self.send_event_to_observers(EventPacketInStats(sent))
 
     def _add_flow(self, datapath, src, dst, out_port, actions=[]):
+        actions = actions + [datapath.ofproto_parser.OFPActionOutput(out_port)]
+        self._add_flow_actions(datapath, src, dst, actions)
+
+    def _add_flow_actions(self, datapath, src, dst, actions):
         ofproto = datapath.ofproto
 
         match = datapath.ofproto_parser.OFPMatch(
             dl_src=haddr_to_bin(src), dl_dst=haddr_to_bin(dst))
 
-        actions = actions + [datapath.ofproto_parser.OFPActionOutput(out_port)]
+        mod = datapath.ofproto_parser.OFPFlowMod(
+            datapath=datapath, match=match, cookie=0,
+            command=ofproto.OFPFC_ADD, idle_timeout=CONF.host_idle_timeout,
+            hard_timeout=0, priority=ofproto.OFP_DEFAULT_PRIORITY,
+            flags=ofproto.OFPFF_SEND_FLOW_REM, actions=actions)
+        datapath.send_msg(mod)
+
+    def _delete_flows(self, datapath, **fields):
+        """Delete every flow matching fields, whatever its other fields"""
+        ofproto = datapath.ofproto
+
+        match = datapath.ofproto_parser.OFPMatch(**fields)
 
         mod = datapath.ofproto_parser.OFPFlowMod(
             datapath=datapath, match=match, cookie=0,
-            command=ofproto.OFPFC_ADD, idle_timeout=0, hard_timeout=0,
+            command=ofproto.OFPFC_DELETE, idle_timeout=0, hard_timeout=0,
             priority=ofproto.OFP_DEFAULT_PRIORITY,
-            flags=ofproto.OFPFF_SEND_FLOW_REM, actions=actions)
+            out_port=ofproto.OFPP_NONE, actions=[])
         datapath.send_msg(mod)
 
     @set_ev_cls(CurrentFDBRequest)
@@ -66,6 +222,11 @@ class Router(app_manager.RyuApp):
         reply = CurrentFDBReply(req.src, self.fdb)
         self.reply_to_request(req, reply)
 
+    @set_ev_cls(PacketInStatsRequest)
+    def _packet_in_stats_request_handler(self, req):
+        reply = PacketInStatsReply(req.src, dict(self.counters))
+        self.reply_to_request(req, reply)
+
     @set_ev_cls(ofp_event.EventOFPStateChange,
                 [MAIN_DISPATCHER, DEAD_DISPATCHER])
     def state_change_handler(self, ev):
@@ -74,36 +235,309 @@ class Router(app_manager.RyuApp):
             if dp.id is None:
                 return
             self.dps[dp.id] = dp
+            # The flow table of a reconnecting switch may have lost the
+            # flows of the trees crossing it
+            self._delete_trees(lambda src, tree: dp.id in tree.ports)
         elif ev.state == DEAD_DISPATCHER:
             if dp.id is None:
                 return
             if dp.id in self.dps:
                 del self.dps[dp.id]
+            self.dpid_limiter.forget(dp.id)
 
     def _add_flows_for_path(self, fdb, src, dst, true_dst=None):
         for (idx, (dpid, out_port)) in enumerate(fdb):
-            # Check if a flow for this packet has already been installed
-            if self.fdb.exists(dpid, src, dst):
+            # Only the last hop rewrites the destination MAC address
+            if idx == len(fdb) - 1:
+                self._install_flow(dpid, src, dst, out_port, true_dst)
+            else:
+                self._install_flow(dpid, src, dst, out_port)
+
+    def _install_flow(self, dpid, src, dst, out_port, true_dst=None,
+                      branches=None):
+        # Check if a flow for this packet has already been installed
+        if self.fdb.exists(dpid, src, dst):
+            return
+
+        # Update FDB and notify to observers
+        self.fdb.update(dpid, src, dst, out_port, branches)
+        if true_dst:
+            self.add_true_dst(dst, true_dst)
+        if branches:
+            self._add_tree_flow(dpid, src, dst, branches)
+        self.send_event_to_observers(
+            EventFDBUpdate(dpid, src, dst, out_port, true_dst, branches)
+        )
+
+        # If a datapath having dpid is connected to controller
+        if dpid in self.dps:
+            datapath = self.dps[dpid]
+            if branches:
+                self._add_flow_actions(
+                    datapath, src, dst,
+                    self._branch_actions(datapath, branches))
+            elif true_dst:
+                actions = [datapath.ofproto_parser.OFPActionSetDlDst(
+                    haddr_to_bin(true_dst)
+                )]
+                self._add_flow(datapath, src, dst, out_port, actions)
+            else:
+                self._add_flow(datapath, src, dst, out_port)
+
+    def add_true_dst(self, dst, true_dst):
+        """Remember that the flows to the SDN-MPI MAC dst are rewritten to
+        the true MAC true_dst, e.g. for flows restored from a snapshot"""
+        self.virtual_dsts.setdefault(true_dst, set()).add(dst)
+        self.true_dsts[dst] = true_dst
+
+    def _add_tree_flow(self, dpid, src, dst, branches):
+        """Add a replicating flow to the tree of its pair, which is created
+        for flows installed by another shard or restored from a snapshot"""
+        tree = self.trees.get((src, dst))
+        if tree is None:
+            tree = MulticastTree({}, [], 0)
+            self.trees[(src, dst)] = tree
+            self.tree_ranks[(src, dst)] = self._dst_job_ranks(dst)
+        tree.ports[dpid] = list(branches)
+        for (_, dst_mac) in branches:
+            if dst_mac is not None and dst_mac not in tree.receivers:
+                tree.receivers.append(dst_mac)
+
+    def _dst_job_ranks(self, dst):
+        """Returns (job ID, ranks) of the job of the sender of a SDN-MPI
+        address"""
+        addr = decode_sdn_mpi_addr(haddr_to_bin(dst))
+        job_id = None
+        if addr is not None and self.rankdb is not None:
+            job_id = self.rankdb.get_job(addr[0])
+        if job_id is None:
+            return (None, frozenset())
+        return (job_id, frozenset(self.rankdb.job_ranks(job_id)))
+
+    def restore_trees(self):
+        """Rebuild the trees of the replicating flows of the FDB, e.g. for
+        flows restored from a snapshot"""
+        for (dpid, src, dst, branches) in self.fdb.branch_entries():
+            self._add_tree_flow(dpid, src, dst, branches)
+
+    @set_ev_cls(EventFlowInstall)
+    def _flow_install_handler(self, ev):
+        self._install_flow(ev.dpid, ev.src, ev.dst, ev.port, ev.true_dst,
+                           ev.branches)
+
+    @set_ev_cls(ofp_event.EventOFPFlowRemoved, MAIN_DISPATCHER)
+    def _flow_removed_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        # Flows deleted by the controller were already forgotten when their
+        # deletion was sent, and may have been installed again since
+        if msg.reason not in (ofproto.OFPRR_IDLE_TIMEOUT,
+                              ofproto.OFPRR_HARD_TIMEOUT):
+            return
+        src = haddr_to_str(msg.match.dl_src)
+        dst = haddr_to_str(msg.match.dl_dst)
+        self.fdb.delete(msg.datapath.id, src, dst)
+        # A tree missing the flow of one of its switches is rebuilt on the
+        # next packet-in
+        if (src, dst) in self.trees:
+            self._delete_routes([(src, dst)])
+        true_dst = self.true_dsts.get(dst, dst)
+        self._forget_virtual_dsts([dst])
+
+        # All flows of the sender or the receiver expired: it has not sent
+        # or received anything for host_idle_timeout seconds
+        if msg.reason == ofproto.OFPRR_IDLE_TIMEOUT:
+            for mac in sorted(set([src, true_dst])):
+                if not self._host_has_flows(mac):
+                    self.send_event("TopologyManager", EventHostIdle(mac))
+
+    def _host_has_flows(self, mac):
+        """Returns True if there are flows from or to a host, including MPI
+        flows rewritten to it"""
+        if self.fdb.has_flows(mac):
+            return True
+        return any(self.fdb.has_flows(virtual_dst)
+                   for virtual_dst in self.virtual_dsts.get(mac, ()))
+
+    def _forget_virtual_dsts(self, dsts):
+        """Forget the SDN-MPI MACs among dsts which have no flows left"""
+        for dst in dsts:
+            true_dst = self.true_dsts.get(dst)
+            if true_dst is None or self.fdb.has_flows(dst):
                 continue
+            del self.true_dsts[dst]
+            virtual_dsts = self.virtual_dsts[true_dst]
+            virtual_dsts.discard(dst)
+            if not virtual_dsts:
+                del self.virtual_dsts[true_dst]
+
+    def _forget_host(self, mac):
+        """Forget the SDN-MPI MACs rewritten to a host
+        Returns them in sorted order"""
+        virtual_dsts = sorted(self.virtual_dsts.pop(mac, ()))
+        for virtual_dst in virtual_dsts:
+            del self.true_dsts[virtual_dst]
+        return virtual_dsts
+
+    @set_ev_cls(EventHostDelete)
+    def _event_host_delete_handler(self, ev):
+        mac = ev.host.mac
+        # Trees from or to the host, whose flows at the switches before the
+        # last hop do not name it
+        self._delete_trees(lambda src, tree: src == mac or
+                           mac in tree.receivers)
+
+        # Flows from or to the host, and MPI flows rewritten to it
+        macs = [mac] + self._forget_host(mac)
+
+        # Flows are deleted with one FlowMod per switch and MAC
+        matches = set()
+        for flow_mac in macs:
+            for (dpid, src, dst) in self.fdb.delete_mac(flow_mac):
+                field = "dl_src" if src == flow_mac else "dl_dst"
+                matches.add((dpid, field, flow_mac))
+
+        for (dpid, field, flow_mac) in sorted(matches):
+            if dpid in self.dps:
+                self._delete_flows(self.dps[dpid],
+                                   **{field: haddr_to_bin(flow_mac)})
+        self.logger.info("Deleted flows of host %s from %d switches", mac,
+                         len(set(dpid for (dpid, _, _) in matches)))
+
+    @set_ev_cls(EventTopologyChanged)
+    def _event_topology_changed_handler(self, ev):
+        diff = ev.diff
+        # Switch ports that no longer lead where the flows expect
+        removed_ports = set((src_dpid, src_port) for (src_dpid, src_port, _, _)
+                            in diff.removed_links)
+
+        # Flows output to a removed link or installed at a removed switch
+        # are deleted from their whole route or tree, so that the next
+        # packet of the pair is routed again on the new topology
+        pairs = set()
+        for (dpid, port) in removed_ports:
+            pairs.update(self.fdb.flows_at(dpid, port))
+        for dpid in diff.removed_switches:
+            pairs.update(self.fdb.flows_at(dpid))
+        self._delete_routes(pairs)
+
+        # Hosts gone from the topology, and not just moved, do not receive
+        # MPI flows anymore
+        moved_hosts = set(mac for (mac, _, _) in diff.added_hosts)
+        for (mac, _, _) in diff.removed_hosts:
+            if mac not in moved_hosts:
+                self._forget_host(mac)
+
+        if pairs:
+            self.logger.info("Deleted %d routes crossing %d removed links "
+                             "and %d removed switches at version %d",
+                             len(pairs), len(diff.removed_links),
+                             len(diff.removed_switches), ev.version)
+
+    def _delete_routes(self, pairs):
+        """Delete the flows of (src, dst) pairs from all switches, along
+        with their trees"""
+        for (src, dst) in sorted(pairs):
+            self.trees.pop((src, dst), None)
+            self.tree_ranks.pop((src, dst), None)
+            for dpid in self.fdb.delete_pair(src, dst):
+                datapath = self.dps.get(dpid)
+                if datapath is not None:
+                    self._delete_flows(datapath, dl_src=haddr_to_bin(src),
+                                       dl_dst=haddr_to_bin(dst))
+        self._forget_virtual_dsts(dst for (src, dst) in pairs)
+
+    def _delete_trees(self, predicate):
+        """Delete the trees for which predicate(src, tree) is true"""
+        self._delete_routes([key for key, tree in self.trees.items()
+                             if predicate(key[0], tree)])
+
+    def _delete_job_trees(self, job_ids, ranks):
+        """Delete the trees of the jobs in job_ids, and those reaching any
+        of ranks; they are rebuilt for the new set of ranks on the next
+        packet-in"""
+        self._delete_routes([
+            key for key, (job_id, tree_ranks) in self.tree_ranks.items()
+            if job_id in job_ids or not tree_ranks.isdisjoint(ranks)])
+
+    @set_ev_cls(EventProcessAdd)
+    def _event_process_add_handler(self, ev):
+        job_id = self.rankdb.get_job(ev.rank) if self.rankdb else None
+        self._delete_job_trees(set([job_id]), set([ev.rank]))
+
+    @set_ev_cls(EventProcessDelete)
+    def _event_process_delete_handler(self, ev):
+        self._delete_job_trees(set(), set([ev.rank]))
+
+    @set_ev_cls(EventProcessBatchAdd)
+    def _event_process_batch_add_handler(self, ev):
+        self._delete_job_trees(set([ev.job_id]),
+                               set(rank for (rank, _) in ev.processes))
+
+    @set_ev_cls(EventProcessBatchDelete)
+    def _event_process_batch_delete_handler(self, ev):
+        self._delete_job_trees(set([ev.job_id]), set(ev.ranks))
+
+    def _branch_actions(self, datapath, branches):
+        parser = datapath.ofproto_parser
+        actions = []
+        for (port_no, dst_mac) in branches:
+            if dst_mac is not None:
+                actions.append(parser.OFPActionSetDlDst(haddr_to_bin(dst_mac)))
+            actions.append(parser.OFPActionOutput(port_no))
+        return actions
+
+    def _multicast_packet_in_handler(self, msg, src, dst, src_rank):
+        job_id = self.rankdb.get_job(src_rank)
+        if job_id is None:
+            return
+        ranks = self.rankdb.job_ranks(job_id)
+        dst_macs = [self.rankdb.get_mac(rank) for rank in ranks
+                    if rank != src_rank]
 
-            # Update FDB and notify to observers
-            self.fdb.update(dpid, src, dst, out_port)
-            self.send_event_to_observers(
-                EventFDBUpdate(dpid, src, dst, out_port)
-            )
+        tree = self.send_request(FindMulticastTreeRequest(src, dst_macs)).tree
+        if not tree or not tree.receivers:
+            return
 
-            # If a datapath having dpid is connected to controller
-            if dpid in self.dps:
-                datapath = self.dps[dpid]
-                if true_dst and idx == len(fdb) - 1:
-                    actions = [datapath.ofproto_parser.OFPActionSetDlDst(
-                        haddr_to_bin(true_dst)
-                    )]
-                    self._add_flow(datapath, src, dst, out_port, actions)
-                else:
-                    self._add_flow(datapath, src, dst, out_port)
-
-    def _send_packet_out(self, fdb, datapath, data, buffer_id):
+        # A packet-in from a switch outside of the previous tree of the pair
+        # replaces it, as flows already in the FDB are not installed again
+        if (src, dst) in self.trees:
+            self._delete_routes([(src, dst)])
+
+        # OpenFlow 1.0 has no groups: each switch of the tree gets a single
+        # flow whose actions output one copy per branch
+        for dpid in sorted(tree.ports):
+            branches = tree.actions(dpid)
+            self._install_flow(dpid, src, dst, branches[0][0],
+                               branches=branches)
+        self.trees[(src, dst)] = tree
+        self.tree_ranks[(src, dst)] = (job_id, frozenset(ranks))
+        self.multicast_stats["trees"] += 1
+        self.multicast_stats["links"] += tree.links
+        self.multicast_stats["unicast_links"] += tree.unicast_links
+        self.logger.info("Multicast tree from %s to %d hosts over %d links",
+                         src, len(tree.receivers), tree.links)
+
+        self._send_tree_packet_out(tree, msg.datapath, msg.data, msg.buffer_id)
+        self._finish_route_setup(src, dst)
+
+    def _send_tree_packet_out(self, tree, datapath, data, buffer_id):
+        ofproto = datapath.ofproto
+
+        # If the packet is buffered, do not re-send packet with packet-out
+        if buffer_id != ofproto.OFP_NO_BUFFER:
+            data = None
+
+        if datapath.id in tree.ports:
+            out = datapath.ofproto_parser.OFPPacketOut(
+                datapath=datapath, in_port=ofproto.OFPP_NONE,
+                actions=self._branch_actions(datapath,
+                                             tree.actions(datapath.id)),
+                buffer_id=buffer_id, data=data)
+            datapath.send_msg(out)
+
+    def _send_packet_out(self, fdb, datapath, data, buffer_id,
+                         true_dst=None):
         ofproto = datapath.ofproto
         ofproto_parser = datapath.ofproto_parser
 
@@ -111,10 +545,14 @@ class Router(app_manager.RyuApp):
         if buffer_id != ofproto.OFP_NO_BUFFER:
             data = None
 
-        for (dpid, out_port) in fdb:
+        for (idx, (dpid, out_port)) in enumerate(fdb):
             # If dpid is the datapath that caused packet-in
             if datapath.id == dpid:
                 actions = [ofproto_parser.OFPActionOutput(out_port)]
+                # Like its flow, the last hop rewrites the destination
+                if true_dst and idx == len(fdb) - 1:
+                    actions.insert(0, ofproto_parser.OFPActionSetDlDst(
+                        haddr_to_bin(true_dst)))
                 out = ofproto_parser.OFPPacketOut(
                     datapath=datapath, in_port=ofproto.OFPP_NONE,
                     actions=actions, buffer_id=buffer_id,
@@ -141,6 +579,70 @@ class Router(app_manager.RyuApp):
         # ignore IPv6 multicast packets
         if dst.startswith("33:33"):
             return
+
+        self.counters["received"] += 1
+        self._expire_pending_routes()
+        if not self._admit_packet_in(datapath.id, src):
+            return
+
+        # A flow has already been installed but the packet raced with it.
+        # The identities are read from the frame, so that this lookup does
+        # not hash MAC strings.
+        dst_id, src_id = frame_ids(msg.data)
+        out_port = self.fdb.get_by_id(datapath.id, src_id, dst_id)
+        if out_port is not None:
+            self.counters["fdb_hit"] += 1
+            # The flow table forwards the packet, so that it is rewritten
+            # like the packets matching the flow
+            self._send_table_packet_out(datapath, msg.in_port, msg.data,
+                                        msg.buffer_id)
+            return
+
+        # Another packet-in for this pair is already being handled: keep
+        # the packet until the route is set up, or drop it if the buffers
+        # are full
+        if not self.pending_routes.add((src, dst)):
+            if self._buffer_packet(msg, src, dst):
+                self.counters["buffered"] += 1
+            else:
+                self.counters["deduplicated"] += 1
+            return
+        self.counters["route_setup"] += 1
+
+        if self.route_setup_slots is None:
+            self._route_packet_in(ev, src, dst)
+            return
+
+        # Lookups of TopologyManager and ProcessManager block the calling
+        # greenthread until they are replied to, so each route setup runs
+        # in its own greenthread and the event loop goes on with the next
+        # packet-in. Once all slots are taken, the event loop waits here.
+        self.route_setup_slots.acquire()
+        self.route_setups_in_flight += 1
+        self.counters["max_in_flight"] = max(self.counters["max_in_flight"],
+                                             self.route_setups_in_flight)
+        hub.spawn(self._route_packet_in_async, ev, src, dst)
+
+    def _route_packet_in_async(self, ev, src, dst):
+        try:
+            self._route_packet_in(ev, src, dst)
+        finally:
+            self.route_setups_in_flight -= 1
+            self.route_setup_slots.release()
+
+    def _route_packet_in(self, ev, src, dst):
+        try:
+            self._setup_route(ev, src, dst)
+        finally:
+            # Packets buffered for a setup that failed are dropped, as the
+            # pair stays pending until it expires
+            self.counters["discarded"] += self.packet_buffers.discard(
+                (src, dst))
+
+    def _setup_route(self, ev, src, dst):
+        msg = ev.msg
+        datapath = msg.datapath
+
         # Handle MPI packets
         if self._is_sdn_mpi_addr(dst):
             return self._mpi_packet_in_handler(ev)
@@ -155,10 +657,60 @@ class Router(app_manager.RyuApp):
             self._add_flows_for_path(fdb, src, dst)
             # Output packet from current switch
             self._send_packet_out(fdb, datapath, msg.data, msg.buffer_id)
+            self._finish_route_setup(src, dst)
         else:
+            # The pair stays pending until it expires, so that repeated
+            # packets to an unknown host do not trigger a broadcast storm
             req = BroadcastRequest(msg.data, datapath.id, msg.in_port)
             self.send_request(req)
 
+    def _buffer_packet(self, msg, src, dst):
+        data = None
+        if msg.buffer_id == msg.datapath.ofproto.OFP_NO_BUFFER:
+            data = msg.data
+        return self.packet_buffers.add((src, dst), msg.datapath.id,
+                                       msg.in_port, msg.buffer_id, data)
+
+    def _expire_pending_routes(self):
+        for key in self.pending_routes.expire():
+            self.counters["discarded"] += self.packet_buffers.discard(key)
+
+    def _finish_route_setup(self, src, dst):
+        self.pending_routes.remove((src, dst))
+        self.counters["released"] += self.packet_buffers.release(
+            (src, dst), self._send_buffered_packet)
+
+    def _send_buffered_packet(self, dpid, in_port, buffer_id, data):
+        datapath = self.dps.get(dpid)
+        if datapath is None:
+            return
+        # The flows of the route are installed: let the flow table of the
+        # switch forward the packet, rewriting its destination if needed
+        self._send_table_packet_out(datapath, in_port, data, buffer_id)
+
+    def _send_table_packet_out(self, datapath, in_port, data, buffer_id):
+        ofproto = datapath.ofproto
+        ofproto_parser = datapath.ofproto_parser
+
+        # If the packet is buffered, do not re-send packet with packet-out
+        if buffer_id != ofproto.OFP_NO_BUFFER:
+            data = None
+
+        actions = [ofproto_parser.OFPActionOutput(ofproto.OFPP_TABLE)]
+        out = ofproto_parser.OFPPacketOut(
+            datapath=datapath, in_port=in_port, actions=actions,
+            buffer_id=buffer_id, data=data)
+        datapath.send_msg(out)
+
+    def _admit_packet_in(self, dpid, src):
+        if not self.dpid_limiter.admit(dpid):
+            self.counters["dropped_dpid"] += 1
+            return False
+        if not self.src_limiter.admit(src):
+            self.counters["dropped_src"] += 1
+            return False
+        return True
+
     def _is_sdn_mpi_addr(self, mac):
         mac_bin = haddr_to_bin(mac)
         return ord(mac_bin[0]) & 0x02
@@ -181,15 +733,38 @@ class Router(app_manager.RyuApp):
                          src_rank, dst_rank)
         self.logger.info("Collective type is: %s", coll_type)
 
+        if self.rankdb is None:
+            self.rankdb = self.send_request(
+                CurrentProcessAllocationRequest()).processes
+
+        # Broadcast-style collectives are replicated along a tree
+        if is_multicast(coll_type, dst_rank):
+            return self._multicast_packet_in_handler(msg, src, dst, src_rank)
+
         # True MAC address of dst, resolved using ProcessManager
-        true_dst = self.send_request(RankResolutionRequest(dst_rank)).mac
+        true_dst = self.rankdb.get_mac(dst_rank)
         if not true_dst:
             return
 
-        fdb = self.send_request(FindRouteRequest(src, true_dst)).fdb
+        if self.path_policy:
+            req = FindAllRoutesRequest(src, true_dst)
+            fdbs = self.send_request(req).fdbs
+            fdb = self.path_policy.select(fdbs, src_rank, dst_rank) \
+                if fdbs else []
+        else:
+            fdb = self.send_request(FindRouteRequest(src, true_dst)).fdb
 
         if fdb:
             # Install rules to all datapaths in path
             self._add_flows_for_path(fdb, src, dst, true_dst)
             # Output packet from current switch
-            self._send_packet_out(fdb, datapath, msg.data, msg.buffer_id)
+            self._send_packet_out(fdb, datapath, msg.data, msg.buffer_id,
+                                  true_dst)
+            self._finish_route_setup(src, dst)
+        else:
+            # The host of the rank is not in the topology, e.g. it was
+            # deleted after staying idle: flood the packet addressed to the
+            # host, which is discovered again once it answers
+            data = haddr_to_bin(true_dst) + bytes(msg.data[6:])
+            self.send_request(BroadcastRequest(data, datapath.id,
+                                               msg.in_port))
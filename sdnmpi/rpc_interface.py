@@ -2,7 +2,7 @@ from socket import error as SocketError
 from ryu.topology.switches import Switches
 from ryu.topology.event import (EventSwitchEnter, EventSwitchLeave,
                                 EventHostAdd, EventLinkAdd, EventLinkDelete)
-from ryu.base.app_manager import RyuApp
+from ryu.base.app_manager import RyuApp, lookup_service_brick
 from ryu.lib.hub import spawn
 from ryu.app.wsgi import (ControllerBase, WSGIApplication, websocket,
                           WebSocketRPCClient)
@@ -10,9 +10,12 @@ from ryu.contrib.tinyrpc.exc import InvalidReplyError
 from ryu.controller.handler import set_ev_cls
 
 from process import (CurrentProcessAllocationRequest, EventProcessAdd,
-                     EventProcessDelete, ProcessManager)
-from topology import CurrentTopologyRequest, TopologyManager
-from router import CurrentFDBRequest, EventFDBUpdate, Router
+                     EventProcessDelete, EventProcessBatchAdd,
+                     EventProcessBatchDelete, ProcessManager)
+from topology import CurrentTopologyRequest, EventHostDelete, TopologyManager
+from router import (CurrentFDBRequest, PacketInStatsRequest, EventFDBUpdate,
+                    EventPacketInStats, Router)
+from monitor import CurrentTrafficMatrixRequest, EventTrafficMatrixUpdate
 
 
 class RPCInterface(RyuApp):
@@ -27,6 +30,9 @@ class RPCInterface(RyuApp):
     def __init__(self, *args, **kwargs):
         super(RPCInterface, self).__init__(*args, **kwargs)
         self.rpc_clients = []
+        # Serialized views of switches, links and hosts are cached by the
+        # TopologyDB and shared by all clients and events
+        self.topologydb = kwargs["topology_manager"].topologydb
 
         wsgi = kwargs["wsgi"]
         wsgi.register(WebSocketSDNMPIController, {"app": self})
@@ -38,6 +44,14 @@ class RPCInterface(RyuApp):
         self._rpc_call(rpc_client, "init_rankdb", rankdb.to_dict())
         topologydb = self.send_request(CurrentTopologyRequest()).topology
         self._rpc_call(rpc_client, "init_topologydb", topologydb.to_dict())
+        counters = self.send_request(PacketInStatsRequest()).counters
+        self._rpc_call(rpc_client, "init_packet_in_stats", counters)
+        # Monitor is optional
+        if lookup_service_brick("Monitor") is not None:
+            traffic_matrix = self.send_request(
+                CurrentTrafficMatrixRequest()).traffic_matrix
+            self._rpc_call(rpc_client, "init_traffic_matrix",
+                           traffic_matrix.to_rows())
 
     @set_ev_cls(EventProcessAdd)
     def _event_process_add_handler(self, ev):
@@ -47,29 +61,66 @@ class RPCInterface(RyuApp):
     def _event_process_delete_handler(self, ev):
         self._rpc_broadcall("delete_process", ev.rank)
 
+    @set_ev_cls(EventProcessBatchAdd)
+    def _event_process_batch_add_handler(self, ev):
+        self._rpc_broadcall("add_processes", ev.job_id, dict(ev.processes))
+
+    @set_ev_cls(EventProcessBatchDelete)
+    def _event_process_batch_delete_handler(self, ev):
+        self._rpc_broadcall("delete_processes", ev.job_id, ev.ranks)
+
     @set_ev_cls(EventFDBUpdate)
     def _event_fdb_update_handler(self, ev):
         self._rpc_broadcall("update_fdb", ev.dpid, ev.src, ev.dst, ev.port)
+        if ev.branches:
+            self._rpc_broadcall("update_fdb_branches", ev.dpid, ev.src,
+                                ev.dst, ev.branches)
+
+    @set_ev_cls(EventPacketInStats)
+    def _event_packet_in_stats_handler(self, ev):
+        self._rpc_broadcall("update_packet_in_stats", ev.counters)
+
+    @set_ev_cls(EventTrafficMatrixUpdate)
+    def _event_traffic_matrix_update_handler(self, ev):
+        self._rpc_broadcall("update_traffic_matrix", ev.rows,
+                            [list(key) for key in ev.deleted])
 
+    # Topology entities are only serialized if a client is connected
     @set_ev_cls(EventSwitchEnter)
     def _event_switch_enter_handler(self, ev):
-        self._rpc_broadcall("add_switch", ev.switch.to_dict())
+        if self.rpc_clients:
+            switch = self.topologydb.switch_dict(ev.switch)
+            self._rpc_broadcall("add_switch", switch)
 
     @set_ev_cls(EventSwitchLeave)
     def _event_switch_leave_handler(self, ev):
-        self._rpc_broadcall("delete_switch", ev.switch.to_dict())
+        if self.rpc_clients:
+            switch = self.topologydb.switch_dict(ev.switch)
+            self._rpc_broadcall("delete_switch", switch)
 
     @set_ev_cls(EventLinkAdd)
     def _event_link_add_handler(self, ev):
-        self._rpc_broadcall("add_link", ev.link.to_dict())
+        if self.rpc_clients:
+            link = self.topologydb.link_dict(ev.link)
+            self._rpc_broadcall("add_link", link)
 
     @set_ev_cls(EventLinkDelete)
     def _event_link_delete_handler(self, ev):
-        self._rpc_broadcall("delete_link", ev.link.to_dict())
+        if self.rpc_clients:
+            link = self.topologydb.link_dict(ev.link)
+            self._rpc_broadcall("delete_link", link)
 
     @set_ev_cls(EventHostAdd)
     def _event_host_add_handler(self, ev):
-        self._rpc_broadcall("add_host", ev.host.to_dict())
+        if self.rpc_clients:
+            host = self.topologydb.host_dict(ev.host)
+            self._rpc_broadcall("add_host", host)
+
+    @set_ev_cls(EventHostDelete)
+    def _event_host_delete_handler(self, ev):
+        if self.rpc_clients:
+            host = self.topologydb.host_dict(ev.host)
+            self._rpc_broadcall("delete_host", host)
 
     def _rpc_call(self, rpc_client, func_name, *args):
         """Perform a RPC on rpc_client"""
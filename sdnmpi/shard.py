@@ -0,0 +1,144 @@
+from ryu import cfg
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.ofproto import ofproto_v1_0
+from ryu.lib import hub
+from ryu.topology.switches import LLDPPacket, Switches
+
+from util.shard import (ShardMap, ShardReplicator, RemoteLinks,
+                        parse_assignments, LOG_BACKENDS)
+from process import (CurrentProcessAllocationRequest, EventProcessAdd,
+                     EventProcessDelete, EventProcessBatchAdd,
+                     EventProcessBatchDelete, ProcessManager)
+from router import EventFDBUpdate, EventFlowInstall, Router
+from topology import CurrentTopologyRequest, EventHostDelete, TopologyManager
+
+LLDP_ETHERTYPE = b"\x88\xcc"
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt("shard_id", default=0,
+               help="ID of this controller shard"),
+    cfg.IntOpt("num_shards", default=1,
+               help="number of controller shards"),
+    cfg.ListOpt("shard_assignments", default=[],
+                help="explicit switch assignments as hex_dpid:shard_id"),
+    cfg.StrOpt("shard_log_backend", default="local",
+               help="backend of the replicated log shared by the shards "
+                    "(local or file)"),
+    cfg.StrOpt("shard_log_name", default="sdnmpi",
+               help="name of the replicated log shared by the shards, "
+                    "which is a file path for the file backend"),
+    cfg.FloatOpt("shard_poll_interval", default=0.05,
+                 help="interval between replicated log polls in seconds"),
+])
+
+
+class ShardManager(app_manager.RyuApp):
+    """Shares controller state between shards owning disjoint switch sets
+
+    Changes to the local TopologyDB and RankAllocationDB are appended to a
+    replicated log, and changes made by other shards are applied from it,
+    so that every shard can compute routes across the whole network. Flows
+    of a route that traverse switches of other shards are published to the
+    log and installed by the owning shard, and hosts lost by a shard have
+    their flows deleted by every shard."""
+    _CONTEXTS = {
+        "process_manager": ProcessManager,
+        "router": Router,
+        "topology_manager": TopologyManager,
+    }
+    OFP_VERSIONS = [ofproto_v1_0.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(ShardManager, self).__init__(*args, **kwargs)
+        self.shard_map = ShardMap(CONF.shard_id, CONF.num_shards,
+                                  parse_assignments(CONF.shard_assignments))
+        self.log = LOG_BACKENDS[CONF.shard_log_backend].open(
+            CONF.shard_log_name)
+        self.topologydb = None
+        # Links from switches of other shards, set with the databases
+        self.remote_links = None
+        # The databases are set once they are fetched by the log thread
+        self.replicator = ShardReplicator(self.shard_map, self.log, None,
+                                          None, self._install_flow,
+                                          self._delete_host)
+        self.log_thread = hub.spawn(self._log_loop)
+
+    def _log_loop(self):
+        self.topologydb = self.send_request(CurrentTopologyRequest()).topology
+        self.remote_links = RemoteLinks(self.topologydb,
+                                        Switches.LINK_TIMEOUT)
+        self.replicator.topologydb = self.topologydb
+        self.replicator.rankdb = self.send_request(
+            CurrentProcessAllocationRequest()).processes
+
+        while True:
+            self.replicator.publish_topology_changes()
+            self.replicator.apply_entries()
+            # Links from other shards expire like those between the
+            # switches of this shard, and their deletion is published on
+            # the next iteration
+            expired = self.remote_links.expire()
+            if expired:
+                self.logger.info("Deleted %d links from other shards",
+                                 expired)
+            hub.sleep(CONF.shard_poll_interval)
+
+    def _install_flow(self, dpid, src, dst, port, true_dst, branches):
+        self.send_event("Router", EventFlowInstall(dpid, src, dst, port,
+                                                   true_dst, branches))
+
+    def _delete_host(self, host, reason):
+        # The host was lost by another shard: only the flows on the
+        # switches of this shard are left to be deleted
+        self.send_event("Router", EventHostDelete(host, reason))
+
+    def _publish(self, kind, *payload):
+        self.replicator.publish(kind, *payload)
+
+    @set_ev_cls(EventProcessAdd)
+    def _event_process_add_handler(self, ev):
+        self._publish("process_add", ev.rank, ev.mac)
+
+    @set_ev_cls(EventProcessDelete)
+    def _event_process_delete_handler(self, ev):
+        self._publish("process_delete", ev.rank)
+
+    @set_ev_cls(EventProcessBatchAdd)
+    def _event_process_batch_add_handler(self, ev):
+        self._publish("process_batch_add", ev.job_id, ev.processes)
+
+    @set_ev_cls(EventProcessBatchDelete)
+    def _event_process_batch_delete_handler(self, ev):
+        self._publish("process_batch_delete", ev.job_id, ev.ranks)
+
+    @set_ev_cls(EventFDBUpdate)
+    def _event_fdb_update_handler(self, ev):
+        self.replicator.publish_flow(ev.dpid, ev.src, ev.dst, ev.port,
+                                     ev.true_dst, ev.branches)
+
+    @set_ev_cls(EventHostDelete)
+    def _event_host_delete_handler(self, ev):
+        self.replicator.publish_host_delete(ev.host, ev.reason)
+
+    @set_ev_cls(ofp_event.EventOFPPacketIn, MAIN_DISPATCHER)
+    def _packet_in_handler(self, ev):
+        """Discover links from switches of other shards
+
+        ryu.topology.switches ignores LLDP packets sent by switches which
+        are not connected to this controller."""
+        msg = ev.msg
+        if msg.data[12:14] != LLDP_ETHERTYPE:
+            return
+        try:
+            src_dpid, src_port_no = LLDPPacket.lldp_parse(msg.data)
+        except LLDPPacket.LLDPUnknownFormat:
+            return
+
+        if self.remote_links is None or self.shard_map.owns(src_dpid):
+            return
+
+        self.remote_links.seen(src_dpid, src_port_no, msg.datapath.id,
+                               msg.in_port)
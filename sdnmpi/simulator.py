@@ -0,0 +1,351 @@
+"""Offline simulation of the controller against fake datapaths
+
+The controller apps run in-process and their event handlers are called
+directly, without a network or event queues; switches are FakeDatapath
+objects that record the OpenFlow messages sent to them. OpenFlow and
+topology events are injected from a trace, which is a file of JSON
+objects, one per line:
+
+    {"type": "switch_enter", "dpid": 1, "ports": [1, 2, 3]}
+    {"type": "switch_leave", "dpid": 1}
+    {"type": "link_add", "src": [1, 2], "dst": [2, 2]}
+    {"type": "link_delete", "src": [1, 2], "dst": [2, 2]}
+    {"type": "host_add", "mac": "04:00:00:00:00:01", "port": [1, 1]}
+    {"type": "packet_in", "dpid": 1, "in_port": 1,
+     "src": "04:00:00:00:00:01", "dst": "04:00:00:00:00:02"}
+    {"type": "announcement", "dpid": 1, "in_port": 1,
+     "src": "04:00:00:00:00:01", "rank": 0, "launch": true}
+    {"type": "batch_announcement", "dpid": 1, "in_port": 1,
+     "src": "04:00:00:00:00:01", "job_id": 1,
+     "processes": [[0, "04:00:00:00:00:01"]], "launch": true}
+    {"type": "port_status", "dpid": 1, "port": 1, "reason": "down"}
+    {"type": "port_stats", "dpid": 1,
+     "stats": [[port_no, rx_packets, rx_bytes, tx_packets, tx_bytes]]}
+
+Usage:
+    ./run_simulator.sh TRACE [--report FILE] [--no-monitor]
+                             [--config-file FILE]"""
+import argparse
+import json
+import struct
+import sys
+import time
+from collections import defaultdict
+
+from ryu import cfg
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, DEAD_DISPATCHER
+from ryu.lib import addrconv, hub
+from ryu.lib.mac import BROADCAST_STR
+from ryu.lib.packet import packet, ethernet, ipv4, udp
+from ryu.lib.packet.ether_types import ETH_TYPE_IP
+from ryu.lib.packet.in_proto import IPPROTO_UDP
+from ryu.ofproto import ofproto_v1_0
+from ryu.topology import event
+
+from util.fakes import FakeDatapath, FakeSwitch
+from util.records import PortRecord, LinkRecord, HostRecord
+from topology import TopologyManager
+from router import Router
+from process import ProcessManager
+from monitor import Monitor
+
+
+def build_frame(src, dst, payload=b"", dst_port=5000):
+    pkt = packet.Packet()
+    pkt.add_protocol(ethernet.ethernet(dst, src, ETH_TYPE_IP))
+    pkt.add_protocol(ipv4.ipv4(proto=IPPROTO_UDP))
+    pkt.add_protocol(udp.udp(src_port=dst_port, dst_port=dst_port))
+    pkt.add_protocol(payload)
+    pkt.serialize()
+    return bytes(pkt.data)
+
+
+def build_announcement(src, rank, launch=True):
+    payload = struct.pack("<ii", 0 if launch else 1, rank)
+    return build_frame(src, BROADCAST_STR, payload, 61000)
+
+
+def build_batch_announcement(src, job_id, processes, launch=True):
+    """processes is a list of (rank, mac), at most MAX_BATCH_ENTRIES"""
+    payload = struct.pack("<iII", 2 if launch else 3, job_id, len(processes))
+    for rank, mac in processes:
+        payload += struct.pack("<i", rank) + addrconv.mac.text_to_bin(mac)
+    return build_frame(src, BROADCAST_STR, payload, 61000)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+    return values[idx]
+
+
+# OpenFlow message type -> name of the OFPT_* constant
+MSG_TYPE_NAMES = dict((value, name) for (name, value)
+                      in vars(ofproto_v1_0).items()
+                      if name.startswith("OFPT_"))
+
+
+def msg_type(buf):
+    """Returns the type of a serialized OpenFlow message"""
+    return struct.unpack_from("!BB", buf)[1]
+
+
+class Simulator(object):
+    """Controller apps wired together and driven by injected events"""
+    APPS = [TopologyManager, Router, ProcessManager, Monitor]
+
+    def __init__(self, apps=None, admission=True):
+        super(Simulator, self).__init__()
+        self.apps = [app_cls() for app_cls in (apps or self.APPS)]
+        for app in self.apps:
+            app_manager.register_app(app)
+        for app in self.apps:
+            app.start()
+
+        self.router = self.app("Router")
+        if self.router and not admission:
+            self.router._admit_packet_in = lambda dpid, src: True
+
+        # DPID -> FakeDatapath (or any object with send_msg)
+        self.datapaths = {}
+        # DPID -> FakeSwitch
+        self.switches = {}
+        # Event type -> number of injected events
+        self.event_counts = defaultdict(int)
+        # Duration of the handling of each packet-in
+        self.packet_in_latencies = []
+
+    def app(self, name):
+        for app in self.apps:
+            if app.name == name:
+                return app
+        return None
+
+    def close(self):
+        for app in self.apps:
+            app_manager.unregister_app(app)
+
+    def dispatch(self, ev, state=MAIN_DISPATCHER):
+        """Deliver an event to the handlers of all apps"""
+        for app in self.apps:
+            for handler in app.get_handlers(ev, state):
+                handler(ev)
+
+    def attach_datapath(self, datapath):
+        """Connect a datapath to the controller"""
+        self.datapaths[datapath.id] = datapath
+        ev = ofp_event.EventOFPStateChange(datapath)
+        ev.state = MAIN_DISPATCHER
+        self.dispatch(ev, MAIN_DISPATCHER)
+
+    def detach_datapath(self, dpid):
+        datapath = self.datapaths.pop(dpid)
+        ev = ofp_event.EventOFPStateChange(datapath)
+        ev.state = DEAD_DISPATCHER
+        self.dispatch(ev, DEAD_DISPATCHER)
+
+    def switch_enter(self, dpid, port_nos):
+        datapath = FakeDatapath(dpid)
+        ports = [PortRecord(dpid, port_no) for port_no in port_nos]
+        switch = FakeSwitch(datapath, ports)
+        self.switches[dpid] = switch
+        self.attach_datapath(datapath)
+        self.dispatch(event.EventSwitchEnter(switch))
+
+    def switch_leave(self, dpid):
+        switch = self.switches.pop(dpid)
+        self.dispatch(event.EventSwitchLeave(switch))
+        self.detach_datapath(dpid)
+
+    def link_add(self, src, dst):
+        link = LinkRecord(PortRecord(*src), PortRecord(*dst))
+        self.dispatch(event.EventLinkAdd(link))
+
+    def link_delete(self, src, dst):
+        link = LinkRecord(PortRecord(*src), PortRecord(*dst))
+        self.dispatch(event.EventLinkDelete(link))
+
+    def host_add(self, mac, port):
+        self.dispatch(event.EventHostAdd(HostRecord(mac, PortRecord(*port))))
+
+    def packet_in(self, dpid, in_port, data):
+        datapath = self.datapaths[dpid]
+        msg = datapath.ofproto_parser.OFPPacketIn(
+            datapath, buffer_id=ofproto_v1_0.OFP_NO_BUFFER,
+            total_len=len(data), in_port=in_port,
+            reason=ofproto_v1_0.OFPR_NO_MATCH, data=data)
+        start = time.time()
+        self.dispatch(ofp_event.EventOFPPacketIn(msg))
+        self.packet_in_latencies.append(time.time() - start)
+
+    def port_status(self, dpid, port_no, reason):
+        """reason is "down" if the link of the port went down, or "delete"
+        if the port was removed"""
+        datapath = self.datapaths[dpid]
+        parser = datapath.ofproto_parser
+        state = ofproto_v1_0.OFPPS_LINK_DOWN if reason == "down" else 0
+        desc = parser.OFPPhyPort(
+            port_no=port_no, hw_addr="00:00:00:00:00:00", name="", config=0,
+            state=state, curr=0, advertised=0, supported=0, peer=0)
+        if reason == "delete":
+            ofp_reason = ofproto_v1_0.OFPPR_DELETE
+        else:
+            ofp_reason = ofproto_v1_0.OFPPR_MODIFY
+        msg = parser.OFPPortStatus(datapath, ofp_reason, desc)
+        self.dispatch(ofp_event.EventOFPPortStatus(msg))
+
+    def port_stats(self, dpid, stats):
+        datapath = self.datapaths[dpid]
+        parser = datapath.ofproto_parser
+        msg = parser.OFPPortStatsReply(datapath)
+        msg.flags = 0
+        msg.body = [parser.OFPPortStats(
+            port_no=port_no, rx_packets=rx_packets, tx_packets=tx_packets,
+            rx_bytes=rx_bytes, tx_bytes=tx_bytes, rx_dropped=0,
+            tx_dropped=0, rx_errors=0, tx_errors=0, rx_frame_err=0,
+            rx_over_err=0, rx_crc_err=0, collisions=0)
+            for (port_no, rx_packets, rx_bytes, tx_packets, tx_bytes)
+            in stats]
+        self.dispatch(ofp_event.EventOFPPortStatsReply(msg))
+
+    def inject(self, record):
+        """Inject an event given as a trace record"""
+        kind = record["type"]
+        self.event_counts[kind] += 1
+        if kind == "switch_enter":
+            self.switch_enter(record["dpid"], record["ports"])
+        elif kind == "switch_leave":
+            self.switch_leave(record["dpid"])
+        elif kind == "link_add":
+            self.link_add(record["src"], record["dst"])
+        elif kind == "link_delete":
+            self.link_delete(record["src"], record["dst"])
+        elif kind == "host_add":
+            self.host_add(record["mac"], record["port"])
+        elif kind == "packet_in":
+            self.packet_in(record["dpid"], record["in_port"],
+                           build_frame(record["src"], record["dst"]))
+        elif kind == "announcement":
+            self.packet_in(record["dpid"], record["in_port"],
+                           build_announcement(record["src"], record["rank"],
+                                              record.get("launch", True)))
+        elif kind == "batch_announcement":
+            self.packet_in(record["dpid"], record["in_port"],
+                           build_batch_announcement(
+                               record["src"], record["job_id"],
+                               record["processes"],
+                               record.get("launch", True)))
+        elif kind == "port_status":
+            self.port_status(record["dpid"], record["port"], record["reason"])
+        elif kind == "port_stats":
+            self.port_stats(record["dpid"], record["stats"])
+        else:
+            raise ValueError("Unknown trace record type: %s" % kind)
+
+    def sent_msgs(self):
+        for datapath in self.datapaths.values():
+            for msg in datapath.msgs:
+                yield msg
+
+    def clear_msgs(self):
+        for datapath in self.datapaths.values():
+            del datapath.msgs[:]
+
+    def replay(self, records):
+        """Inject all records and return a report"""
+        start = time.time()
+        for record in records:
+            self.inject(record)
+            # Let greenthreads of the apps run between events
+            hub.sleep(0)
+        return self.report(time.time() - start)
+
+    def report(self, elapsed):
+        msg_counts = defaultdict(int)
+        for msg in self.sent_msgs():
+            msg_counts[MSG_TYPE_NAMES[msg_type(msg)]] += 1
+
+        packet_ins = len(self.packet_in_latencies)
+        report = {
+            "elapsed": elapsed,
+            "events": dict(self.event_counts),
+            "packet_ins": packet_ins,
+            "packet_ins_per_sec": packet_ins / elapsed if elapsed else 0.0,
+            "packet_in_latency_p50": percentile(self.packet_in_latencies, 50),
+            "packet_in_latency_p99": percentile(self.packet_in_latencies, 99),
+            "msgs_sent": dict(msg_counts),
+        }
+        if self.router:
+            report["router_counters"] = dict(self.router.counters)
+            report["port_flows"] = self.port_flow_report()
+            report["multicast"] = self.multicast_report()
+        return report
+
+    def port_flow_report(self):
+        """Number of flows output to each switch port, to verify how flows
+        are spread over equal-cost routes"""
+        counts = self.router.fdb.port_flow_counts()
+        flows = sorted(counts.values())
+        return {
+            "ports": len(flows),
+            "max": flows[-1] if flows else 0,
+            "mean": float(sum(flows)) / len(flows) if flows else 0.0,
+            "per_port": [[dpid, port, count] for ((dpid, port), count)
+                         in sorted(counts.items(), key=lambda i: -i[1])],
+        }
+
+    def multicast_report(self):
+        """Links crossed by one packet of each broadcast-style collective,
+        with multicast trees and with one unicast flow per receiver"""
+        stats = dict(self.router.multicast_stats)
+        unicast_links = stats["unicast_links"]
+        stats["saved"] = 1.0 - float(stats["links"]) / unicast_links \
+            if unicast_links else 0.0
+        return stats
+
+
+def read_trace(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay a trace through the controller apps")
+    parser.add_argument("trace", help="trace file, or - for stdin")
+    parser.add_argument("--report", help="write the report to this file")
+    parser.add_argument("--no-monitor", action="store_true",
+                        help="do not run the Monitor app")
+    parser.add_argument("--no-admission", action="store_true",
+                        help="disable packet-in admission control")
+    args, conf_args = parser.parse_known_args(argv)
+
+    # Remaining arguments, e.g. --config-file, configure the apps
+    cfg.CONF(args=conf_args, project="ryu")
+
+    apps = Simulator.APPS
+    if args.no_monitor:
+        apps = [app_cls for app_cls in apps if app_cls is not Monitor]
+    simulator = Simulator(apps, admission=not args.no_admission)
+
+    try:
+        if args.trace == "-":
+            report = simulator.replay(read_trace(sys.stdin))
+        else:
+            with open(args.trace) as f:
+                report = simulator.replay(read_trace(f))
+    finally:
+        simulator.close()
+
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    else:
+        sys.stdout.write(output + "\n")
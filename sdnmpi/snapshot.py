@@ -0,0 +1,159 @@
+import os
+
+from ryu import cfg
+from ryu.base import app_manager
+from ryu.controller import ofp_event
+from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
+from ryu.ofproto import ofproto_v1_0
+from ryu.lib import hub
+from ryu.lib.mac import haddr_to_str
+
+from util.snapshot import write_snapshot, load_snapshot, SnapshotError
+from process import CurrentProcessAllocationRequest, ProcessManager
+from router import CurrentFDBRequest, Router
+from topology import CurrentTopologyRequest, TopologyManager
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.StrOpt("snapshot_file", default="log/sdnmpi.snapshot",
+               help="path to the state snapshot file"),
+    cfg.IntOpt("snapshot_interval", default=10,
+               help="interval between state snapshots in seconds"),
+    cfg.BoolOpt("warm_start", default=False,
+                help="restore state from the snapshot file on startup"),
+    cfg.IntOpt("warm_start_grace_period", default=30,
+               help="seconds restored links are kept without rediscovery"),
+])
+
+
+class SnapshotManager(app_manager.RyuApp):
+    """Periodically snapshots the controller databases to disk
+
+    In warm-start mode, the last snapshot is restored on startup. Restored
+    FDB entries are reconciled against the flow tables of the switches when
+    they reconnect, and restored links which are not rediscovered via LLDP
+    within the grace period are removed."""
+    _CONTEXTS = {
+        "process_manager": ProcessManager,
+        "router": Router,
+        "topology_manager": TopologyManager,
+    }
+    OFP_VERSIONS = [ofproto_v1_0.OFP_VERSION]
+
+    def __init__(self, *args, **kwargs):
+        super(SnapshotManager, self).__init__(*args, **kwargs)
+        self.snapshot_file = CONF.snapshot_file
+        # Router, whose SDN-MPI rewrites are saved with its FDB
+        self.router = kwargs.get("router")
+        self.topologydb = None
+        self.fdb = None
+        self.rankdb = None
+        # DPIDs whose restored FDB entries have not been reconciled yet
+        if self.router:
+            self.router.restore_trees()
+
+        self.unreconciled_dpids = set()
+        # DPID -> set of (src, dst) of flows reported by the switch so far
+        self.installed_flows = {}
+        self.snapshot_thread = hub.spawn(self._snapshot_loop)
+
+    def _fetch_databases(self):
+        self.topologydb = self.send_request(CurrentTopologyRequest()).topology
+        self.fdb = self.send_request(CurrentFDBRequest()).fdb
+        self.rankdb = self.send_request(
+            CurrentProcessAllocationRequest()).processes
+
+    def _snapshot_loop(self):
+        self._fetch_databases()
+
+        if CONF.warm_start:
+            self._warm_start()
+
+        while True:
+            hub.sleep(CONF.snapshot_interval)
+            self._take_snapshot()
+
+    def _take_snapshot(self):
+        try:
+            write_snapshot(self.snapshot_file, self.topologydb, self.fdb,
+                           self.rankdb, true_dsts=self.router.true_dsts
+                           if self.router else None)
+        except (IOError, OSError) as e:
+            self.logger.error("Failed to write snapshot: %s", e)
+
+    def _warm_start(self):
+        if not os.path.exists(self.snapshot_file):
+            self.logger.info("No snapshot found at %s", self.snapshot_file)
+            return
+
+        try:
+            timestamp = load_snapshot(
+                self.snapshot_file, self.topologydb, self.fdb, self.rankdb,
+                self.router.add_true_dst if self.router else None)
+        except (IOError, OSError, SnapshotError) as e:
+            self.logger.error("Failed to load snapshot: %s", e)
+            return
+
+        if self.router:
+            self.router.restore_trees()
+
+        self.unreconciled_dpids = set(
+            dpid for (dpid, _, _, _) in self.fdb.entries())
+        self.logger.info("Restored snapshot taken at %s", timestamp)
+
+        # Reconcile switches which connected before the snapshot was loaded
+        for switch in self.topologydb.switches.values():
+            self._request_flow_stats(switch.dp)
+
+        hub.spawn_after(CONF.warm_start_grace_period,
+                        self._expire_restored_links)
+
+    def _expire_restored_links(self):
+        expired = [link for dst_to_link in self.topologydb.links.values()
+                   for link in dst_to_link.values()
+                   if getattr(link, "restored", False)]
+        for link in expired:
+            self.topologydb.delete_link(link)
+        self.logger.info("Expired %d restored links", len(expired))
+
+    def _request_flow_stats(self, datapath):
+        if datapath.id not in self.unreconciled_dpids:
+            return
+
+        ofproto = datapath.ofproto
+        parser = datapath.ofproto_parser
+
+        req = parser.OFPFlowStatsRequest(datapath, 0, parser.OFPMatch(),
+                                         0xff, ofproto.OFPP_NONE)
+        datapath.send_msg(req)
+
+    @set_ev_cls(ofp_event.EventOFPStateChange, MAIN_DISPATCHER)
+    def _state_change_handler(self, ev):
+        self._request_flow_stats(ev.datapath)
+
+    @set_ev_cls(ofp_event.EventOFPFlowStatsReply, MAIN_DISPATCHER)
+    def _flow_stats_reply_handler(self, ev):
+        dpid = ev.msg.datapath.id
+        if dpid not in self.unreconciled_dpids:
+            return
+
+        installed = self.installed_flows.setdefault(dpid, set())
+        for stat in ev.msg.body:
+            installed.add((haddr_to_str(stat.match.dl_src),
+                           haddr_to_str(stat.match.dl_dst)))
+
+        # Flow stats replies may be split into multiple messages
+        if ev.msg.flags & ev.msg.datapath.ofproto.OFPSF_REPLY_MORE:
+            return
+
+        # Forget restored entries whose flows are not on the switch anymore,
+        # so that they are re-installed on the next packet-in
+        stale = [(src, dst) for (_, src, dst, _) in self.fdb.entries(dpid)
+                 if (src, dst) not in installed]
+        for (src, dst) in stale:
+            self.fdb.delete(dpid, src, dst)
+
+        del self.installed_flows[dpid]
+        self.unreconciled_dpids.discard(dpid)
+        self.logger.info("Reconciled FDB of %016x (%d stale entries)",
+                         dpid, len(stale))
@@ -1,12 +1,61 @@
+import time
+
+from ryu import cfg
 from ryu.base import app_manager
 from ryu.controller.handler import MAIN_DISPATCHER, set_ev_cls
-from ryu.controller.event import EventRequestBase, EventReplyBase
+from ryu.controller.event import EventBase, EventRequestBase, EventReplyBase
 from ryu.topology import event, switches
 from ryu.controller import ofp_event
 from ryu.lib.mac import haddr_to_bin, BROADCAST_STR, BROADCAST
-from ryu.lib.packet import packet, ethernet, udp
+from ryu.lib.packet import packet, ethernet
+from ryu.lib import hub
 
 from util.topology_db import TopologyDB
+from util.records import SwitchRecord
+from util.route_worker import RouteWorkerPool
+from util.topology_diff import TopologyDiffer
+from protocol import decoder
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.IntOpt("route_workers", default=0,
+               help="number of route computation worker processes "
+                    "(0 computes routes in the controller process)"),
+    cfg.IntOpt("host_idle_timeout", default=0,
+               help="seconds without traffic after which a host is "
+                    "considered lost (0 disables the timeout)"),
+    cfg.FloatOpt("topology_debounce", default=0.1,
+                 help="seconds without topology changes after which the "
+                      "changes are sent as a single EventTopologyChanged"),
+    cfg.FloatOpt("topology_debounce_max", default=1,
+                 help="seconds after the first pending topology change "
+                      "after which the changes are sent even if the "
+                      "topology keeps changing"),
+])
+
+
+class EventTopologyChanged(EventBase):
+    """Net changes of the topology since the previous EventTopologyChanged"""
+    def __init__(self, diff):
+        super(EventTopologyChanged, self).__init__()
+        self.version = diff.version
+        # sdnmpi.util.topology_diff.TopologyDiff
+        self.diff = diff
+
+
+class EventHostDelete(EventBase):
+    """A host was lost, after its port went down or it stayed idle"""
+    def __init__(self, host, reason):
+        super(EventHostDelete, self).__init__()
+        self.host = host
+        self.reason = reason
+
+
+class EventHostIdle(EventBase):
+    """Sent to TopologyManager when the last flow of a host expired"""
+    def __init__(self, mac):
+        super(EventHostIdle, self).__init__()
+        self.mac = mac
 
 
 class CurrentTopologyRequest(EventRequestBase):
@@ -34,6 +83,7 @@ class FindRouteReply(EventReplyBase):
         super(FindRouteReply, self).__init__(dst)
         self.fdb = fdb
 
+
 class FindAllRoutesRequest(EventRequestBase):
     def __init__(self, src_mac, dst_mac):
         super(FindAllRoutesRequest, self).__init__()
@@ -43,10 +93,25 @@ class FindAllRoutesRequest(EventRequestBase):
 
 
 class FindAllRoutesReply(EventReplyBase):
-    def __init__(self, dst, fdb):
+    def __init__(self, dst, fdbs):
         super(FindAllRoutesReply, self).__init__(dst)
         self.fdbs = fdbs
 
+
+class FindMulticastTreeRequest(EventRequestBase):
+    def __init__(self, src_mac, dst_macs):
+        super(FindMulticastTreeRequest, self).__init__()
+        self.dst = "TopologyManager"
+        self.src_mac = src_mac
+        self.dst_macs = dst_macs
+
+
+class FindMulticastTreeReply(EventReplyBase):
+    def __init__(self, dst, tree):
+        super(FindMulticastTreeReply, self).__init__(dst)
+        self.tree = tree
+
+
 class BroadcastRequest(EventRequestBase):
     def __init__(self, data, src_dpid, src_in_port):
         super(BroadcastRequest, self).__init__()
@@ -60,11 +125,56 @@ class TopologyManager(app_manager.RyuApp):
     _CONTEXTS = {
         "switches": switches.Switches,
     }
-    _EVENTS = [CurrentTopologyRequest, BroadcastRequest]
+    _EVENTS = [EventHostDelete, EventTopologyChanged, CurrentTopologyRequest,
+               BroadcastRequest]
 
     def __init__(self, *args, **kwargs):
         super(TopologyManager, self).__init__(*args, **kwargs)
+        self.switches = kwargs.get("switches")
         self.topologydb = TopologyDB()
+        self.route_workers = None
+        if CONF.route_workers > 0:
+            self.route_workers = RouteWorkerPool(
+                self.topologydb, CONF.route_workers, self.logger)
+        self.differ = TopologyDiffer(self.topologydb)
+        # Time after which the pending changes are sent, the time after
+        # which they are sent at the latest, and the thread waiting for
+        # them, or None if no change is pending
+        self.diff_deadline = None
+        self.diff_max_deadline = None
+        self.diff_thread = None
+        self.topologydb.change_listeners.append(self._topology_changed)
+
+    def _topology_changed(self, change):
+        """Postpone EventTopologyChanged until the topology has not changed
+        for topology_debounce seconds, or until topology_debounce_max
+        seconds after the first pending change if it keeps changing
+
+        Every change to TopologyDB is seen, including changes made by other
+        apps (e.g. replicated from other shards)."""
+        now = time.time()
+        if self.diff_thread is None:
+            self.diff_max_deadline = now + CONF.topology_debounce_max
+            self.diff_thread = hub.spawn(self._send_diff)
+        self.diff_deadline = min(now + CONF.topology_debounce,
+                                 self.diff_max_deadline)
+
+    def _send_diff(self):
+        """Send EventTopologyChanged with the net changes of the topology
+        once the deadline, pushed back by every change, has passed"""
+        delay = self.diff_deadline - time.time()
+        while delay > 0:
+            hub.sleep(delay)
+            delay = self.diff_deadline - time.time()
+        self.diff_thread = None
+
+        diff = self.differ.diff()
+        if not diff:
+            return
+        self.logger.info("Topology changed (version %d): %d links "
+                         "added, %d links removed", diff.version,
+                         len(diff.added_links), len(diff.removed_links))
+        self.send_event_to_observers(EventTopologyChanged(diff))
 
     def _add_flow(self, datapath, in_port, dst, actions):
         ofproto = datapath.ofproto
@@ -111,6 +221,11 @@ class TopologyManager(app_manager.RyuApp):
     def _packet_in_handler(self, ev):
         msg = ev.msg
         datapath = msg.datapath
+
+        # Do not handle announcement packets
+        if decoder.payload_offset(msg.data) is not None:
+            return
+
         pkt = packet.Packet(msg.data)
         eth = pkt.get_protocol(ethernet.ethernet)
         dst = eth.dst
@@ -123,11 +238,6 @@ class TopologyManager(app_manager.RyuApp):
         elif dst != BROADCAST_STR:
             return
 
-        # Do not handle announcement packets
-        udph = pkt.get_protocol(udp.udp)
-        if udph and udph.dst_port == 61000:
-            return
-
         self._do_broadcast(msg.data, datapath.id, msg.in_port)
 
     @set_ev_cls(CurrentTopologyRequest)
@@ -137,14 +247,38 @@ class TopologyManager(app_manager.RyuApp):
 
     @set_ev_cls(FindRouteRequest)
     def _find_route_request_handler(self, req):
+        if self.route_workers:
+            # Wait for the worker in a separate greenthread, so that the
+            # event loop of this app can serve other requests meanwhile
+            hub.spawn(self._serve_route_request, req, False)
+            return
         fdb = self.topologydb.find_route(req.src_mac, req.dst_mac)
         reply = FindRouteReply(req.src, fdb)
         self.reply_to_request(req, reply)
 
     @set_ev_cls(FindAllRoutesRequest)
     def _find_all_routes_request_handler(self, req):
+        if self.route_workers:
+            hub.spawn(self._serve_route_request, req, True)
+            return
         fdbs = self.topologydb.find_route(req.src_mac, req.dst_mac, True)
-        reply = FindAllRoutesRequest(req.src, fdbs)
+        reply = FindAllRoutesReply(req.src, fdbs)
+        self.reply_to_request(req, reply)
+
+    @set_ev_cls(FindMulticastTreeRequest)
+    def _find_multicast_tree_request_handler(self, req):
+        # Trees are computed in a single BFS, so not offloaded to workers
+        tree = self.topologydb.find_multicast_tree(req.src_mac, req.dst_macs)
+        reply = FindMulticastTreeReply(req.src, tree)
+        self.reply_to_request(req, reply)
+
+    def _serve_route_request(self, req, multiple):
+        result = self.route_workers.find_route(req.src_mac, req.dst_mac,
+                                               multiple)
+        if multiple:
+            reply = FindAllRoutesReply(req.src, result)
+        else:
+            reply = FindRouteReply(req.src, result)
         self.reply_to_request(req, reply)
 
     def _is_edge_port(self, port):
@@ -156,6 +290,11 @@ class TopologyManager(app_manager.RyuApp):
 
     def _do_broadcast(self, data, dpid, in_port):
         for switch in self.topologydb.switches.values():
+            # Switches replicated from other controller shards are not
+            # connected to this controller
+            if isinstance(switch, SwitchRecord):
+                continue
+
             datapath = switch.dp
             ofproto = datapath.ofproto
             ofproto_parser = datapath.ofproto_parser
@@ -200,3 +339,42 @@ class TopologyManager(app_manager.RyuApp):
     @set_ev_cls(event.EventHostAdd)
     def _event_host_add_handler(self, ev):
         self.topologydb.add_host(ev.host)
+
+    @set_ev_cls([event.EventPortAdd, event.EventPortDelete,
+                 event.EventPortModify])
+    def _event_port_handler(self, ev):
+        self.topologydb.switch_changed(ev.port.dpid)
+
+    @set_ev_cls(ofp_event.EventOFPPortStatus, MAIN_DISPATCHER)
+    def _port_status_handler(self, ev):
+        msg = ev.msg
+        ofproto = msg.datapath.ofproto
+        port = msg.desc
+
+        if msg.reason == ofproto.OFPPR_DELETE:
+            reason = "port deleted"
+        elif (msg.reason == ofproto.OFPPR_MODIFY and
+              port.state & ofproto.OFPPS_LINK_DOWN):
+            reason = "port down"
+        else:
+            return
+
+        for host in self.topologydb.get_hosts_at(msg.datapath.id,
+                                                 port.port_no):
+            self._delete_host(host, reason)
+
+    @set_ev_cls(EventHostIdle)
+    def _event_host_idle_handler(self, ev):
+        host = self.topologydb.get_host(ev.mac)
+        if host is not None:
+            self._delete_host(host, "idle")
+
+    def _delete_host(self, host, reason):
+        self.topologydb.delete_host(host.mac)
+        # Switches only announces hosts it does not know, so it has to
+        # forget the host for it to be discovered again
+        if self.switches is not None:
+            self.switches.hosts.pop(host.mac, None)
+        self.send_event_to_observers(EventHostDelete(host, reason))
+        self.logger.info("Host %s at %s:%s lost (%s)", host.mac,
+                         host.port.dpid, host.port.port_no, reason)
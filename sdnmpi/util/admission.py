@@ -0,0 +1,125 @@
+import time
+from collections import deque
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst, now):
+        super(TokenBucket, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.timestamp = now
+
+    def consume(self, now):
+        """Take a token from the bucket
+        Returns False if the bucket is empty"""
+        elapsed = now - self.timestamp
+        self.timestamp = now
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimiter(object):
+    """Token-bucket rate limiter with a separate bucket per key
+
+    At most max_keys buckets are kept, so that keys chosen by senders
+    (e.g. spoofed source MACs) cannot grow the limiter without bound. A
+    bucket idle long enough to have refilled is equivalent to a new one,
+    so such buckets are evicted first; if that is not enough, the least
+    recently used buckets are evicted too."""
+    def __init__(self, rate, burst, clock=time.time, max_keys=65536):
+        super(RateLimiter, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        # key -> TokenBucket
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def admit(self, key):
+        now = self._clock()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._evict(now)
+            bucket = TokenBucket(self.rate, self.burst, now)
+            self._buckets[key] = bucket
+        return bucket.consume(now)
+
+    def _evict(self, now):
+        refill_time = float(self.burst) / self.rate
+        idle = [key for key, bucket in self._buckets.items()
+                if now - bucket.timestamp >= refill_time]
+        for key in idle:
+            del self._buckets[key]
+
+        # Evict down to half of max_keys, so that the sort is amortized
+        # over many new keys
+        if len(self._buckets) >= self.max_keys:
+            keys = sorted(self._buckets,
+                          key=lambda key: self._buckets[key].timestamp)
+            for key in keys[:len(keys) - self.max_keys // 2]:
+                del self._buckets[key]
+
+    def forget(self, key):
+        self._buckets.pop(key, None)
+
+
+class PendingTable(object):
+    """Set of keys whose processing is in flight
+
+    Entries expire after timeout seconds, so that a lost completion does
+    not block a key forever."""
+    def __init__(self, timeout, clock=time.time):
+        super(PendingTable, self).__init__()
+        self.timeout = timeout
+        self._clock = clock
+        # key -> expiration time
+        self._pending = {}
+        # (expiration time, key) in the order the keys were added, which is
+        # also the order they expire in
+        self._expirations = deque()
+
+    def add(self, key):
+        """Mark key as pending
+        Returns False if key is already pending"""
+        now = self._clock()
+        expiration = self._pending.get(key)
+        if expiration is not None and expiration > now:
+            return False
+        expiration = now + self.timeout
+        self._pending[key] = expiration
+        self._expirations.append((expiration, key))
+        return True
+
+    def remove(self, key):
+        self._pending.pop(key, None)
+
+    def expire(self):
+        """Remove the expired keys, returning them
+
+        Only the entries which expired are visited, so this is cheap
+        enough to be called on every packet-in."""
+        now = self._clock()
+        expired = []
+        expirations = self._expirations
+        while expirations and expirations[0][0] <= now:
+            expiration, key = expirations.popleft()
+            # Skip keys removed, or added again, since this entry
+            if self._pending.get(key) == expiration:
+                del self._pending[key]
+                expired.append(key)
+        return expired
+
+    def __contains__(self, key):
+        expiration = self._pending.get(key)
+        return expiration is not None and expiration > self._clock()
+
+    def __len__(self):
+        return len(self._pending)
@@ -0,0 +1,38 @@
+"""Fake switches for running the controller apps without a network, shared
+by the simulator and the tests"""
+from ryu.ofproto import ofproto_v1_0, ofproto_v1_0_parser
+
+
+class FakeDatapath(object):
+    """Datapath that records the messages sent to it, serialized as they
+    would be on the wire"""
+    ofproto = ofproto_v1_0
+    ofproto_parser = ofproto_v1_0_parser
+
+    def __init__(self, id):
+        super(FakeDatapath, self).__init__()
+        self.id = id
+        self.xid = 0
+        self.msgs = []
+
+    def send_msg(self, msg):
+        # Messages are serialized when they are sent, as the data of a
+        # PacketOut may be a buffer that is reused afterwards
+        if msg.xid is None:
+            self.xid += 1
+            msg.set_xid(self.xid)
+        msg.serialize()
+        self.msgs.append(bytes(msg.buf))
+
+
+class FakeSwitch(object):
+    def __init__(self, dp, ports=None):
+        super(FakeSwitch, self).__init__()
+        self.dp = dp
+        self.ports = ports or []
+
+    def to_dict(self):
+        return {
+            "dpid": "%016x" % self.dp.id,
+            "ports": [port.to_dict() for port in self.ports],
+        }
@@ -0,0 +1,92 @@
+import struct
+
+# Destination and source MAC addresses at the start of an Ethernet frame
+_FRAME_MACS = struct.Struct("!HIHI")
+
+
+def mac_to_int(mac):
+    return int(mac.replace(":", ""), 16)
+
+
+def int_to_mac(value):
+    hex_str = "%012x" % value
+    return ":".join(hex_str[i:i+2] for i in range(0, 12, 2))
+
+
+def frame_ids(data):
+    """Returns the identities (dst, src) of the MAC addresses of a raw
+    Ethernet frame, without converting them to strings"""
+    dst_high, dst_low, src_high, src_low = _FRAME_MACS.unpack_from(data)
+    return ((dst_high << 32) | dst_low, (src_high << 32) | src_low)
+
+
+class IdentityTable(object):
+    """Interns MAC addresses as compact integer identities
+
+    The identity of a MAC address is its 48-bit integer value, so that the
+    identity of a switch local port is equal to the DPID of the switch and
+    the identities of a frame can be read from its raw bytes (frame_ids).
+    MAC strings are parsed only once, when they are interned.
+
+    Every intern_mac() or intern_dpid() takes a reference which must be
+    given back with release(); a MAC address is forgotten when its last
+    reference is released, so the table only holds the addresses of the
+    hosts, switches, flows and processes currently known."""
+    def __init__(self):
+        super(IdentityTable, self).__init__()
+        # MAC address -> identity
+        self._mac_to_id = {}
+        # identity -> MAC address
+        self._id_to_mac = {}
+        # identity -> number of references
+        self._refs = {}
+
+    def intern_mac(self, mac):
+        """Return the identity of mac, assigning one if necessary"""
+        mac_id = self._mac_to_id.get(mac)
+        if mac_id is None:
+            mac_id = mac_to_int(mac)
+            self._mac_to_id[mac] = mac_id
+            self._id_to_mac[mac_id] = mac
+            self._refs[mac_id] = 1
+        else:
+            self._refs[mac_id] += 1
+        return mac_id
+
+    def intern_dpid(self, dpid):
+        """Intern the MAC address of the local port of a switch"""
+        if dpid in self._refs:
+            self._refs[dpid] += 1
+        else:
+            mac = int_to_mac(dpid)
+            self._mac_to_id[mac] = dpid
+            self._id_to_mac[dpid] = mac
+            self._refs[dpid] = 1
+        return dpid
+
+    def release(self, mac_id):
+        """Give back a reference taken by intern_mac() or intern_dpid()"""
+        refs = self._refs[mac_id] - 1
+        if refs:
+            self._refs[mac_id] = refs
+        else:
+            del self._refs[mac_id]
+            del self._mac_to_id[self._id_to_mac.pop(mac_id)]
+
+    def get_id(self, mac):
+        """Return the identity of mac, or None if it has not been interned"""
+        return self._mac_to_id.get(mac)
+
+    def get_mac(self, mac_id):
+        """Return the MAC address of an identity"""
+        mac = self._id_to_mac.get(mac_id)
+        if mac is None:
+            mac = int_to_mac(mac_id)
+        return mac
+
+    def __len__(self):
+        return len(self._id_to_mac)
+
+
+# Identity table shared by all databases in this process
+identities = IdentityTable()
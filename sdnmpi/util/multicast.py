@@ -0,0 +1,47 @@
+"""Distribution trees for broadcast-style MPI collectives
+
+The coll_type field of an SDN-MPI address tells the collective a packet
+belongs to. Packets of broadcast-style collectives whose dst_rank is
+ALL_RANKS go to every other rank of the job of the sender; they are
+replicated by the switches along a tree instead of being sent once per
+destination."""
+
+# Values of the coll_type field of SDN-MPI addresses
+COLL_NONE = 0
+COLL_BCAST = 1
+COLL_ALLGATHER = 2
+# Collectives whose packets are delivered to every rank of the job
+BROADCAST_COLLECTIVES = frozenset([COLL_BCAST, COLL_ALLGATHER])
+# dst_rank of packets sent to every rank of the job
+ALL_RANKS = -1
+
+
+def is_multicast(coll_type, dst_rank):
+    return coll_type in BROADCAST_COLLECTIVES and dst_rank == ALL_RANKS
+
+
+class MulticastTree(object):
+    """Replication rules of a tree rooted at a host
+
+    ports maps each DPID of the tree to a list of (output port, dst MAC),
+    where dst MAC is the MAC address a packet output to a host port is
+    rewritten to, or None for switch-to-switch ports."""
+    def __init__(self, ports, receivers, unicast_links):
+        super(MulticastTree, self).__init__()
+        self.ports = ports
+        # MAC addresses of the hosts reached by the tree
+        self.receivers = receivers
+        # Links crossed by one packet sent with a unicast flow per receiver
+        self.unicast_links = unicast_links
+
+    @property
+    def links(self):
+        """Links crossed by one packet replicated along the tree"""
+        return sum(len(ports) for ports in self.ports.values())
+
+    def actions(self, dpid):
+        """Returns the list of (output port, dst MAC) of dpid in the order
+        they must be applied: as a rewrite of the destination applies to
+        all later outputs, switch-to-switch ports come first"""
+        return sorted(self.ports.get(dpid, ()),
+                      key=lambda port: (port[1] is not None, port))
@@ -0,0 +1,83 @@
+from collections import deque
+
+
+class PacketBufferPool(object):
+    """Bounded storage for the packets of a key, e.g. a (src, dst) pair,
+    received while the route of the key is being set up
+
+    Packet data is copied once into a slot of a single preallocated
+    bytearray. Slots are handed out from a ring of free slots and go back
+    to it when their packets are released, so the pool never allocates
+    after its creation. Packets buffered by the switch itself only record
+    their buffer_id and take no slot."""
+    def __init__(self, slots, slot_size, max_per_key):
+        super(PacketBufferPool, self).__init__()
+        self.slot_size = slot_size
+        self.max_per_key = max_per_key
+        self._buffer = bytearray(slots * slot_size)
+        self._view = memoryview(self._buffer)
+        # Indexes of the free slots, in the order they are handed out
+        self._free = deque(range(slots))
+        # key -> list of (dpid, in_port, buffer_id, slot, length)
+        self._packets = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def free_slots(self):
+        return len(self._free)
+
+    def add(self, key, dpid, in_port, buffer_id, data=None):
+        """Buffer a packet of key, whose data is None if it is buffered by
+        the switch as buffer_id
+        Returns False if the packet could not be buffered"""
+        packets = self._packets.get(key)
+        if packets is not None and len(packets) >= self.max_per_key:
+            return False
+
+        slot = None
+        length = 0
+        if data is not None:
+            length = len(data)
+            if length > self.slot_size or not self._free:
+                return False
+            slot = self._free.popleft()
+            start = slot * self.slot_size
+            self._buffer[start:start + length] = data
+
+        if packets is None:
+            packets = self._packets[key] = []
+        packets.append((dpid, in_port, buffer_id, slot, length))
+        self._count += 1
+        return True
+
+    def release(self, key, send):
+        """Call send(dpid, in_port, buffer_id, data) for every packet of
+        key in arrival order, then free their slots
+
+        data is None for packets buffered by the switch, and otherwise a
+        memoryview of the pool which is only valid during the call.
+        Returns the number of packets released."""
+        packets = self._packets.pop(key, ())
+        for (dpid, in_port, buffer_id, slot, length) in packets:
+            data = None
+            if slot is not None:
+                start = slot * self.slot_size
+                data = self._view[start:start + length]
+            send(dpid, in_port, buffer_id, data)
+        self._free_packets(packets)
+        return len(packets)
+
+    def discard(self, key):
+        """Drop the packets of key, returning their number"""
+        packets = self._packets.pop(key, ())
+        self._free_packets(packets)
+        return len(packets)
+
+    def _free_packets(self, packets):
+        for packet in packets:
+            if packet[3] is not None:
+                self._free.append(packet[3])
+        self._count -= len(packets)
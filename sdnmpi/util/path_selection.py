@@ -0,0 +1,61 @@
+"""Selection of a route among equal-cost routes for MPI flows
+
+A policy chooses one of the routes returned by TopologyDB.find_route(...,
+multiple=True) for each (src_rank, dst_rank) pair."""
+
+
+class PathPolicy(object):
+    def select(self, fdbs, src_rank, dst_rank):
+        """Returns one of fdbs, which must not be empty"""
+        raise NotImplementedError()
+
+
+class HashPathPolicy(PathPolicy):
+    """Deterministically spreads rank pairs by hashing them"""
+    def select(self, fdbs, src_rank, dst_rank):
+        # Knuth's multiplicative hash, stable across processes
+        key = ((src_rank & 0xffff) << 16) | (dst_rank & 0xffff)
+        idx = ((key * 2654435761) & 0xffffffff) >> 16
+        return sorted(fdbs)[idx % len(fdbs)]
+
+
+class RoundRobinPathPolicy(PathPolicy):
+    """Assigns routes to successive flows in turn"""
+    def __init__(self):
+        super(RoundRobinPathPolicy, self).__init__()
+        self._counter = 0
+
+    def select(self, fdbs, src_rank, dst_rank):
+        fdb = sorted(fdbs)[self._counter % len(fdbs)]
+        self._counter += 1
+        return fdb
+
+
+class LeastLoadedPathPolicy(PathPolicy):
+    """Chooses the route whose busiest port carries the fewest flows,
+    counting the flows installed in a SwitchFDB"""
+    def __init__(self, fdb):
+        super(LeastLoadedPathPolicy, self).__init__()
+        self.fdb = fdb
+
+    def _load(self, route):
+        counts = [self.fdb.port_flow_count(dpid, port)
+                  for (dpid, port) in route]
+        return (max(counts), sum(counts))
+
+    def select(self, fdbs, src_rank, dst_rank):
+        return min(sorted(fdbs), key=self._load)
+
+
+def make_path_policy(name, fdb):
+    """Returns the policy with the given name, or None for "dfs" which
+    uses the single route found by depth-first search"""
+    if name == "dfs":
+        return None
+    elif name == "hash":
+        return HashPathPolicy()
+    elif name == "round_robin":
+        return RoundRobinPathPolicy()
+    elif name == "least_loaded":
+        return LeastLoadedPathPolicy(fdb)
+    raise ValueError("Unknown path selection policy: %s" % name)
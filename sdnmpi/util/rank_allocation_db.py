@@ -1,17 +1,156 @@
+from array import array
+
+from identity import identities as shared_identities
+
+# Job of processes announced one at a time
+DEFAULT_JOB = 0
+# SDN-MPI addresses encode ranks as signed 16-bit integers
+MAX_RANK = 0x7fff
+# Value of the rank tables for unallocated ranks
+_NONE = -1
+
+
 class RankAllocationDB(object):
-    def __init__(self):
+    """Ranks of the running MPI processes and the job each belongs to
+
+    SDN-MPI addresses carry no job id, so ranks share a single namespace:
+    the job only scopes registration and removal. Ranks are small
+    integers, so the MAC identity and job of each rank are kept in arrays
+    indexed by rank, with a reverse index from MAC identities to ranks."""
+    def __init__(self, identities=None):
         super(RankAllocationDB, self).__init__()
-        self._rank_to_mac = {}
+        if identities is None:
+            identities = shared_identities
+        self.identities = identities
+        # Rank -> MAC identity ("l" is 64-bit, enough for 48-bit MACs)
+        self._rank_to_mac = array("l")
+        # Rank -> job id
+        self._rank_to_job = array("l")
+        # MAC identity -> set of ranks
+        self._mac_to_ranks = {}
+        # Job id -> set of ranks
+        self._jobs = {}
+        self._count = 0
+        # Incremented on every change
+        self.version = 0
+        # Cached to_dict() and the version it was built at
+        self._dict = None
+        self._dict_version = None
+
+    def __len__(self):
+        return self._count
+
+    def _grow(self, rank):
+        missing = rank + 1 - len(self._rank_to_mac)
+        if missing > 0:
+            self._rank_to_mac.extend(array("l", [_NONE]) * missing)
+            self._rank_to_job.extend(array("l", [_NONE]) * missing)
+
+    def add_process(self, rank, mac, job_id=DEFAULT_JOB):
+        self.add_processes(job_id, [(rank, mac)])
+
+    def add_processes(self, job_id, processes):
+        """Register the (rank, mac) pairs of a job"""
+        intern_mac = self.identities.intern_mac
+        for rank, mac in processes:
+            if not 0 <= rank <= MAX_RANK:
+                raise ValueError("Invalid rank: %s" % rank)
+            self._grow(rank)
+            if self._rank_to_mac[rank] != _NONE:
+                self._delete(rank)
+
+            mac_id = intern_mac(mac)
+            self._rank_to_mac[rank] = mac_id
+            self._rank_to_job[rank] = job_id
+            self._mac_to_ranks.setdefault(mac_id, set()).add(rank)
+            self._jobs.setdefault(job_id, set()).add(rank)
+            self._count += 1
+        self.version += 1
+
+    def _delete(self, rank):
+        mac_id = self._rank_to_mac[rank]
+        job_id = self._rank_to_job[rank]
+        self._rank_to_mac[rank] = _NONE
+        self._rank_to_job[rank] = _NONE
+        self._count -= 1
+        self.identities.release(mac_id)
 
-    def add_process(self, rank, mac):
-        self._rank_to_mac[rank] = mac
+        ranks = self._mac_to_ranks[mac_id]
+        ranks.discard(rank)
+        if not ranks:
+            del self._mac_to_ranks[mac_id]
+        ranks = self._jobs[job_id]
+        ranks.discard(rank)
+        if not ranks:
+            del self._jobs[job_id]
 
     def delete_prcess(self, rank):
-        if rank in self._rank_to_mac:
-            del self._rank_to_mac[rank]
+        self.delete_processes([rank])
+
+    def delete_processes(self, ranks):
+        """Unregister ranks, returning those that were registered"""
+        deleted = []
+        for rank in ranks:
+            if self.get_mac_id(rank) is None:
+                continue
+            self._delete(rank)
+            deleted.append(rank)
+        if deleted:
+            self.version += 1
+        return deleted
+
+    def delete_job(self, job_id):
+        """Unregister every process of a job, returning their ranks"""
+        return self.delete_processes(self.job_ranks(job_id))
+
+    def delete_mac(self, mac):
+        """Unregister every process running at mac, returning their ranks"""
+        return self.delete_processes(self.get_ranks(mac))
+
+    def get_mac_id(self, rank):
+        if 0 <= rank < len(self._rank_to_mac):
+            mac_id = self._rank_to_mac[rank]
+            if mac_id != _NONE:
+                return mac_id
+        return None
 
     def get_mac(self, rank):
-        return self._rank_to_mac.get(rank)
+        mac_id = self.get_mac_id(rank)
+        if mac_id is None:
+            return None
+        return self.identities.get_mac(mac_id)
+
+    def get_ranks(self, mac):
+        """Ranks of the processes running at mac"""
+        mac_id = self.identities.get_id(mac)
+        return sorted(self._mac_to_ranks.get(mac_id, ()))
+
+    def get_job(self, rank):
+        if self.get_mac_id(rank) is None:
+            return None
+        return self._rank_to_job[rank]
+
+    def job_ranks(self, job_id):
+        return sorted(self._jobs.get(job_id, ()))
+
+    def jobs(self):
+        return sorted(self._jobs)
+
+    def mac_ids(self):
+        """Iterate over tuples (rank, MAC identity, job ID)"""
+        for rank, mac_id in enumerate(self._rank_to_mac):
+            if mac_id != _NONE:
+                yield (rank, mac_id, self._rank_to_job[rank])
 
     def to_dict(self):
-        return self._rank_to_mac
+        """Convert this object to a JSON-serializable object
+
+        The result is cached until the table changes, and must not be
+        modified."""
+        if self._dict_version != self.version:
+            get_mac = self.identities.get_mac
+            self._dict = dict((rank, get_mac(mac_id))
+                              for rank, mac_id in enumerate(self._rank_to_mac)
+                              if mac_id != _NONE)
+            self._dict_version = self.version
+        return self._dict
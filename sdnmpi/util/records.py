@@ -0,0 +1,87 @@
+"""Lightweight stand-ins for ryu.topology.switches objects
+
+Used for topology state that was not learned from a connected switch, e.g.
+state restored from a snapshot. Their to_dict() output matches the format
+of the corresponding Ryu objects."""
+from identity import int_to_mac
+
+
+class DatapathRecord(object):
+    def __init__(self, id):
+        super(DatapathRecord, self).__init__()
+        self.id = id
+
+
+class SwitchRecord(object):
+    def __init__(self, dp):
+        super(SwitchRecord, self).__init__()
+        self.dp = dp
+        self.ports = []
+
+    def to_dict(self):
+        return {
+            "dpid": "%016x" % self.dp.id,
+            "ports": [port.to_dict() for port in self.ports],
+        }
+
+
+class PortRecord(object):
+    def __init__(self, dpid, port_no, hw_addr=None, name=""):
+        super(PortRecord, self).__init__()
+        self.dpid = dpid
+        self.port_no = port_no
+        self.hw_addr = hw_addr
+        self.name = name
+
+    def is_reserved(self):
+        return False
+
+    def __eq__(self, other):
+        return self.dpid == other.dpid and self.port_no == other.port_no
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.dpid, self.port_no))
+
+    def to_dict(self):
+        return {
+            "dpid": "%016x" % self.dpid,
+            "port_no": "%08x" % self.port_no,
+            "hw_addr": self.hw_addr or int_to_mac(0),
+            "name": self.name,
+        }
+
+
+class LinkRecord(object):
+    def __init__(self, src, dst, restored=False):
+        super(LinkRecord, self).__init__()
+        self.src = src
+        self.dst = dst
+        # True if the link was restored from a snapshot, and has not been
+        # rediscovered since
+        self.restored = restored
+
+    def to_dict(self):
+        return {
+            "src": self.src.to_dict(),
+            "dst": self.dst.to_dict(),
+        }
+
+
+class HostRecord(object):
+    def __init__(self, mac, port):
+        super(HostRecord, self).__init__()
+        self.mac = mac
+        self.port = port
+        self.ipv4 = []
+        self.ipv6 = []
+
+    def to_dict(self):
+        return {
+            "mac": self.mac,
+            "ipv4": self.ipv4,
+            "ipv6": self.ipv6,
+            "port": self.port.to_dict(),
+        }
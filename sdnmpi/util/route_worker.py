@@ -0,0 +1,248 @@
+"""Route computation in a pool of worker processes
+
+Each worker process holds a replica of the TopologyDB of the controller.
+Before a route request is sent to a worker, the changes made to the
+topology since the last request are shipped from the change log of the
+TopologyDB, so that the replica is up to date when the request is served.
+
+Workers are separate interpreters connected through UNIX domain sockets,
+so that they do not inherit the eventlet hub of the controller. The
+controller end of the sockets is always a green socket, so that waiting for
+a worker only blocks the calling greenthread, even if the standard library
+is not monkey-patched (e.g. in the simulator and the benchmarks)."""
+import os
+import socket
+import struct
+import subprocess
+import sys
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from eventlet.green import socket as green_socket
+from ryu.lib import hub
+
+from topology_db import TopologyDB
+
+_length = struct.Struct("<I")
+
+
+def _send_message(sock, message):
+    data = pickle.dumps(message, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_length.pack(len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError()
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_message(sock):
+    size, = _length.unpack(_recv_exactly(sock, _length.size))
+    return pickle.loads(_recv_exactly(sock, size))
+
+
+def worker_main(fd):
+    """Entry point of a worker process"""
+    sock = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+    os.close(fd)
+    # The controller end is a green socket, which made the socket pair
+    # non-blocking before it was inherited
+    sock.setblocking(True)
+    topologydb = TopologyDB()
+
+    while True:
+        try:
+            message = _recv_message(sock)
+        except EOFError:
+            return
+
+        op = message[0]
+        if op == "reset":
+            topologydb = TopologyDB()
+            for change in message[1]:
+                topologydb.apply_change(change)
+        elif op == "sync":
+            for change in message[1]:
+                topologydb.apply_change(change)
+        elif op == "route":
+            _, req_id, src_mac, dst_mac, multiple = message
+            fdb = topologydb.find_route(src_mac, dst_mac, multiple)
+            _send_message(sock, (req_id, fdb))
+
+
+class PendingRoute(object):
+    """Result of a route request that may not have been computed yet"""
+    def __init__(self):
+        super(PendingRoute, self).__init__()
+        self.event = hub.Event()
+        self.fdb = []
+
+    def set(self, fdb):
+        self.fdb = fdb
+        self.event.set()
+
+    def wait(self):
+        """Block the calling greenthread until the route is computed"""
+        self.event.wait()
+        return self.fdb
+
+
+class RouteWorker(object):
+    # Seconds the process of a failed worker is given to exit
+    REAP_TIMEOUT = 5
+
+    def __init__(self, pool):
+        super(RouteWorker, self).__init__()
+        self.pool = pool
+        # Version of the TopologyDB replicated to the worker
+        self.version = None
+        # Request ID -> PendingRoute
+        self.pending = {}
+        self.alive = True
+        self.send_q = hub.Queue()
+
+        self.sock, child_sock = green_socket.socketpair(socket.AF_UNIX,
+                                                        socket.SOCK_STREAM)
+        # The worker gets its end of the socket pair as its standard input
+        # and no other descriptor of the controller, in particular not the
+        # controller end, or it would never see the end of the stream when
+        # the controller closes it
+        code = ("import sys; from sdnmpi.util.route_worker import "
+                "worker_main; worker_main(sys.stdin.fileno())")
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join(
+            [pool.package_root] + env.get("PYTHONPATH", "").split(os.pathsep))
+        self.process = subprocess.Popen([sys.executable, "-c", code],
+                                        stdin=child_sock, close_fds=True,
+                                        env=env)
+        child_sock.close()
+
+        self.threads = [hub.spawn(self._send_loop),
+                        hub.spawn(self._recv_loop)]
+
+    def submit(self, req_id, src_mac, dst_mac, multiple):
+        pending = PendingRoute()
+        self.pending[req_id] = pending
+        self.send_q.put((req_id, src_mac, dst_mac, multiple))
+        return pending
+
+    def _sync_message(self):
+        topologydb = self.pool.topologydb
+        if self.version is not None:
+            changes = topologydb.changes_since(self.version)
+            if changes is not None:
+                self.version = topologydb.version
+                return ("sync", changes)
+        self.version = topologydb.version
+        return ("reset", topologydb.dump_changes())
+
+    def _send_loop(self):
+        try:
+            while True:
+                req_id, src_mac, dst_mac, multiple = self.send_q.get()
+                if self.version != self.pool.topologydb.version:
+                    _send_message(self.sock, self._sync_message())
+                _send_message(self.sock, ("route", req_id, src_mac, dst_mac,
+                                          multiple))
+        except socket.error:
+            self._fail()
+
+    def _recv_loop(self):
+        try:
+            while True:
+                req_id, fdb = _recv_message(self.sock)
+                pending = self.pending.pop(req_id, None)
+                if pending:
+                    pending.set(fdb)
+        except (EOFError, socket.error):
+            self._fail()
+
+    def _fail(self):
+        if not self.alive:
+            return
+        self.alive = False
+        self.pool.logger.error("Route worker %d died", self.process.pid)
+        # Serve the requests assigned to this worker in the controller
+        for req_id, pending in self.pending.items():
+            req = self.pool.requests.get(req_id)
+            pending.set(self.pool.compute_inline(*req) if req else [])
+        self.pending = {}
+        hub.spawn(self._reap_failed)
+
+    def _reap_failed(self):
+        self.pool.logger.error("Route worker %d exited with status %s",
+                               self.process.pid, self._reap())
+
+    def _reap(self):
+        """Close the socket of the worker and wait for its process to exit,
+        without blocking the hub"""
+        self.sock.close()
+        for _ in range(self.REAP_TIMEOUT * 10):
+            if self.process.poll() is not None:
+                break
+            hub.sleep(0.1)
+        else:
+            self.process.kill()
+            self.process.wait()
+        return self.process.returncode
+
+    def stop(self):
+        self.alive = False
+        for thread in self.threads:
+            hub.kill(thread)
+        self._reap()
+
+
+class RouteWorkerPool(object):
+    """Computes routes on a TopologyDB using a pool of worker processes"""
+    def __init__(self, topologydb, num_workers, logger):
+        super(RouteWorkerPool, self).__init__()
+        self.topologydb = topologydb
+        self.logger = logger
+        # Directory that contains the sdnmpi package
+        self.package_root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        self.workers = [RouteWorker(self) for _ in range(num_workers)]
+        self._next_req_id = 0
+        self._next_worker = 0
+        # Request ID -> (src_mac, dst_mac, multiple) of requests in flight
+        self.requests = {}
+
+    def compute_inline(self, src_mac, dst_mac, multiple):
+        return self.topologydb.find_route(src_mac, dst_mac, multiple)
+
+    def _pick_worker(self):
+        for _ in range(len(self.workers)):
+            worker = self.workers[self._next_worker]
+            self._next_worker = (self._next_worker + 1) % len(self.workers)
+            if worker.alive:
+                return worker
+        return None
+
+    def find_route(self, src_mac, dst_mac, multiple=False):
+        """Find a route on a worker process
+        Only the calling greenthread is blocked until the route is found"""
+        worker = self._pick_worker()
+        if worker is None:
+            return self.compute_inline(src_mac, dst_mac, multiple)
+
+        req_id = self._next_req_id
+        self._next_req_id += 1
+        self.requests[req_id] = (src_mac, dst_mac, multiple)
+        try:
+            return worker.submit(req_id, src_mac, dst_mac, multiple).wait()
+        finally:
+            del self.requests[req_id]
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
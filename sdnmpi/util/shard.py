@@ -0,0 +1,317 @@
+import fcntl
+import struct
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from records import PortRecord, LinkRecord, HostRecord
+
+
+class ShardMap(object):
+    """Assignment of switches to controller shards
+
+    A switch is owned by the shard given in assignments, or by the shard
+    dpid % num_shards if it is not assigned explicitly."""
+    def __init__(self, shard_id, num_shards, assignments=None):
+        super(ShardMap, self).__init__()
+        self.shard_id = shard_id
+        self.num_shards = num_shards
+        # DPID -> shard ID
+        self.assignments = assignments or {}
+
+    def owner(self, dpid):
+        shard_id = self.assignments.get(dpid)
+        if shard_id is None:
+            shard_id = dpid % self.num_shards
+        return shard_id
+
+    def owns(self, dpid):
+        return self.owner(dpid) == self.shard_id
+
+
+def parse_assignments(items):
+    """Parse a list of "dpid:shard_id" strings, where dpid is hexadecimal"""
+    assignments = {}
+    for item in items:
+        dpid, shard_id = item.split(":")
+        assignments[int(dpid, 16)] = int(shard_id)
+    return assignments
+
+
+class ReplicatedLog(object):
+    """Append-only log of entries shared by all shards
+
+    Entries are tuples (shard_id, kind, payload...) and are read back in
+    the same order by every shard. Backends must implement append and
+    read."""
+    def append(self, entry):
+        """Append entry to the log
+        Returns the offset of the entry"""
+        raise NotImplementedError()
+
+    def read(self, offset, limit=None):
+        """Returns the entries starting from offset"""
+        raise NotImplementedError()
+
+
+class LocalReplicatedLog(ReplicatedLog):
+    """In-process log backend, shared by all shards with the same name
+
+    Used for testing and for running several shards in one process."""
+    _logs = {}
+
+    def __init__(self, entries):
+        super(LocalReplicatedLog, self).__init__()
+        self._entries = entries
+
+    @classmethod
+    def open(cls, name):
+        return cls(cls._logs.setdefault(name, []))
+
+    def append(self, entry):
+        self._entries.append(entry)
+        return len(self._entries) - 1
+
+    def read(self, offset, limit=None):
+        if limit is None:
+            return self._entries[offset:]
+        return self._entries[offset:offset + limit]
+
+
+class FileReplicatedLog(ReplicatedLog):
+    """Log backend stored in a file, shared by shards on the same host or on
+    a filesystem supporting flock()
+
+    Entries are pickled and prefixed by their length. Appends hold an
+    exclusive lock on the file and reads a shared one, so that a reader
+    never sees a partially written entry. The positions of the entries
+    read so far are kept, so that each read only scans the new entries."""
+    _length = struct.Struct("<I")
+
+    def __init__(self, path):
+        super(FileReplicatedLog, self).__init__()
+        self.path = path
+        # File positions of the entries scanned so far, followed by the
+        # position of the next entry
+        self._positions = [0]
+        open(path, "ab").close()
+
+    @classmethod
+    def open(cls, name):
+        return cls(name)
+
+    def _scan(self, f):
+        """Record the positions of the entries appended since the last
+        scan"""
+        f.seek(self._positions[-1])
+        while True:
+            header = f.read(self._length.size)
+            if len(header) < self._length.size:
+                return
+            size, = self._length.unpack(header)
+            f.seek(size, 1)
+            self._positions.append(self._positions[-1] +
+                                   self._length.size + size)
+
+    def append(self, entry):
+        data = pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)
+        with open(self.path, "a+b") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            self._scan(f)
+            f.write(self._length.pack(len(data)) + data)
+            f.flush()
+        self._positions.append(self._positions[-1] +
+                               self._length.size + len(data))
+        return len(self._positions) - 2
+
+    def read(self, offset, limit=None):
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_SH)
+            self._scan(f)
+            end = len(self._positions) - 1
+            if limit is not None:
+                end = min(end, offset + limit)
+            if offset >= end:
+                return []
+            f.seek(self._positions[offset])
+            data = f.read(self._positions[end] - self._positions[offset])
+
+        entries = []
+        start = 0
+        for idx in range(offset, end):
+            size = self._positions[idx + 1] - self._positions[idx]
+            entries.append(pickle.loads(
+                data[start + self._length.size:start + size]))
+            start += size
+        return entries
+
+
+LOG_BACKENDS = {
+    "local": LocalReplicatedLog,
+    "file": FileReplicatedLog,
+}
+
+
+def _change_owner(change):
+    """Returns the DPID of the switch whose shard publishes change"""
+    op = change[0]
+    if op in ("add_switch", "delete_switch"):
+        return change[1]
+    elif op in ("add_link", "delete_link"):
+        # Links are discovered at the switch receiving the LLDP packet
+        return change[3]
+    elif op in ("add_host", "delete_host"):
+        return change[2]
+    return None
+
+
+class RemoteLinks(object):
+    """Links from switches of other shards, discovered from the LLDP
+    packets they send to the switches of this shard
+
+    ryu.topology.switches neither discovers nor expires these links, so a
+    link is deleted from the TopologyDB by expire() when no LLDP packet was
+    received for it for timeout seconds, or when either of its switches
+    was deleted since the previous call."""
+    def __init__(self, topologydb, timeout, clock=time.time):
+        super(RemoteLinks, self).__init__()
+        self.topologydb = topologydb
+        self.timeout = timeout
+        self.clock = clock
+        # (src DPID, dst DPID) -> time the link was last seen
+        self._last_seen = {}
+        # Links one of whose switches was deleted
+        self._stale = set()
+        topologydb.change_listeners.append(self._topology_changed)
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def seen(self, src_dpid, src_port_no, dst_dpid, dst_port_no):
+        """Record an LLDP packet of a link, adding it if it is new or its
+        ports changed"""
+        key = (src_dpid, dst_dpid)
+        self._last_seen[key] = self.clock()
+        self._stale.discard(key)
+        link = self.topologydb.links.get(src_dpid, {}).get(dst_dpid)
+        if link and link.src.port_no == src_port_no and \
+                link.dst.port_no == dst_port_no:
+            return
+        self.topologydb.add_link(LinkRecord(
+            PortRecord(src_dpid, src_port_no),
+            PortRecord(dst_dpid, dst_port_no)))
+
+    def expire(self):
+        """Delete the links not seen for timeout seconds, and those one of
+        whose switches was deleted
+        Returns their number"""
+        deadline = self.clock() - self.timeout
+        expired = self._stale | set(key for key, last_seen
+                                    in self._last_seen.items()
+                                    if last_seen < deadline)
+        self._stale = set()
+        for key in expired:
+            del self._last_seen[key]
+            src_dpid, dst_dpid = key
+            link = self.topologydb.links.get(src_dpid, {}).get(dst_dpid)
+            if link is not None:
+                self.topologydb.delete_link(link)
+        return len(expired)
+
+    def _topology_changed(self, change):
+        # The link is deleted by the next expire(), so that the deletion is
+        # published even if the switch was deleted by another shard
+        if change[0] == "delete_switch":
+            self._stale.update(key for key in self._last_seen
+                               if change[1] in key)
+
+
+class ShardReplicator(object):
+    """Shares the databases of a shard with the other shards through a
+    ReplicatedLog
+
+    Changes made for the switches owned by this shard are appended to the
+    log, and the entries of other shards are applied to the local
+    databases. Flows of other shards for switches owned by this shard are
+    passed to install_flow(dpid, src, dst, port, true_dst, branches), and
+    hosts lost by other shards to delete_host(host, reason), so that their
+    flows are also removed from the switches of this shard."""
+    def __init__(self, shard_map, log, topologydb, rankdb, install_flow,
+                 delete_host):
+        super(ShardReplicator, self).__init__()
+        self.shard_map = shard_map
+        self.log = log
+        self.topologydb = topologydb
+        self.rankdb = rankdb
+        self.install_flow = install_flow
+        self.delete_host = delete_host
+        # Offset of the next log entry to be applied
+        self.offset = 0
+        # Last TopologyDB version published to the log
+        self.published_version = 0
+
+    def publish(self, kind, *payload):
+        self.log.append((self.shard_map.shard_id, kind) + payload)
+
+    def publish_topology_changes(self):
+        changes = self.topologydb.changes_since(self.published_version)
+        if changes is None:
+            changes = self.topologydb.dump_changes()
+        self.published_version = self.topologydb.version
+
+        for change in changes:
+            dpid = _change_owner(change)
+            if dpid is not None and self.shard_map.owns(dpid):
+                self.publish("topology", change)
+
+    def publish_flow(self, dpid, src, dst, port, true_dst=None,
+                     branches=None):
+        """Publish a flow of a route or a multicast tree, if it is on a
+        switch of another shard"""
+        if not self.shard_map.owns(dpid):
+            self.publish("flow", dpid, src, dst, port, true_dst, branches)
+
+    def publish_host_delete(self, host, reason):
+        """Publish the loss of a host attached to a switch of this shard"""
+        if self.shard_map.owns(host.port.dpid):
+            self.publish("host_delete", host.mac, host.port.dpid,
+                         host.port.port_no, reason)
+
+    def apply_entries(self):
+        """Apply the entries appended by other shards since the last call
+        Returns the number of entries read"""
+        entries = self.log.read(self.offset)
+        self.offset += len(entries)
+
+        for entry in entries:
+            shard_id, kind = entry[:2]
+            if shard_id == self.shard_map.shard_id:
+                continue
+
+            if kind == "topology":
+                self.topologydb.apply_change(entry[2])
+            elif kind == "process_add":
+                self.rankdb.add_process(entry[2], entry[3])
+            elif kind == "process_delete":
+                self.rankdb.delete_prcess(entry[2])
+            elif kind == "process_batch_add":
+                self.rankdb.add_processes(entry[2], entry[3])
+            elif kind == "process_batch_delete":
+                self.rankdb.delete_processes(entry[3])
+            elif kind == "flow":
+                dpid, src, dst, port, true_dst, branches = entry[2:]
+                if self.shard_map.owns(dpid):
+                    self.install_flow(dpid, src, dst, port, true_dst,
+                                      branches)
+            elif kind == "host_delete":
+                mac, dpid, port_no, reason = entry[2:]
+                self.delete_host(HostRecord(mac, PortRecord(dpid, port_no)),
+                                 reason)
+
+        # Remote changes applied to the local TopologyDB must not be
+        # published again
+        self.published_version = self.topologydb.version
+        return len(entries)
@@ -0,0 +1,176 @@
+"""Compact on-disk snapshots of the controller databases
+
+A snapshot file is a fixed-size header followed by five arrays of
+fixed-size little-endian records (hosts, links, FDB entries, branches of
+the FDB entries replicating packets along multicast trees and ranks).
+MAC addresses are stored as their 48-bit integer identities. Snapshots are
+written to a temporary file and atomically renamed, and are read back
+through mmap without copying the file into memory."""
+import mmap
+import os
+import struct
+import time
+
+from identity import int_to_mac, mac_to_int
+from records import PortRecord, LinkRecord, HostRecord
+
+SNAPSHOT_MAGIC = b"SMPI"
+SNAPSHOT_VERSION = 4
+
+# magic, version, timestamp, #hosts, #links, #fdb entries, #branches,
+# #ranks
+_header = struct.Struct("<4sHdIIIII")
+# MAC, DPID, port number
+_host = struct.Struct("<QQI")
+# src DPID, src port number, dst DPID, dst port number
+_link = struct.Struct("<QIQI")
+# DPID, src MAC, dst MAC, output port, MAC the destination of an SDN-MPI
+# flow is rewritten to (0 if none)
+_fdb_entry = struct.Struct("<QQQIQ")
+# DPID, src MAC, dst MAC, output port, MAC the destination is rewritten to
+# (0 if none), in the order of the actions of the flow
+_branch = struct.Struct("<QQQIQ")
+# rank, MAC, job ID
+_rank = struct.Struct("<iQI")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def write_snapshot(path, topologydb, fdb, rankdb, timestamp=None,
+                   true_dsts=None):
+    """Write the contents of the databases to path
+
+    true_dsts maps the SDN-MPI MACs of the flows in fdb to the true MACs
+    they are rewritten to, e.g. Router.true_dsts."""
+    if timestamp is None:
+        timestamp = time.time()
+    if true_dsts is None:
+        true_dsts = {}
+    get_mac = fdb.identities.get_mac
+
+    # The databases are keyed by MAC identities, which are the 48-bit
+    # integers stored in the records
+    hosts = [_host.pack(mac_id, host.port.dpid, host.port.port_no)
+             for mac_id, host in topologydb.hosts.items()]
+    links = [_link.pack(link.src.dpid, link.src.port_no,
+                        link.dst.dpid, link.dst.port_no)
+             for dst_to_link in topologydb.links.values()
+             for link in dst_to_link.values()]
+    entries = []
+    for (dpid, src_id, dst_id, out_port) in fdb.entry_ids():
+        true_dst = true_dsts.get(get_mac(dst_id))
+        true_dst_id = mac_to_int(true_dst) if true_dst else 0
+        entries.append(_fdb_entry.pack(dpid, src_id, dst_id, out_port,
+                                       true_dst_id))
+    branches = [_branch.pack(dpid, mac_to_int(src), mac_to_int(dst), port,
+                             mac_to_int(dst_mac) if dst_mac else 0)
+                for (dpid, src, dst, flow_branches) in fdb.branch_entries()
+                for (port, dst_mac) in flow_branches]
+    ranks = [_rank.pack(rank, mac_id, job_id)
+             for rank, mac_id, job_id in rankdb.mac_ids()]
+
+    header = _header.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, timestamp,
+                          len(hosts), len(links), len(entries),
+                          len(branches), len(ranks))
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for records in (hosts, links, entries, branches, ranks):
+            f.write(b"".join(records))
+    os.rename(tmp_path, path)
+
+
+class SnapshotReader(object):
+    """Read-only, memory-mapped view of a snapshot file"""
+    def __init__(self, path):
+        super(SnapshotReader, self).__init__()
+        if os.path.getsize(path) < _header.size:
+            raise SnapshotError("Truncated snapshot header")
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.timestamp, n_hosts, n_links, n_entries,
+         n_branches, n_ranks) = _header.unpack_from(self._buf, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError("Unsupported snapshot format")
+
+        # (record struct, offset, count) of each section
+        self._sections = {}
+        offset = _header.size
+        for name, record, count in [("hosts", _host, n_hosts),
+                                    ("links", _link, n_links),
+                                    ("fdb", _fdb_entry, n_entries),
+                                    ("branches", _branch, n_branches),
+                                    ("ranks", _rank, n_ranks)]:
+            self._sections[name] = (record, offset, count)
+            offset += record.size * count
+
+        if len(self._buf) < offset:
+            raise SnapshotError("Truncated snapshot")
+
+    def close(self):
+        self._buf.close()
+
+    def _iter_section(self, name):
+        record, offset, count = self._sections[name]
+        for idx in range(count):
+            yield record.unpack_from(self._buf, offset + idx * record.size)
+
+    def hosts(self):
+        for mac_id, dpid, port_no in self._iter_section("hosts"):
+            yield HostRecord(int_to_mac(mac_id), PortRecord(dpid, port_no))
+
+    def links(self):
+        for src_dpid, src_port, dst_dpid, dst_port in \
+                self._iter_section("links"):
+            yield LinkRecord(PortRecord(src_dpid, src_port),
+                             PortRecord(dst_dpid, dst_port), restored=True)
+
+    def fdb_entries(self):
+        for dpid, src_id, dst_id, out_port, true_dst_id in \
+                self._iter_section("fdb"):
+            true_dst = int_to_mac(true_dst_id) if true_dst_id else None
+            yield (dpid, int_to_mac(src_id), int_to_mac(dst_id), out_port,
+                   true_dst)
+
+    def branches(self):
+        for dpid, src_id, dst_id, port, dst_mac_id in \
+                self._iter_section("branches"):
+            dst_mac = int_to_mac(dst_mac_id) if dst_mac_id else None
+            yield (dpid, int_to_mac(src_id), int_to_mac(dst_id), port,
+                   dst_mac)
+
+    def ranks(self):
+        for rank, mac_id, job_id in self._iter_section("ranks"):
+            yield (rank, int_to_mac(mac_id), job_id)
+
+
+def load_snapshot(path, topologydb, fdb, rankdb, add_true_dst=None):
+    """Load a snapshot into the databases, calling add_true_dst(dst,
+    true_dst) for the FDB entries of SDN-MPI flows rewritten to true_dst
+    Returns the timestamp of the snapshot"""
+    reader = SnapshotReader(path)
+    try:
+        for host in reader.hosts():
+            topologydb.add_host(host)
+        for link in reader.links():
+            topologydb.add_link(link)
+        branches = {}
+        for (dpid, src, dst, port, dst_mac) in reader.branches():
+            branches.setdefault((dpid, src, dst), []).append((port, dst_mac))
+        for (dpid, src, dst, out_port, true_dst) in reader.fdb_entries():
+            fdb.update(dpid, src, dst, out_port,
+                       branches.get((dpid, src, dst)))
+            if true_dst and add_true_dst:
+                add_true_dst(dst, true_dst)
+        jobs = {}
+        for (rank, mac, job_id) in reader.ranks():
+            jobs.setdefault(job_id, []).append((rank, mac))
+        for job_id, processes in jobs.items():
+            rankdb.add_processes(job_id, processes)
+        return reader.timestamp
+    finally:
+        reader.close()
@@ -1,32 +1,242 @@
+from identity import identities as shared_identities
+
+
 class SwitchFDB(object):
-    def __init__(self):
+    def __init__(self, identities=None):
         super(SwitchFDB, self).__init__()
+        if identities is None:
+            identities = shared_identities
+        self.identities = identities
+        # DPID -> (src MAC identity, dst MAC identity) -> output port
         self._dpid_to_fdb = {}
+        # (DPID, output port) -> number of flows
+        self._port_flows = {}
+        # MAC identity -> set of (DPID, src MAC identity, dst MAC identity)
+        # of the flows whose src or dst is the MAC
+        self._mac_flows = {}
+        # (DPID, src MAC identity, dst MAC identity) -> tuple of (output
+        # port, MAC the destination is rewritten to or None) of the flows
+        # replicating packets along a multicast tree
+        self._branches = {}
+        # Cached to_dict() of the FDB of each DPID, dropped when it changes,
+        # and of the whole FDB
+        self._dpid_dicts = {}
+        self._dict = None
+
+    def _invalidate(self, dpid):
+        self._dpid_dicts.pop(dpid, None)
+        self._dict = None
+
+    def _count_flow(self, dpid, out_port, delta):
+        key = (dpid, out_port)
+        count = self._port_flows.get(key, 0) + delta
+        if count:
+            self._port_flows[key] = count
+        else:
+            del self._port_flows[key]
 
-    def update(self, dpid, src, dst, out_port):
+    def _count_flows(self, flow, out_port, delta):
+        """Count a flow for every port it is output to"""
+        branches = self._branches.get(flow)
+        if branches is None:
+            self._count_flow(flow[0], out_port, delta)
+        else:
+            for port in set(port for (port, _) in branches):
+                self._count_flow(flow[0], port, delta)
+
+    def update(self, dpid, src, dst, out_port, branches=None):
+        """Add or change a flow
+
+        branches is the list of (output port, MAC the destination is
+        rewritten to or None) of a flow replicating packets along a
+        multicast tree, whose out_port is then the first of them."""
         if dpid not in self._dpid_to_fdb:
             self._dpid_to_fdb[dpid] = {}
-        self._dpid_to_fdb[dpid][(src, dst)] = out_port
+        fdb = self._dpid_to_fdb[dpid]
+        src_id = self.identities.get_id(src)
+        dst_id = self.identities.get_id(dst)
+        flow = (dpid, src_id, dst_id)
+        branches = tuple(branches) if branches else None
+        old_port = fdb.get((src_id, dst_id))
+        if old_port == out_port and self._branches.get(flow) == branches:
+            return
+        self._invalidate(dpid)
+        if old_port is not None:
+            self._count_flows(flow, old_port, -1)
+        else:
+            # Each entry holds a reference to the identities of its MACs,
+            # released when it is deleted
+            src_id = self.identities.intern_mac(src)
+            dst_id = self.identities.intern_mac(dst)
+            flow = (dpid, src_id, dst_id)
+            for mac_id in set((src_id, dst_id)):
+                self._mac_flows.setdefault(mac_id, set()).add(flow)
+        fdb[(src_id, dst_id)] = out_port
+        if branches:
+            self._branches[flow] = branches
+        else:
+            self._branches.pop(flow, None)
+        self._count_flows(flow, out_port, 1)
 
     def exists(self, dpid, src, dst):
         if dpid in self._dpid_to_fdb:
-            if (src, dst) in self._dpid_to_fdb[dpid]:
+            key = (self.identities.get_id(src), self.identities.get_id(dst))
+            if key in self._dpid_to_fdb[dpid]:
                 return True
         return False
 
-    def to_dict(self):
-        switches = []
+    def get(self, dpid, src, dst):
+        """Returns the output port of a flow, or None if not installed"""
+        if dpid in self._dpid_to_fdb:
+            key = (self.identities.get_id(src), self.identities.get_id(dst))
+            return self._dpid_to_fdb[dpid].get(key)
+        return None
+
+    def get_branches(self, dpid, src, dst):
+        """Returns the branches of a flow replicating packets along a
+        multicast tree, or None"""
+        flow = (dpid, self.identities.get_id(src), self.identities.get_id(dst))
+        branches = self._branches.get(flow)
+        return list(branches) if branches else None
+
+    def get_by_id(self, dpid, src_id, dst_id):
+        """Returns the output port of a flow given the identities of its
+        MACs, e.g. read from a frame with identity.frame_ids"""
+        fdb = self._dpid_to_fdb.get(dpid)
+        if fdb is None:
+            return None
+        return fdb.get((src_id, dst_id))
+
+    def _delete(self, dpid, src_id, dst_id):
+        out_port = self._dpid_to_fdb[dpid].pop((src_id, dst_id), None)
+        if out_port is None:
+            return False
+        self._invalidate(dpid)
+        flow = (dpid, src_id, dst_id)
+        self._count_flows(flow, out_port, -1)
+        self._branches.pop(flow, None)
+        # A flow from a MAC to itself is indexed once but holds two
+        # references to its identity
+        for mac_id in set((src_id, dst_id)):
+            flows = self._mac_flows[mac_id]
+            flows.discard(flow)
+            if not flows:
+                del self._mac_flows[mac_id]
+        self.identities.release(src_id)
+        self.identities.release(dst_id)
+        return True
+
+    def delete(self, dpid, src, dst):
+        if dpid in self._dpid_to_fdb:
+            self._delete(dpid, self.identities.get_id(src),
+                         self.identities.get_id(dst))
+
+    def has_flows(self, mac):
+        """Returns whether a flow from or to mac is installed"""
+        return self.identities.get_id(mac) in self._mac_flows
+
+    def delete_mac(self, mac):
+        """Delete the flows from or to mac, returning a list of their
+        (dpid, src, dst)"""
+        get_mac = self.identities.get_mac
+        flows = self._mac_flows.get(self.identities.get_id(mac), ())
+        deleted = []
+        for (dpid, src_id, dst_id) in list(flows):
+            self._delete(dpid, src_id, dst_id)
+            deleted.append((dpid, get_mac(src_id), get_mac(dst_id)))
+        return deleted
+
+    def flows_at(self, dpid, out_port=None):
+        """Returns the (src, dst) of the flows of a switch, only those
+        output to out_port if it is given"""
+        get_mac = self.identities.get_mac
+        return [(get_mac(src_id), get_mac(dst_id))
+                for (src_id, dst_id), port
+                in self._dpid_to_fdb.get(dpid, {}).items()
+                if out_port is None or port == out_port or
+                out_port in self._branch_ports(dpid, src_id, dst_id)]
+
+    def _branch_ports(self, dpid, src_id, dst_id):
+        branches = self._branches.get((dpid, src_id, dst_id), ())
+        return [port for (port, _) in branches]
+
+    def pair_dpids(self, src, dst):
+        """Returns the DPIDs of the switches with a flow from src to dst"""
+        src_id = self.identities.get_id(src)
+        dst_id = self.identities.get_id(dst)
+        return sorted(dpid for (dpid, flow_src_id, flow_dst_id)
+                      in self._mac_flows.get(src_id, ())
+                      if flow_src_id == src_id and flow_dst_id == dst_id)
+
+    def delete_pair(self, src, dst):
+        """Delete the flows from src to dst from every switch, returning
+        their DPIDs"""
+        dpids = self.pair_dpids(src, dst)
+        if dpids:
+            src_id = self.identities.get_id(src)
+            dst_id = self.identities.get_id(dst)
+            for dpid in dpids:
+                self._delete(dpid, src_id, dst_id)
+        return dpids
+
+    def port_flow_count(self, dpid, out_port):
+        """Returns the number of flows output to a port"""
+        return self._port_flows.get((dpid, out_port), 0)
+
+    def port_flow_counts(self):
+        """Returns a dict (dpid, output port) -> number of flows"""
+        return dict(self._port_flows)
+
+    def entries(self, dpid=None):
+        """Iterate over tuples (dpid, src, dst, out_port)"""
+        get_mac = self.identities.get_mac
+        if dpid is None:
+            dpids = list(self._dpid_to_fdb.keys())
+        else:
+            dpids = [dpid] if dpid in self._dpid_to_fdb else []
+        for dpid in dpids:
+            for (src_id, dst_id), out_port in self._dpid_to_fdb[dpid].items():
+                yield (dpid, get_mac(src_id), get_mac(dst_id), out_port)
+
+    def branch_entries(self):
+        """Iterate over tuples (dpid, src, dst, branches) of the flows
+        replicating packets along a multicast tree"""
+        get_mac = self.identities.get_mac
+        for (dpid, src_id, dst_id), branches in self._branches.items():
+            yield (dpid, get_mac(src_id), get_mac(dst_id), list(branches))
+
+    def entry_ids(self):
+        """Iterate over tuples (dpid, src identity, dst identity, out_port)"""
         for dpid, fdb in self._dpid_to_fdb.items():
+            for (src_id, dst_id), out_port in fdb.items():
+                yield (dpid, src_id, dst_id, out_port)
+
+    def _dpid_dict(self, dpid):
+        view = self._dpid_dicts.get(dpid)
+        if view is None:
+            get_mac = self.identities.get_mac
             switch_fdb = []
-            for (src, dst), out_port in fdb.items():
-                switch_fdb.append({
-                    "src": src,
-                    "dst": dst,
+            for (src_id, dst_id), out_port in self._dpid_to_fdb[dpid].items():
+                entry = {
+                    "src": get_mac(src_id),
+                    "dst": get_mac(dst_id),
                     "out_port": out_port,
-                })
-            switches.append({
+                }
+                branches = self._branches.get((dpid, src_id, dst_id))
+                if branches:
+                    entry["branches"] = [list(branch) for branch in branches]
+                switch_fdb.append(entry)
+            view = self._dpid_dicts[dpid] = {
                 "dpid": dpid,
                 "fdb": switch_fdb,
-            })
+            }
+        return view
+
+    def to_dict(self):
+        """Convert this object to a JSON-serializable object
 
-        return switches
+        The result is cached until the FDB changes, and must not be
+        modified."""
+        if self._dict is None:
+            self._dict = [self._dpid_dict(dpid) for dpid in self._dpid_to_fdb]
+        return self._dict
@@ -4,28 +4,107 @@ from collections import deque
 # TODO Should not depend on a specific version of ofproto
 import ryu.ofproto.ofproto_v1_0 as ofproto
 
+from identity import identities as shared_identities
+from multicast import MulticastTree
+from records import (DatapathRecord, SwitchRecord, PortRecord, LinkRecord,
+                     HostRecord)
+
 
 class TopologyDB(object):
-    def __init__(self):
+    # Number of changes kept in the change log
+    CHANGELOG_SIZE = 4096
+    # Maximum number of equal-cost routes returned by find_route
+    MAX_ROUTES = 64
+
+    def __init__(self, identities=None):
         super(TopologyDB, self).__init__()
+        if identities is None:
+            identities = shared_identities
+        self.identities = identities
         # Switch DPID -> ryu.topology.switches.Switch
         # switches[dpid].dp is a Datapath
         # switches[dpid].ports[idx].port_no is a Port num
         self.switches = {}
         # Src switch DPID -> dst switch DPID -> ryu.topology.switches.Link
         self.links = {}
-        # MAC address -> ryu.topology.switches.Host
+        # MAC identity -> ryu.topology.switches.Host
         self.hosts = {}
+        # Incremented on every change to the topology
+        self.version = 0
+        # (version, change) of the latest changes, where change is a tuple
+        # (operation, args...) that can be passed to apply_change
+        self._changelog = deque(maxlen=self.CHANGELOG_SIZE)
+        # Cached to_dict() of each switch, link and host, dropped when the
+        # entity changes, and of the whole topology
+        self._switch_dicts = {}
+        self._link_dicts = {}
+        self._host_dicts = {}
+        self._dict = None
+        # Functions called with each change after it is logged
+        self.change_listeners = []
+
+    def _log_change(self, *change):
+        self.version += 1
+        self._changelog.append((self.version, change))
+        for listener in self.change_listeners:
+            listener(change)
+
+    def _invalidate(self, views, key):
+        views.pop(key, None)
+        self._dict = None
+
+    def _view(self, views, key, entity, current):
+        view = views.get(key)
+        if view is None:
+            view = entity.to_dict()
+            # Entities which are not (or no longer) in the topology, e.g.
+            # the switch of an EventSwitchLeave, are not cached
+            if entity is current:
+                views[key] = view
+        return view
 
     def add_host(self, host):
-        self.hosts[host.mac] = host
+        mac_id = self.identities.get_id(host.mac)
+        # A known host which moved keeps its reference to its identity
+        if mac_id not in self.hosts:
+            mac_id = self.identities.intern_mac(host.mac)
+        self.hosts[mac_id] = host
+        self._invalidate(self._host_dicts, mac_id)
+        self._log_change("add_host", host.mac, host.port.dpid,
+                         host.port.port_no)
+
+    def get_host(self, mac):
+        return self.hosts.get(self.identities.get_id(mac))
+
+    def delete_host(self, mac):
+        """Delete a host, returning it or None if it is unknown"""
+        mac_id = self.identities.get_id(mac)
+        host = self.hosts.pop(mac_id, None)
+        if host is not None:
+            self.identities.release(mac_id)
+            self._invalidate(self._host_dicts, mac_id)
+            self._log_change("delete_host", mac, host.port.dpid,
+                             host.port.port_no)
+        return host
+
+    def get_hosts_at(self, dpid, port_no):
+        """Returns the hosts attached to a switch port"""
+        return [host for host in self.hosts.values()
+                if host.port.dpid == dpid and host.port.port_no == port_no]
 
     def add_switch(self, switch):
+        if switch.dp.id not in self.switches:
+            self.identities.intern_dpid(switch.dp.id)
         self.switches[switch.dp.id] = switch
+        self._invalidate(self._switch_dicts, switch.dp.id)
+        self._log_change("add_switch", switch.dp.id)
 
     def delete_switch(self, switch):
         if switch.dp.id in self.switches:
             del self.switches[switch.dp.id]
+            self.identities.release(switch.dp.id)
+            self._invalidate(self._switch_dicts, switch.dp.id)
+            self._log_change("delete_switch", switch.dp.id)
 
     def add_link(self, link):
         src_dpid = link.src.dpid
@@ -33,6 +112,9 @@ class TopologyDB(object):
         if src_dpid not in self.links:
             self.links[src_dpid] = {}
         self.links[src_dpid][dst_dpid] = link
+        self._invalidate(self._link_dicts, (src_dpid, dst_dpid))
+        self._log_change("add_link", src_dpid, link.src.port_no,
+                         dst_dpid, link.dst.port_no)
 
     def delete_link(self, link):
         src_dpid = link.src.dpid
@@ -40,21 +122,95 @@ class TopologyDB(object):
         if src_dpid in self.links:
             if dst_dpid in self.links[src_dpid]:
                 del self.links[src_dpid][dst_dpid]
+                self._invalidate(self._link_dicts, (src_dpid, dst_dpid))
+                self._log_change("delete_link", src_dpid, link.src.port_no,
+                                 dst_dpid, link.dst.port_no)
 
-    def to_dict(self):
-        """Convert this object to a JSON-serializable object"""
-        switches = [switch.to_dict() for switch in self.switches.values()]
-        hosts = [host.to_dict() for host in self.hosts.values()]
-        links = []
+    def changes_since(self, version):
+        """Returns the list of changes made after version, or None if they
+        are not in the change log anymore"""
+        if version == self.version:
+            return []
+        if not self._changelog or self._changelog[0][0] > version + 1:
+            return None
+        return [change for (v, change) in self._changelog if v > version]
+
+    def dump_changes(self):
+        """Returns a list of changes that rebuilds this topology from an
+        empty TopologyDB"""
+        changes = [("add_switch", dpid) for dpid in self.switches]
         for dst_to_link in self.links.values():
             for link in dst_to_link.values():
-                links.append(link.to_dict())
+                changes.append(("add_link", link.src.dpid, link.src.port_no,
+                                link.dst.dpid, link.dst.port_no))
+        for host in self.hosts.values():
+            changes.append(("add_host", host.mac, host.port.dpid,
+                            host.port.port_no))
+        return changes
+
+    def apply_change(self, change):
+        """Apply a change taken from the change log of another TopologyDB"""
+        op = change[0]
+        if op == "add_switch":
+            self.add_switch(SwitchRecord(DatapathRecord(change[1])))
+        elif op == "delete_switch":
+            self.delete_switch(SwitchRecord(DatapathRecord(change[1])))
+        elif op == "add_link":
+            self.add_link(LinkRecord(PortRecord(change[1], change[2]),
+                                     PortRecord(change[3], change[4])))
+        elif op == "delete_link":
+            self.delete_link(LinkRecord(PortRecord(change[1], change[2]),
+                                        PortRecord(change[3], change[4])))
+        elif op == "add_host":
+            self.add_host(HostRecord(change[1],
+                                     PortRecord(change[2], change[3])))
+        elif op == "delete_host":
+            self.delete_host(change[1])
+        else:
+            raise ValueError("Unknown topology change: %s" % (op,))
 
-        return {
-            "switches": switches,
-            "links": links,
-            "hosts": hosts,
-        }
+    def switch_changed(self, dpid):
+        """Drop the cached view of a switch whose ports changed"""
+        self._invalidate(self._switch_dicts, dpid)
+
+    def switch_dict(self, switch):
+        """Cached switch.to_dict()"""
+        dpid = switch.dp.id
+        return self._view(self._switch_dicts, dpid, switch,
+                          self.switches.get(dpid))
+
+    def link_dict(self, link):
+        """Cached link.to_dict()"""
+        src_dpid = link.src.dpid
+        dst_dpid = link.dst.dpid
+        return self._view(self._link_dicts, (src_dpid, dst_dpid), link,
+                          self.links.get(src_dpid, {}).get(dst_dpid))
+
+    def host_dict(self, host):
+        """Cached host.to_dict()"""
+        mac_id = self.identities.get_id(host.mac)
+        return self._view(self._host_dicts, mac_id, host,
+                          self.hosts.get(mac_id))
+
+    def to_dict(self):
+        """Convert this object to a JSON-serializable object
+
+        The result is cached until the topology changes, and must not be
+        modified."""
+        if self._dict is None:
+            links = []
+            for dst_to_link in self.links.values():
+                for link in dst_to_link.values():
+                    links.append(self.link_dict(link))
+
+            self._dict = {
+                "switches": [self.switch_dict(switch)
+                             for switch in self.switches.values()],
+                "links": links,
+                "hosts": [self.host_dict(host)
+                          for host in self.hosts.values()],
+            }
+        return self._dict
 
     def _find_route_dfs(self, src_dpid, dst_dpid):
         """Find a route between two switches using DFS
@@ -84,47 +240,106 @@ class TopologyDB(object):
         return []
 
     def _find_routes_bfs(self, src_dpid, dst_dpid):
-        """Find a route between two switches using BFS
-        Returns a list of switches included in the route"""
-        # possible routers
-        routes = []
+        """Find all shortest routes between two switches using BFS
+        Returns a list of at most MAX_ROUTES lists of switches included in
+        the routes"""
+        # hop count from src
+        distances = {src_dpid: 0}
+        # switch -> previous switches on the shortest paths from src
+        parents = {src_dpid: []}
+        frontier = [src_dpid]
+        while frontier and dst_dpid not in distances:
+            next_frontier = []
+            for dpid in frontier:
+                # check if switch has outgoing links
+                if dpid not in self.links:
+                    continue
+                for next_dpid in sorted(self.links[dpid].keys()):
+                    if next_dpid not in distances:
+                        distances[next_dpid] = distances[dpid] + 1
+                        parents[next_dpid] = [dpid]
+                        next_frontier.append(next_dpid)
+                    elif distances[next_dpid] == distances[dpid] + 1:
+                        parents[next_dpid].append(dpid)
+            frontier = next_frontier
 
-        # intermediate paths
-        paths = deque()
-        paths.append([src_dpid])
-        while paths:
-            current_path = paths.popleft()
+        # dst is unreachable from src
+        if dst_dpid not in distances:
+            return []
+
+        # walk back from dst to src along the shortest paths
+        routes = []
+        paths = [[dst_dpid]]
+        while paths and len(routes) < self.MAX_ROUTES:
+            current_path = paths.pop()
             dpid = current_path[-1]
-            # we have reached the goal
-            if dpid == dst_dpid:
-                routes.append(current_path)
-                continue
-            # check if switch has outgoing links
-            if dpid not in self.links:
+            if dpid == src_dpid:
+                routes.append(current_path[::-1])
                 continue
-            # loop through outgoing links
-            for next_dpid in sorted(self.links[dpid].keys()):
-                # if the link is connected to an unvisited switch
-                if next_dpid not in current_path:
-                    next_path = list(current_path)
-                    next_path.append(next_dpid)
-                    paths.append(next_path)
+            for parent in reversed(parents[dpid]):
+                paths.append(current_path + [parent])
 
-        # dst is unreachable from src
-        if not routes:
-            return routes
+        return routes
 
-        # calculate shortest path cost
-        routes.sort(key=len)
-        shortest_cost = len(routes[0])
+    def _shortest_path_tree(self, root_dpid):
+        """Returns a dict switch -> previous switch on a shortest path from
+        root_dpid, for every switch reachable from it"""
+        parents = {root_dpid: None}
+        frontier = [root_dpid]
+        while frontier:
+            next_frontier = []
+            for dpid in frontier:
+                # check if switch has outgoing links
+                if dpid not in self.links:
+                    continue
+                for next_dpid in sorted(self.links[dpid].keys()):
+                    if next_dpid not in parents:
+                        parents[next_dpid] = dpid
+                        next_frontier.append(next_dpid)
+            frontier = next_frontier
+        return parents
 
-        # only return the path with shortest cost
-        return [route for route in routes if len(route) == shortest_cost]
+    def find_multicast_tree(self, src_mac, dst_macs):
+        """Find a tree from a host to hosts along shortest paths
+        Returns a MulticastTree, or None if src is unknown. Unknown and
+        unreachable dst hosts are left out of the tree"""
+        src_host = self.get_host(src_mac)
+        if src_host is None:
+            return None
 
-    def _mac_to_int(self, mac):
-        return int(mac.replace(":", ""), 16)
+        root_dpid = src_host.port.dpid
+        parents = self._shortest_path_tree(root_dpid)
 
-    def _route_to_fdb(self, route, is_local_dst, dst_dpid, dst_mac):
+        # DPID -> set of (output port, dst MAC)
+        ports = {}
+        receivers = []
+        unicast_links = 0
+        for dst_mac in sorted(set(dst_macs)):
+            dst_host = self.get_host(dst_mac)
+            if dst_host is None or dst_mac == src_mac:
+                continue
+            dst_dpid = dst_host.port.dpid
+            # Replicating to the ingress port is not supported
+            if dst_host.port == src_host.port or dst_dpid not in parents:
+                continue
+
+            receivers.append(dst_mac)
+            ports.setdefault(dst_dpid, set()).add(
+                (dst_host.port.port_no, dst_mac))
+            unicast_links += 1
+            dpid = dst_dpid
+            while parents[dpid] is not None:
+                parent = parents[dpid]
+                port_no = self.links[parent][dpid].src.port_no
+                ports.setdefault(parent, set()).add((port_no, None))
+                unicast_links += 1
+                dpid = parent
+
+        return MulticastTree(dict((dpid, list(dpid_ports))
+                                  for dpid, dpid_ports in ports.items()),
+                             receivers, unicast_links)
+
+    def _route_to_fdb(self, route, is_local_dst, dst_dpid, dst_id):
         fdb = []
         for idx, dpid in enumerate(route[:-1]):
             fdb.append((dpid, self.links[dpid][route[idx+1]].src.port_no))
@@ -133,37 +348,36 @@ class TopologyDB(object):
         if is_local_dst:
             fdb.append((dst_dpid, ofproto.OFPP_LOCAL))
         else:
-            fdb.append((dst_dpid, self.hosts[dst_mac].port.port_no))
+            fdb.append((dst_dpid, self.hosts[dst_id].port.port_no))
 
         return fdb
 
     def find_route(self, src_mac, dst_mac, multiple=False):
         """Find a route between two hosts using depth-first search
         Returns a list of tuples (datapath id, output port)"""
+        src_id = self.identities.get_id(src_mac)
+        dst_id = self.identities.get_id(dst_mac)
+
         # Check if src/dst is a switch local port
-        is_local_src = False
-        is_local_dst = False
-        if self._mac_to_int(src_mac) in self.switches:
-            is_local_src = True
-        if self._mac_to_int(dst_mac) in self.switches:
-            is_local_dst = True
+        is_local_src = src_id in self.switches
+        is_local_dst = dst_id in self.switches
 
         # Check if src/dst host exist
-        if not is_local_src and src_mac not in self.hosts:
+        if not is_local_src and src_id not in self.hosts:
             return []
-        elif not is_local_dst and dst_mac not in self.hosts:
+        elif not is_local_dst and dst_id not in self.hosts:
             return []
 
         # Get src/dst edge switches
         if is_local_src:
-            src_dpid = self._mac_to_int(src_mac)
+            src_dpid = src_id
         else:
-            src_dpid = self.hosts[src_mac].port.dpid
+            src_dpid = self.hosts[src_id].port.dpid
 
         if is_local_dst:
-            dst_dpid = self._mac_to_int(dst_mac)
+            dst_dpid = dst_id
         else:
-            dst_dpid = self.hosts[dst_mac].port.dpid
+            dst_dpid = self.hosts[dst_id].port.dpid
 
         if multiple:
             # Perform breadth-first search to find a route from src to dst
@@ -174,7 +388,7 @@ class TopologyDB(object):
             fdbs = []
             for route in routes:
                 fdb = self._route_to_fdb(route, is_local_dst, dst_dpid,
-                                         dst_mac)
+                                         dst_id)
                 fdbs.append(fdb)
 
             return fdbs
@@ -184,5 +398,5 @@ class TopologyDB(object):
             if not route:
                 return []
 
-            fdb = self._route_to_fdb(route, is_local_dst, dst_dpid, dst_mac)
+            fdb = self._route_to_fdb(route, is_local_dst, dst_dpid, dst_id)
             return fdb
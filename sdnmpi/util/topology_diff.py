@@ -0,0 +1,156 @@
+class TopologyDiff(object):
+    """Net changes of a topology between two versions
+
+    Links are tuples (src DPID, src port, dst DPID, dst port) and hosts
+    tuples (MAC, DPID, port). A link or host whose ports changed is both
+    removed and added."""
+    def __init__(self, since, version):
+        super(TopologyDiff, self).__init__()
+        self.since = since
+        self.version = version
+        self.added_switches = set()
+        self.removed_switches = set()
+        self.added_links = set()
+        self.removed_links = set()
+        self.added_hosts = set()
+        self.removed_hosts = set()
+
+    def __nonzero__(self):
+        return bool(self.added_switches or self.removed_switches or
+                    self.added_links or self.removed_links or
+                    self.added_hosts or self.removed_hosts)
+
+    __bool__ = __nonzero__
+
+    def affected_pairs(self, routes=()):
+        """(src DPID, dst DPID) of the switch pairs whose routes may have
+        changed: the ends of the links that were added or removed, and the
+        first and last switches of the routes crossing a removed link or
+        switch. routes are lists of (DPID, output port) hops, e.g. the
+        routes installed by Router."""
+        pairs = set((link[0], link[2])
+                    for link in self.added_links | self.removed_links)
+        removed_ports = set((link[0], link[1])
+                            for link in self.removed_links)
+        for route in routes:
+            if any(hop in removed_ports or hop[0] in self.removed_switches
+                   for hop in route):
+                pairs.add((route[0][0], route[-1][0]))
+        return pairs
+
+    def to_dict(self):
+        """Convert this object to a JSON-serializable object"""
+        return {
+            "since": self.since,
+            "version": self.version,
+            "added_switches": sorted(self.added_switches),
+            "removed_switches": sorted(self.removed_switches),
+            "added_links": sorted(self.added_links),
+            "removed_links": sorted(self.removed_links),
+            "added_hosts": sorted(self.added_hosts),
+            "removed_hosts": sorted(self.removed_hosts),
+            "affected_pairs": sorted(self.affected_pairs()),
+        }
+
+
+class TopologyDiffer(object):
+    """Computes the net changes of a TopologyDB since the previous diff
+
+    The state of the topology at the previous diff is kept, and only the
+    switches, links and hosts named by the change log since then are
+    compared with the current topology. A link that flapped several times
+    between two diffs is therefore reported once, or not at all if it
+    ended up as it was."""
+    def __init__(self, topologydb):
+        super(TopologyDiffer, self).__init__()
+        self.topologydb = topologydb
+        # Version of the topology at the previous diff
+        self.version = topologydb.version
+        # State of the topology at the previous diff
+        self._switches = set(topologydb.switches)
+        self._links = {}
+        for (src_dpid, dst_dpid) in self._all_link_keys():
+            self._links[(src_dpid, dst_dpid)] = self._link(src_dpid, dst_dpid)
+        self._hosts = {}
+        for host in topologydb.hosts.values():
+            self._hosts[host.mac] = (host.port.dpid, host.port.port_no)
+
+    def _all_link_keys(self):
+        return [(src_dpid, dst_dpid)
+                for src_dpid, dst_to_link in self.topologydb.links.items()
+                for dst_dpid in dst_to_link]
+
+    def _link(self, src_dpid, dst_dpid):
+        """Returns the current (src port, dst port) of a link, or None"""
+        link = self.topologydb.links.get(src_dpid, {}).get(dst_dpid)
+        if link is None:
+            return None
+        return (link.src.port_no, link.dst.port_no)
+
+    def _host(self, mac):
+        """Returns the current (DPID, port) of a host, or None"""
+        host = self.topologydb.get_host(mac)
+        if host is None:
+            return None
+        return (host.port.dpid, host.port.port_no)
+
+    def diff(self):
+        """Returns the TopologyDiff since the previous diff"""
+        topologydb = self.topologydb
+        diff = TopologyDiff(self.version, topologydb.version)
+
+        changes = topologydb.changes_since(self.version)
+        if changes is None:
+            # The change log was truncated: compare everything
+            switch_keys = self._switches | set(topologydb.switches)
+            link_keys = set(self._links) | set(self._all_link_keys())
+            host_keys = set(self._hosts) | set(
+                host.mac for host in topologydb.hosts.values())
+        else:
+            switch_keys = set()
+            link_keys = set()
+            host_keys = set()
+            for change in changes:
+                op = change[0]
+                if op in ("add_switch", "delete_switch"):
+                    switch_keys.add(change[1])
+                elif op in ("add_link", "delete_link"):
+                    link_keys.add((change[1], change[3]))
+                elif op in ("add_host", "delete_host"):
+                    host_keys.add(change[1])
+
+        for dpid in switch_keys:
+            was_present = dpid in self._switches
+            is_present = dpid in topologydb.switches
+            if is_present and not was_present:
+                diff.added_switches.add(dpid)
+                self._switches.add(dpid)
+            elif was_present and not is_present:
+                diff.removed_switches.add(dpid)
+                self._switches.discard(dpid)
+
+        for key in link_keys:
+            self._update(self._links, key, self._link(*key),
+                         diff.added_links, diff.removed_links,
+                         lambda key, ports: (key[0], ports[0],
+                                             key[1], ports[1]))
+
+        for mac in host_keys:
+            self._update(self._hosts, mac, self._host(mac),
+                         diff.added_hosts, diff.removed_hosts,
+                         lambda mac, port: (mac,) + port)
+
+        self.version = topologydb.version
+        return diff
+
+    def _update(self, state, key, current, added, removed, entry):
+        previous = state.get(key)
+        if previous == current:
+            return
+        if previous is not None:
+            removed.add(entry(key, previous))
+        if current is not None:
+            added.add(entry(key, current))
+            state[key] = current
+        else:
+            del state[key]
@@ -0,0 +1,104 @@
+import struct
+
+_SDN_MPI_ADDR = struct.Struct("<Bxhh")
+
+# Prefix of the IPv6 multicast MAC addresses
+_IPV6_MULTICAST_PREFIX = b"\x33\x33"
+
+
+def decode_sdn_mpi_addr(mac_bin):
+    """Returns (src_rank, dst_rank, coll_type) encoded in a binary SDN-MPI
+    address, or None if mac_bin is not an SDN-MPI address
+
+    SDN-MPI addresses are locally administered unicast addresses, so
+    broadcast and multicast addresses are never decoded."""
+    coll, src_rank, dst_rank = _SDN_MPI_ADDR.unpack(mac_bin)
+    if (not coll & 0x02 or coll & 0x01 or
+            mac_bin.startswith(_IPV6_MULTICAST_PREFIX)):
+        return None
+    return (src_rank, dst_rank, coll >> 2)
+
+
+class TrafficMatrix(object):
+    """Traffic between MPI ranks, computed from the counters of the flows
+    installed for SDN-MPI addresses
+
+    Every switch on the route of a (src_rank, dst_rank, coll_type) key has
+    a flow for it, so the traffic of a key is the largest counter among
+    those switches rather than their sum."""
+    def __init__(self):
+        super(TrafficMatrix, self).__init__()
+        # DPID -> key -> (byte count, packet count)
+        self._dpid_flows = {}
+        # key -> [byte count, packet count, bytes/sec]
+        self._entries = {}
+        # Time of the last refresh
+        self.timestamp = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def update_datapath(self, dpid, flows):
+        """Replace the flow counters of a switch with flows, a dict
+        key -> (byte count, packet count)"""
+        self._dpid_flows[dpid] = flows
+
+    def delete_datapath(self, dpid):
+        self._dpid_flows.pop(dpid, None)
+
+    def refresh(self, timestamp):
+        """Recompute the matrix from the flow counters, returning the keys
+        that changed and the keys that were deleted"""
+        totals = {}
+        for flows in self._dpid_flows.values():
+            for key, counts in flows.items():
+                total = totals.get(key)
+                if total is None or counts[0] > total[0]:
+                    totals[key] = counts
+
+        time_delta = 0.0
+        if self.timestamp is not None:
+            time_delta = timestamp - self.timestamp
+        self.timestamp = timestamp
+
+        changed = []
+        for key, (byte_count, packet_count) in totals.items():
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [byte_count, packet_count, 0.0]
+                changed.append(key)
+                continue
+
+            # Counters go backwards when the flows are reinstalled
+            rate = 0.0
+            if time_delta > 0 and byte_count >= entry[0]:
+                rate = (byte_count - entry[0]) / time_delta
+            if entry[0] != byte_count or entry[2] != rate:
+                changed.append(key)
+            entry[0] = byte_count
+            entry[1] = packet_count
+            entry[2] = rate
+
+        deleted = [key for key in self._entries if key not in totals]
+        for key in deleted:
+            del self._entries[key]
+        return changed, deleted
+
+    def get(self, src_rank, dst_rank, coll_type=0):
+        """Returns (byte count, packet count, bytes/sec), or None"""
+        entry = self._entries.get((src_rank, dst_rank, coll_type))
+        if entry is None:
+            return None
+        return tuple(entry)
+
+    def hotspots(self, count):
+        """Returns the keys of the count entries with the highest rate"""
+        keys = sorted(self._entries, key=lambda key: -self._entries[key][2])
+        return keys[:count]
+
+    def to_rows(self, keys=None):
+        """Convert entries to a list of JSON-serializable rows
+        [src_rank, dst_rank, coll_type, bytes, packets, bytes/sec]"""
+        if keys is None:
+            keys = self._entries.keys()
+        return [list(key) + self._entries[key] for key in keys]
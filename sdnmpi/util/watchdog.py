@@ -0,0 +1,83 @@
+import traceback
+
+
+def find_handler(frame, loop_name="_event_loop"):
+    """Returns the name of the event handler running in the stack of frame,
+    which is the function called by the frame of loop_name, or None"""
+    callee = None
+    while frame is not None:
+        if frame.f_code.co_name == loop_name:
+            if callee is None:
+                return None
+            obj = callee.f_locals.get("self")
+            if obj is not None:
+                return "%s.%s" % (obj.__class__.__name__,
+                                  callee.f_code.co_name)
+            return callee.f_code.co_name
+        callee = frame
+        frame = frame.f_back
+    return None
+
+
+def format_stack(frame, limit):
+    return "".join(traceback.format_stack(frame, limit))
+
+
+class WatchdogStats(object):
+    """Statistics of the scheduling lag of a hub and of its stalls"""
+    def __init__(self):
+        super(WatchdogStats, self).__init__()
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        # App name -> current / maximum event queue length
+        self.queue_lengths = {}
+        self.max_queue_lengths = {}
+        # Handler name -> [number of stalls, longest stall]
+        self.stalls = {}
+        # (handler, duration, stack) of the last stall
+        self.last_stall = None
+
+    def add_lag(self, lag):
+        self.samples += 1
+        self.last_lag = lag
+        self.total_lag += lag
+        if lag > self.max_lag:
+            self.max_lag = lag
+
+    def set_queue_length(self, name, length):
+        self.queue_lengths[name] = length
+        if length > self.max_queue_lengths.get(name, 0):
+            self.max_queue_lengths[name] = length
+
+    def add_stall(self, handler, duration, stack):
+        handler = handler or "unknown"
+        stall = self.stalls.setdefault(handler, [0, 0.0])
+        stall[0] += 1
+        stall[1] = max(stall[1], duration)
+        self.last_stall = (handler, duration, stack)
+
+    def to_dict(self):
+        """Convert this object to a JSON-serializable object"""
+        last_stall = None
+        if self.last_stall is not None:
+            handler, duration, stack = self.last_stall
+            last_stall = {
+                "handler": handler,
+                "duration": duration,
+                "stack": stack,
+            }
+
+        return {
+            "samples": self.samples,
+            "lag": self.last_lag,
+            "max_lag": self.max_lag,
+            "mean_lag": self.total_lag / self.samples if self.samples else 0.0,
+            "queue_lengths": dict(self.queue_lengths),
+            "max_queue_lengths": dict(self.max_queue_lengths),
+            "stalls": dict((handler, {"count": count, "max_duration": longest})
+                           for handler, (count, longest)
+                           in self.stalls.items()),
+            "last_stall": last_stall,
+        }
@@ -0,0 +1,113 @@
+import json
+import sys
+import time
+
+from eventlet import patcher
+from webob import Response
+
+from ryu import cfg
+from ryu.base import app_manager
+from ryu.app.wsgi import ControllerBase, WSGIApplication, route
+from ryu.lib import hub
+
+from util.watchdog import WatchdogStats, find_handler, format_stack
+
+# The watcher must be an OS thread so that it keeps running while a
+# handler blocks the hub
+_threading = patcher.original("threading")
+_thread = patcher.original("thread")
+_time = patcher.original("time")
+
+CONF = cfg.CONF
+CONF.register_opts([
+    cfg.FloatOpt("watchdog_interval", default=0.1,
+                 help="seconds between hub lag measurements"),
+    cfg.FloatOpt("watchdog_stall_threshold", default=0.5,
+                 help="seconds the hub may stay blocked before the stack "
+                      "of the blocking handler is sampled"),
+    cfg.IntOpt("watchdog_stack_depth", default=20,
+               help="number of frames of the sampled stacks"),
+])
+
+
+class Watchdog(app_manager.RyuApp):
+    """Measures how long handlers keep the hub from scheduling greenthreads
+
+    A greenthread sleeps for watchdog_interval and records how late it wakes
+    up, along with the event queue length of every app. An OS thread checks
+    the heartbeat of that greenthread; when it is older than
+    watchdog_stall_threshold, the hub is blocked and the OS thread samples
+    its stack to find the handler responsible."""
+    _CONTEXTS = {
+        "wsgi": WSGIApplication,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super(Watchdog, self).__init__(*args, **kwargs)
+        self.interval = CONF.watchdog_interval
+        self.threshold = CONF.watchdog_stall_threshold
+        self.stats = WatchdogStats()
+        # Time of the last wakeup of the lag greenthread
+        self.heartbeat = time.time()
+        # Identifier of the OS thread running the hub
+        self.hub_thread_id = None
+        # (heartbeat, handler, stack) sampled during the current stall
+        self.stall_sample = None
+
+        wsgi = kwargs["wsgi"]
+        wsgi.register(WatchdogController, {"app": self})
+
+        self.lag_thread = hub.spawn(self._lag_loop)
+        self.watcher = _threading.Thread(target=self._watch)
+        self.watcher.daemon = True
+        self.watcher.start()
+
+    def _lag_loop(self):
+        self.hub_thread_id = _thread.get_ident()
+        while True:
+            before = time.time()
+            hub.sleep(self.interval)
+            self.heartbeat = now = time.time()
+            lag = max(0.0, now - before - self.interval)
+            self.stats.add_lag(lag)
+
+            for name, app in app_manager.SERVICE_BRICKS.items():
+                self.stats.set_queue_length(name, app.events.qsize())
+
+            sample = self.stall_sample
+            if lag > self.threshold and sample is not None:
+                self.stall_sample = None
+                self.stats.add_stall(sample[1], lag, sample[2])
+                self.logger.warning("Hub blocked for %.3fs by %s", lag,
+                                    sample[1] or "unknown handler")
+
+    def _watch(self):
+        while True:
+            _time.sleep(self.interval)
+            heartbeat = self.heartbeat
+            if time.time() - heartbeat < self.threshold:
+                continue
+            if self.stall_sample is not None and \
+                    self.stall_sample[0] == heartbeat:
+                continue
+
+            frame = sys._current_frames().get(self.hub_thread_id)
+            if frame is None:
+                continue
+            stack = format_stack(frame, CONF.watchdog_stack_depth)
+            handler = find_handler(frame)
+            self.stall_sample = (heartbeat, handler, stack)
+            self.logger.warning("Hub blocked for more than %.3fs by %s:\n%s",
+                                self.threshold, handler or "unknown handler",
+                                stack)
+
+
+class WatchdogController(ControllerBase):
+    def __init__(self, req, link, data, **config):
+        super(WatchdogController, self).__init__(req, link, data, **config)
+        self.app = data["app"]
+
+    @route("watchdog", "/v1.0/sdnmpi/watchdog", methods=["GET"])
+    def _stats_handler(self, req, **kwargs):
+        body = json.dumps(self.app.stats.to_dict())
+        return Response(content_type="application/json", body=body)
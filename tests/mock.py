@@ -1,13 +1,9 @@
-class MockDatapath(object):
-    def __init__(self, id):
-        super(MockDatapath, self).__init__()
-        self.id = id
+from sdnmpi.util.fakes import FakeDatapath, FakeSwitch
 
 
-class MockSwitch(object):
+class MockSwitch(FakeSwitch):
     def __init__(self, id):
-        super(MockSwitch, self).__init__()
-        self.dp = MockDatapath(id)
+        super(MockSwitch, self).__init__(FakeDatapath(id))
 
 
 class MockPort(object):
@@ -16,6 +12,18 @@ class MockPort(object):
         self.dpid = dpid
         self.port_no = port_no
 
+    def is_reserved(self):
+        return False
+
+    def __eq__(self, other):
+        return self.dpid == other.dpid and self.port_no == other.port_no
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self.dpid, self.port_no))
+
 
 class MockHost(object):
     def __init__(self, mac, port):
@@ -0,0 +1,92 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.admission import RateLimiter, PendingTable
+
+
+class MockClock(object):
+    def __init__(self):
+        super(MockClock, self).__init__()
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTestCase(TestCase):
+    def setUp(self):
+        self.clock = MockClock()
+        self.limiter = RateLimiter(10, 5, self.clock)
+
+    def test_burst(self):
+        admitted = [self.limiter.admit("a") for _ in range(10)]
+        eq_(admitted.count(True), 5)
+
+    def test_refill(self):
+        for _ in range(5):
+            self.limiter.admit("a")
+        ok_(not self.limiter.admit("a"))
+        self.clock.now += 0.1
+        ok_(self.limiter.admit("a"))
+        ok_(not self.limiter.admit("a"))
+
+    def test_independent_keys(self):
+        for _ in range(5):
+            self.limiter.admit("a")
+        ok_(not self.limiter.admit("a"))
+        ok_(self.limiter.admit("b"))
+
+    def test_evict_idle(self):
+        limiter = RateLimiter(10, 5, self.clock, max_keys=4)
+        for key in range(4):
+            limiter.admit(key)
+        self.clock.now += 0.5
+        limiter.admit("a")
+        eq_(len(limiter), 1)
+
+    def test_evict_least_recently_used(self):
+        limiter = RateLimiter(10, 5, self.clock, max_keys=4)
+        for key in range(4):
+            limiter.admit(key)
+            self.clock.now += 0.1
+        limiter.admit("a")
+        eq_(len(limiter), 3)
+        for _ in range(5):
+            limiter.admit("a")
+        # The bucket of "a" was kept
+        ok_(not limiter.admit("a"))
+
+
+class PendingTableTestCase(TestCase):
+    def setUp(self):
+        self.clock = MockClock()
+        self.pending = PendingTable(1, self.clock)
+
+    def test_dedup(self):
+        ok_(self.pending.add(("a", "b")))
+        ok_(not self.pending.add(("a", "b")))
+        ok_(("a", "b") in self.pending)
+        self.pending.remove(("a", "b"))
+        ok_(self.pending.add(("a", "b")))
+
+    def test_expire(self):
+        self.pending.add(("a", "b"))
+        self.clock.now += 1
+        ok_(("a", "b") not in self.pending)
+        ok_(self.pending.add(("a", "b")))
+        self.clock.now += 1
+        eq_(self.pending.expire(), [("a", "b")])
+        eq_(len(self.pending), 0)
+
+    def test_expire_in_order(self):
+        self.pending.add(("a", "b"))
+        self.clock.now += 0.5
+        self.pending.add(("c", "d"))
+        self.pending.add(("e", "f"))
+        self.pending.remove(("e", "f"))
+        self.clock.now += 0.5
+        eq_(self.pending.expire(), [("a", "b")])
+        ok_(("c", "d") in self.pending)
+        self.clock.now += 0.5
+        eq_(self.pending.expire(), [("c", "d")])
+        eq_(self.pending.expire(), [])
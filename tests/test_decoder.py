@@ -0,0 +1,56 @@
+import struct
+from unittest import TestCase
+from nose.tools import eq_
+
+from sdnmpi.protocol import decoder
+
+SRC = b"\x04\x00\x00\x00\x00\x01"
+MAC2 = b"\x04\x00\x00\x00\x00\x02"
+
+
+def make_frame(payload, dst=b"\xff" * 6, ethertype=0x0800, proto=17,
+               dst_port=61000, ihl=5):
+    options = b"\x00" * ((ihl - 5) * 4)
+    ip = struct.pack("!BBHHHBBH4s4s", 0x40 | ihl, 0, 0, 0, 0, 64, proto, 0,
+                     b"\x00" * 4, b"\xff" * 4) + options
+    udp = struct.pack("!HHHH", dst_port, dst_port, 8 + len(payload), 0)
+    return dst + SRC + struct.pack("!H", ethertype) + ip + udp + payload
+
+
+class DecoderTestCase(TestCase):
+    def test_announcement(self):
+        data = make_frame(struct.pack("<ii", decoder.LAUNCH, 7))
+        offset = decoder.payload_offset(data)
+        eq_(offset, 42)
+        eq_(decoder.announcement_type(data, offset), decoder.LAUNCH)
+        eq_(decoder.decode_announcement(data, offset), (decoder.LAUNCH, 7))
+        eq_(decoder.src_mac(data), "04:00:00:00:00:01")
+
+    def test_ip_options(self):
+        data = make_frame(struct.pack("<ii", decoder.EXIT, 3), ihl=6)
+        offset = decoder.payload_offset(data)
+        eq_(decoder.decode_announcement(data, offset), (decoder.EXIT, 3))
+
+    def test_not_announcement(self):
+        payload = struct.pack("<ii", decoder.LAUNCH, 7)
+        eq_(decoder.payload_offset(make_frame(payload, dst=MAC2)), None)
+        eq_(decoder.payload_offset(make_frame(payload, ethertype=0x86dd)),
+            None)
+        eq_(decoder.payload_offset(make_frame(payload, proto=6)), None)
+        eq_(decoder.payload_offset(make_frame(payload, dst_port=5000)), None)
+        eq_(decoder.payload_offset(SRC), None)
+
+    def test_batch(self):
+        payload = struct.pack("<iII", decoder.LAUNCH_BATCH, 9, 2)
+        payload += struct.pack("<i6s", 0, SRC) + struct.pack("<i6s", 1, MAC2)
+        data = make_frame(payload)
+        offset = decoder.payload_offset(data)
+        eq_(decoder.decode_batch(data, offset),
+            (decoder.LAUNCH_BATCH, 9,
+             [(0, "04:00:00:00:00:01"), (1, "04:00:00:00:00:02")]))
+
+    def test_truncated_batch(self):
+        payload = struct.pack("<iII", decoder.LAUNCH_BATCH, 9, 2)
+        payload += struct.pack("<i6s", 0, SRC)
+        data = make_frame(payload)
+        eq_(decoder.decode_batch(data, decoder.payload_offset(data)), None)
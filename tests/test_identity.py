@@ -0,0 +1,42 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.identity import (IdentityTable, frame_ids, int_to_mac,
+                                  mac_to_int)
+
+
+class IdentityTableTestCase(TestCase):
+    def setUp(self):
+        self.identities = IdentityTable()
+
+    def test_mac_conversion(self):
+        eq_(mac_to_int("02:00:00:00:01:0a"), 0x02000000010a)
+        eq_(int_to_mac(0x02000000010a), "02:00:00:00:01:0a")
+
+    def test_intern_mac(self):
+        mac_id = self.identities.intern_mac("02:00:00:00:00:01")
+        eq_(mac_id, 0x020000000001)
+        eq_(self.identities.get_id("02:00:00:00:00:01"), mac_id)
+        eq_(self.identities.get_mac(mac_id), "02:00:00:00:00:01")
+        eq_(len(self.identities), 1)
+
+    def test_intern_dpid(self):
+        eq_(self.identities.intern_dpid(4), 4)
+        eq_(self.identities.get_id("00:00:00:00:00:04"), 4)
+
+    def test_unknown_mac(self):
+        ok_(self.identities.get_id("02:00:00:00:00:01") is None)
+
+    def test_release(self):
+        mac_id = self.identities.intern_mac("02:00:00:00:00:01")
+        self.identities.intern_mac("02:00:00:00:00:01")
+        self.identities.release(mac_id)
+        eq_(self.identities.get_id("02:00:00:00:00:01"), mac_id)
+        self.identities.release(mac_id)
+        ok_(self.identities.get_id("02:00:00:00:00:01") is None)
+        eq_(len(self.identities), 0)
+        eq_(self.identities.get_mac(mac_id), "02:00:00:00:00:01")
+
+    def test_frame_ids(self):
+        frame = b"\x02\x00\x00\x00\x01\x0a\x04\x00\x00\x00\x00\x01\x08\x00"
+        eq_(frame_ids(frame), (0x02000000010a, 0x040000000001))
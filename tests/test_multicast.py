@@ -0,0 +1,23 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.multicast import (MulticastTree, is_multicast, ALL_RANKS,
+                                   COLL_NONE, COLL_BCAST, COLL_ALLGATHER)
+
+MAC1 = "02:00:00:00:00:01"
+MAC2 = "02:00:00:00:00:02"
+
+
+class MulticastTestCase(TestCase):
+    def test_is_multicast(self):
+        ok_(is_multicast(COLL_BCAST, ALL_RANKS))
+        ok_(is_multicast(COLL_ALLGATHER, ALL_RANKS))
+        ok_(not is_multicast(COLL_NONE, ALL_RANKS))
+        ok_(not is_multicast(COLL_BCAST, 1))
+
+    def test_actions_rewrite_last(self):
+        tree = MulticastTree({1: [(3, MAC2), (2, None), (1, MAC1)]},
+                             [MAC1, MAC2], 3)
+        eq_(tree.actions(1), [(2, None), (1, MAC1), (3, MAC2)])
+        eq_(tree.actions(2), [])
+        eq_(tree.links, 3)
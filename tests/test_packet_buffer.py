@@ -0,0 +1,48 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.packet_buffer import PacketBufferPool
+
+NO_BUFFER = 0xffffffff
+
+
+class PacketBufferPoolTestCase(TestCase):
+    def setUp(self):
+        self.pool = PacketBufferPool(4, 16, 3)
+        self.sent = []
+
+    def _send(self, dpid, in_port, buffer_id, data):
+        self.sent.append((dpid, in_port, buffer_id,
+                          None if data is None else data.tobytes()))
+
+    def test_release_in_order(self):
+        ok_(self.pool.add("a", 1, 2, NO_BUFFER, b"first"))
+        ok_(self.pool.add("a", 1, 3, 7))
+        ok_(self.pool.add("a", 2, 1, NO_BUFFER, b"second"))
+        eq_(len(self.pool), 3)
+        eq_(self.pool.free_slots, 2)
+
+        eq_(self.pool.release("a", self._send), 3)
+        eq_(self.sent, [(1, 2, NO_BUFFER, b"first"), (1, 3, 7, None),
+                        (2, 1, NO_BUFFER, b"second")])
+        eq_(len(self.pool), 0)
+        eq_(self.pool.free_slots, 4)
+        eq_(self.pool.release("a", self._send), 0)
+
+    def test_bounded(self):
+        ok_(not self.pool.add("a", 1, 1, NO_BUFFER, b"x" * 17))
+        for _ in range(3):
+            ok_(self.pool.add("a", 1, 1, NO_BUFFER, b"x"))
+        ok_(not self.pool.add("a", 1, 1, NO_BUFFER, b"x"))
+        ok_(self.pool.add("b", 1, 1, NO_BUFFER, b"y"))
+        ok_(not self.pool.add("c", 1, 1, NO_BUFFER, b"z"))
+        # Packets buffered by the switch take no slot
+        ok_(self.pool.add("c", 1, 1, 5))
+
+    def test_slots_reused(self):
+        for key in range(10):
+            ok_(self.pool.add(key, 1, 1, NO_BUFFER, b"%d" % key))
+            eq_(self.pool.discard(key), 1)
+        self.pool.add("a", 1, 1, NO_BUFFER, b"last")
+        self.pool.release("a", self._send)
+        eq_(self.sent, [(1, 1, NO_BUFFER, b"last")])
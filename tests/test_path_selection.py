@@ -0,0 +1,51 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.switch_fdb import SwitchFDB
+from sdnmpi.util.path_selection import (HashPathPolicy, RoundRobinPathPolicy,
+                                        LeastLoadedPathPolicy)
+
+MAC1 = "04:00:00:00:00:01"
+MAC2 = "04:00:00:00:00:02"
+
+ROUTE1 = [(1, 2), (2, 3), (4, 1)]
+ROUTE2 = [(1, 3), (3, 2), (4, 1)]
+
+
+class PathPolicyTestCase(TestCase):
+    def test_hash_is_deterministic(self):
+        policy = HashPathPolicy()
+        eq_(policy.select([ROUTE1, ROUTE2], 0, 1),
+            policy.select([ROUTE2, ROUTE1], 0, 1))
+
+    def test_hash_spreads(self):
+        policy = HashPathPolicy()
+        selected = [policy.select([ROUTE1, ROUTE2], src, dst)
+                    for src in range(8) for dst in range(8)]
+        ok_(abs(selected.count(ROUTE1) - selected.count(ROUTE2)) < 16)
+
+    def test_round_robin(self):
+        policy = RoundRobinPathPolicy()
+        eq_(policy.select([ROUTE2, ROUTE1], 0, 1), ROUTE1)
+        eq_(policy.select([ROUTE2, ROUTE1], 0, 2), ROUTE2)
+        eq_(policy.select([ROUTE2, ROUTE1], 0, 3), ROUTE1)
+
+    def test_least_loaded(self):
+        fdb = SwitchFDB()
+        policy = LeastLoadedPathPolicy(fdb)
+        eq_(policy.select([ROUTE1, ROUTE2], 0, 1), ROUTE1)
+        for (dpid, port) in ROUTE1:
+            fdb.update(dpid, MAC1, MAC2, port)
+        eq_(policy.select([ROUTE1, ROUTE2], 0, 1), ROUTE2)
+
+
+class SwitchFDBPortFlowsTestCase(TestCase):
+    def test_port_flow_counts(self):
+        fdb = SwitchFDB()
+        fdb.update(1, MAC1, MAC2, 2)
+        fdb.update(1, MAC2, MAC1, 2)
+        eq_(fdb.port_flow_count(1, 2), 2)
+        fdb.update(1, MAC2, MAC1, 3)
+        eq_(fdb.port_flow_counts(), {(1, 2): 1, (1, 3): 1})
+        fdb.delete(1, MAC1, MAC2)
+        eq_(fdb.port_flow_counts(), {(1, 3): 1})
@@ -0,0 +1,79 @@
+from unittest import TestCase
+from nose.tools import eq_, raises
+
+from sdnmpi.util.identity import IdentityTable
+from sdnmpi.util.rank_allocation_db import (RankAllocationDB, DEFAULT_JOB,
+                                            MAX_RANK)
+
+MAC1 = "04:00:00:00:00:01"
+MAC2 = "04:00:00:00:00:02"
+MAC3 = "04:00:00:00:00:03"
+
+
+class RankAllocationDBTestCase(TestCase):
+    def setUp(self):
+        self.rankdb = RankAllocationDB(IdentityTable())
+        self.rankdb.add_processes(1, [(0, MAC1), (1, MAC2)])
+        self.rankdb.add_processes(2, [(2, MAC3)])
+
+    def test_add_processes(self):
+        eq_(self.rankdb.to_dict(), {0: MAC1, 1: MAC2, 2: MAC3})
+        eq_(self.rankdb.job_ranks(1), [0, 1])
+        eq_(self.rankdb.get_job(2), 2)
+        eq_(self.rankdb.jobs(), [1, 2])
+
+    def test_identities_released(self):
+        self.rankdb.add_process(0, MAC2)
+        for job_id in [DEFAULT_JOB, 1, 2]:
+            self.rankdb.delete_job(job_id)
+        eq_(len(self.rankdb.identities), 0)
+
+    def test_add_process_default_job(self):
+        self.rankdb.add_process(3, MAC1)
+        eq_(self.rankdb.get_job(3), DEFAULT_JOB)
+        eq_(self.rankdb.get_mac(3), MAC1)
+
+    def test_delete_job(self):
+        eq_(self.rankdb.delete_job(1), [0, 1])
+        eq_(self.rankdb.to_dict(), {2: MAC3})
+        eq_(self.rankdb.jobs(), [2])
+        eq_(self.rankdb.delete_job(1), [])
+
+    def test_delete_processes(self):
+        eq_(self.rankdb.delete_processes([1, 5]), [1])
+        eq_(self.rankdb.job_ranks(1), [0])
+        self.rankdb.delete_prcess(0)
+        eq_(self.rankdb.jobs(), [2])
+
+    def test_rank_moves_to_new_job(self):
+        self.rankdb.add_processes(3, [(2, MAC1)])
+        eq_(self.rankdb.get_mac(2), MAC1)
+        eq_(self.rankdb.jobs(), [1, 3])
+
+    def test_get_ranks(self):
+        self.rankdb.add_process(5, MAC1)
+        eq_(self.rankdb.get_ranks(MAC1), [0, 5])
+        eq_(self.rankdb.get_ranks("04:00:00:00:00:09"), [])
+
+    def test_delete_mac(self):
+        self.rankdb.add_process(5, MAC1)
+        eq_(self.rankdb.delete_mac(MAC1), [0, 5])
+        eq_(self.rankdb.to_dict(), {1: MAC2, 2: MAC3})
+        eq_(len(self.rankdb), 2)
+
+    def test_unallocated_rank(self):
+        eq_(self.rankdb.get_mac(3), None)
+        eq_(self.rankdb.get_mac(1000), None)
+        eq_(self.rankdb.get_mac(-1), None)
+        eq_(self.rankdb.get_job(1000), None)
+
+    def test_version(self):
+        version = self.rankdb.version
+        self.rankdb.delete_processes([7])
+        eq_(self.rankdb.version, version)
+        self.rankdb.delete_processes([0])
+        eq_(self.rankdb.version, version + 1)
+
+    @raises(ValueError)
+    def test_invalid_rank(self):
+        self.rankdb.add_process(MAX_RANK + 1, MAC1)
@@ -0,0 +1,58 @@
+import logging
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.identity import IdentityTable
+from sdnmpi.util.topology_db import TopologyDB
+from sdnmpi.util.route_worker import RouteWorkerPool
+from sdnmpi.util.records import (DatapathRecord, SwitchRecord, PortRecord,
+                                 LinkRecord, HostRecord)
+
+MAC1 = "02:00:00:00:00:01"
+MAC2 = "02:00:00:00:00:02"
+
+
+class RouteWorkerPoolTestCase(TestCase):
+    def setUp(self):
+        self.topology = TopologyDB(IdentityTable())
+        for dpid in [1, 2]:
+            self.topology.add_switch(SwitchRecord(DatapathRecord(dpid)))
+        self.topology.add_host(HostRecord(MAC1, PortRecord(1, 1)))
+        self.topology.add_host(HostRecord(MAC2, PortRecord(2, 1)))
+        self.topology.add_link(LinkRecord(PortRecord(1, 2),
+                                          PortRecord(2, 2)))
+
+        self.pool = RouteWorkerPool(self.topology, 1,
+                                    logging.getLogger(__name__))
+        # Routes must be computed by the worker, not in this process
+        self.inline_routes = []
+        self.pool.compute_inline = \
+            lambda *req: self.inline_routes.append(req) or []
+
+    def tearDown(self):
+        self.pool.stop()
+
+    def test_route_from_worker(self):
+        eq_(self.pool.find_route(MAC1, MAC2), [(1, 2), (2, 1)])
+        eq_(self.inline_routes, [])
+        worker = self.pool.workers[0]
+        ok_(worker.alive)
+        ok_(worker.process.poll() is None)
+
+    def test_topology_replicated(self):
+        eq_(self.pool.find_route(MAC2, MAC1), [])
+        self.topology.add_link(LinkRecord(PortRecord(2, 2),
+                                          PortRecord(1, 2)))
+        eq_(self.pool.find_route(MAC2, MAC1), [(2, 2), (1, 1)])
+        eq_(self.inline_routes, [])
+
+    def test_worker_died(self):
+        worker = self.pool.workers[0]
+        worker.process.kill()
+        worker.process.wait()
+        # The request assigned to the dead worker is computed inline
+        eq_(self.pool.find_route(MAC1, MAC2), [])
+        eq_(self.inline_routes, [(MAC1, MAC2, False)])
+        ok_(not worker.alive)
+        eq_(self.pool.find_route(MAC1, MAC2), [])
+        eq_(len(self.inline_routes), 2)
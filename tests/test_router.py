@@ -0,0 +1,340 @@
+import struct
+from unittest import TestCase
+from nose.tools import eq_
+
+from ryu.lib import hub
+from ryu.controller import ofp_event
+from ryu.lib.mac import haddr_to_bin, haddr_to_str
+from ryu.ofproto import ofproto_v1_0, ofproto_v1_0_parser
+
+from sdnmpi.router import Router
+from sdnmpi.simulator import build_frame, msg_type
+from sdnmpi.topology import (FindRouteRequest, FindRouteReply,
+                             FindMulticastTreeRequest, FindMulticastTreeReply,
+                             BroadcastRequest, EventHostDelete,
+                             EventTopologyChanged)
+from sdnmpi.util.admission import PendingTable
+from sdnmpi.util.fakes import FakeDatapath
+from sdnmpi.util.packet_buffer import PacketBufferPool
+from sdnmpi.util.rank_allocation_db import RankAllocationDB
+from sdnmpi.util.topology_db import TopologyDB
+from sdnmpi.util.topology_diff import TopologyDiff
+from sdnmpi.util.records import (DatapathRecord, SwitchRecord, PortRecord,
+                                 LinkRecord, HostRecord)
+
+MAC1 = "04:00:00:00:00:01"
+MAC2 = "04:00:00:00:00:02"
+MAC3 = "04:00:00:00:00:03"
+# Not attached to the topology
+MAC4 = "04:00:00:00:00:04"
+# SDN-MPI MACs of rank 0 sending to ranks 1 and 2
+RANK1_MAC = "02:00:00:00:01:00"
+RANK2_MAC = "02:00:00:00:02:00"
+# SDN-MPI MAC of rank 0 broadcasting to every rank of its job
+BCAST_MAC = "06:00:00:00:ff:ff"
+# Branches of the tree of BCAST_MAC at switches 1 and 2
+BCAST_BRANCHES = {1: [(2, None), (3, MAC3)], 2: [(1, MAC2)]}
+
+
+class MockProcessManager(object):
+    def __init__(self):
+        super(MockProcessManager, self).__init__()
+        self.rankdb = RankAllocationDB()
+
+
+def packet_outs(datapath):
+    """(in_port, actions) of the PacketOuts sent to datapath"""
+    outs = []
+    for buf in datapath.msgs:
+        if msg_type(buf) != ofproto_v1_0.OFPT_PACKET_OUT:
+            continue
+        _, in_port, actions_len = struct.unpack_from("!IHH", buf, 8)
+        actions = []
+        offset = ofproto_v1_0.OFP_PACKET_OUT_SIZE
+        while offset < ofproto_v1_0.OFP_PACKET_OUT_SIZE + actions_len:
+            action = ofproto_v1_0_parser.OFPAction.parser(buf, offset)
+            actions.append(action)
+            offset += action.len
+        outs.append((in_port, actions))
+    return outs
+
+
+def output_ports(actions):
+    return [action.port for action in actions
+            if isinstance(action, ofproto_v1_0_parser.OFPActionOutput)]
+
+
+def dl_dsts(actions):
+    return [haddr_to_str(action.dl_addr) for action in actions
+            if isinstance(action, ofproto_v1_0_parser.OFPActionSetDlDst)]
+
+
+class RouterTestCase(TestCase):
+    """Router against fake datapaths, with the lookups of TopologyManager
+    answered from a TopologyDB
+
+    MAC1 and MAC3 are attached to switch 1 and MAC2 to switch 2, which is
+    linked to switch 1 through port 2 of both switches."""
+    def setUp(self):
+        self.topology = TopologyDB()
+        for dpid in [1, 2]:
+            self.topology.add_switch(SwitchRecord(DatapathRecord(dpid)))
+        self.topology.add_host(HostRecord(MAC1, PortRecord(1, 1)))
+        self.topology.add_host(HostRecord(MAC2, PortRecord(2, 1)))
+        self.topology.add_host(HostRecord(MAC3, PortRecord(1, 3)))
+        self.topology.add_link(LinkRecord(PortRecord(1, 2),
+                                          PortRecord(2, 2)))
+        self.topology.add_link(LinkRecord(PortRecord(2, 2),
+                                          PortRecord(1, 2)))
+
+        process_manager = MockProcessManager()
+        process_manager.rankdb.add_processes(1, [(0, MAC1), (1, MAC2),
+                                                 (2, MAC3)])
+        self.router = Router(process_manager=process_manager)
+        self.router.send_request = self.send_request
+        self.events = []
+        self.router.send_event_to_observers = self.events.append
+        self.router.send_event = lambda name, ev: None
+        self.broadcasts = []
+        # Event that lookups wait for, to keep route setups in flight
+        self.lookups_gate = None
+
+        self.datapaths = {}
+        for dpid in [1, 2]:
+            datapath = FakeDatapath(dpid)
+            self.datapaths[dpid] = datapath
+            self.router.dps[dpid] = datapath
+
+    def tearDown(self):
+        hub.kill(self.router.stats_thread)
+
+    def send_request(self, req):
+        if self.lookups_gate is not None:
+            self.lookups_gate.wait()
+        if isinstance(req, FindRouteRequest):
+            fdb = self.topology.find_route(req.src_mac, req.dst_mac)
+            return FindRouteReply(None, fdb)
+        if isinstance(req, FindMulticastTreeRequest):
+            tree = self.topology.find_multicast_tree(req.src_mac,
+                                                     req.dst_macs)
+            return FindMulticastTreeReply(None, tree)
+        if isinstance(req, BroadcastRequest):
+            self.broadcasts.append(req)
+            return None
+        raise AssertionError("Unexpected request %r" % req)
+
+    def packet_in(self, dpid, in_port, src, dst):
+        datapath = self.datapaths[dpid]
+        msg = ofproto_v1_0_parser.OFPPacketIn(
+            datapath, buffer_id=ofproto_v1_0.OFP_NO_BUFFER, total_len=0,
+            in_port=in_port, reason=ofproto_v1_0.OFPR_NO_MATCH,
+            data=build_frame(src, dst))
+        self.router._packet_in_handler(ofp_event.EventOFPPacketIn(msg))
+
+    def flow_removed(self, dpid, src, dst, reason):
+        datapath = self.datapaths[dpid]
+        msg = ofproto_v1_0_parser.OFPFlowRemoved(datapath)
+        msg.match = ofproto_v1_0_parser.OFPMatch(dl_src=haddr_to_bin(src),
+                                                 dl_dst=haddr_to_bin(dst))
+        msg.reason = reason
+        self.router._flow_removed_handler(ofp_event.EventOFPFlowRemoved(msg))
+
+    def pipeline(self, slots):
+        """Run route setups in greenthreads, blocked in their lookups until
+        finish_route_setups() is called"""
+        self.router.route_setup_slots = hub.BoundedSemaphore(slots)
+        self.lookups_gate = hub.Event()
+
+    def finish_route_setups(self):
+        self.lookups_gate.set()
+        while self.router.route_setups_in_flight:
+            hub.sleep(0)
+
+    def test_route_setup(self):
+        self.packet_in(1, 1, MAC1, MAC2)
+        eq_(sorted(self.router.fdb.entries()),
+            [(1, MAC1, MAC2, 2), (2, MAC1, MAC2, 1)])
+        eq_([output_ports(actions) for (_, actions)
+             in packet_outs(self.datapaths[1])], [[2]])
+        eq_(self.router.counters["route_setup"], 1)
+
+    def test_flow_expired(self):
+        self.packet_in(1, 1, MAC1, MAC2)
+        self.flow_removed(1, MAC1, MAC2, ofproto_v1_0.OFPRR_IDLE_TIMEOUT)
+        eq_(list(self.router.fdb.entries()), [(2, MAC1, MAC2, 1)])
+        self.flow_removed(2, MAC1, MAC2, ofproto_v1_0.OFPRR_IDLE_TIMEOUT)
+        eq_(list(self.router.fdb.entries()), [])
+
+    def test_deleted_flow_reinstalled(self):
+        self.packet_in(1, 1, MAC1, MAC2)
+        host = HostRecord(MAC2, PortRecord(2, 1))
+        self.router._event_host_delete_handler(EventHostDelete(host, "down"))
+        eq_(list(self.router.fdb.entries()), [])
+        self.packet_in(1, 1, MAC1, MAC2)
+        # The removal of the deleted flows reaches the controller after
+        # they were installed again
+        self.flow_removed(1, MAC1, MAC2, ofproto_v1_0.OFPRR_DELETE)
+        self.flow_removed(2, MAC1, MAC2, ofproto_v1_0.OFPRR_DELETE)
+        eq_(sorted(self.router.fdb.entries()),
+            [(1, MAC1, MAC2, 2), (2, MAC1, MAC2, 1)])
+
+    def test_restored_mpi_flows_deleted_with_host(self):
+        # Flows restored from a snapshot, as by SnapshotManager
+        self.router.fdb.update(1, MAC1, RANK1_MAC, 2)
+        self.router.fdb.update(2, MAC1, RANK1_MAC, 1)
+        self.router.add_true_dst(RANK1_MAC, MAC2)
+        host = HostRecord(MAC2, PortRecord(2, 1))
+        self.router._event_host_delete_handler(EventHostDelete(host, "down"))
+        eq_(list(self.router.fdb.entries()), [])
+        eq_(self.router.true_dsts, {})
+
+    def test_mpi_packet_to_lost_host_flooded(self):
+        self.topology.delete_host(MAC2)
+        self.packet_in(1, 1, MAC1, RANK1_MAC)
+        eq_(list(self.router.fdb.entries()), [])
+        eq_(len(self.broadcasts), 1)
+        req = self.broadcasts[0]
+        eq_((req.src_dpid, req.src_in_port), (1, 1))
+        eq_(haddr_to_str(req.data[:6]), MAC2)
+        eq_(req.data[6:], build_frame(MAC1, RANK1_MAC)[6:])
+
+    def test_multicast_tree_installed(self):
+        self.packet_in(1, 1, MAC1, BCAST_MAC)
+        eq_(sorted(self.router.fdb.entries()),
+            [(1, MAC1, BCAST_MAC, 2), (2, MAC1, BCAST_MAC, 1)])
+        for dpid, branches in BCAST_BRANCHES.items():
+            eq_(self.router.fdb.get_branches(dpid, MAC1, BCAST_MAC),
+                branches)
+        # Observers, e.g. ShardManager, see the flows with their branches
+        eq_([(ev.dpid, ev.branches) for ev in self.events],
+            sorted(BCAST_BRANCHES.items()))
+        self.packet_in(2, 2, MAC1, BCAST_MAC)
+        eq_(self.router.counters["fdb_hit"], 1)
+
+    def test_multicast_tree_deleted_with_receiver(self):
+        self.packet_in(1, 1, MAC1, BCAST_MAC)
+        host = HostRecord(MAC2, PortRecord(2, 1))
+        self.router._event_host_delete_handler(EventHostDelete(host, "down"))
+        eq_(list(self.router.fdb.entries()), [])
+        eq_(self.router.trees, {})
+
+    def test_restored_tree_deleted_with_link(self):
+        # Tree flows restored from a snapshot, as by SnapshotManager
+        for dpid, branches in BCAST_BRANCHES.items():
+            self.router.fdb.update(dpid, MAC1, BCAST_MAC, branches[0][0],
+                                   branches)
+        self.router.restore_trees()
+        eq_(sorted(self.router.trees[(MAC1, BCAST_MAC)].receivers),
+            [MAC2, MAC3])
+        eq_(self.router.tree_ranks[(MAC1, BCAST_MAC)],
+            (1, frozenset([0, 1, 2])))
+
+        diff = TopologyDiff(0, 1)
+        diff.removed_links.add((1, 2, 2, 2))
+        self.router._event_topology_changed_handler(
+            EventTopologyChanged(diff))
+        eq_(list(self.router.fdb.entries()), [])
+        eq_(self.router.trees, {})
+
+    def test_fdb_hit_uses_flow_table(self):
+        self.packet_in(1, 1, MAC1, RANK1_MAC)
+        # A packet that raced with the flow at the last hop is forwarded by
+        # the flow table, which rewrites its destination
+        self.packet_in(2, 2, MAC1, RANK1_MAC)
+        eq_(self.router.counters["fdb_hit"], 1)
+        eq_([(in_port, output_ports(actions)) for (in_port, actions)
+             in packet_outs(self.datapaths[2])],
+            [(2, [ofproto_v1_0.OFPP_TABLE])])
+
+    def test_last_hop_packet_out_rewritten(self):
+        self.packet_in(1, 1, MAC1, RANK2_MAC)
+        outs = packet_outs(self.datapaths[1])
+        eq_(len(outs), 1)
+        _, actions = outs[0]
+        eq_(dl_dsts(actions), [MAC3])
+        eq_(output_ports(actions), [3])
+
+    def test_pipelined_route_setups(self):
+        self.pipeline(4)
+        self.packet_in(1, 1, MAC1, MAC2)
+        self.packet_in(1, 3, MAC3, MAC2)
+        hub.sleep(0)
+        # Both lookups are in flight and the event loop is not blocked
+        eq_(self.router.route_setups_in_flight, 2)
+        eq_(self.router.counters["max_in_flight"], 2)
+        eq_(list(self.router.fdb.entries()), [])
+
+        self.finish_route_setups()
+        eq_(sorted(self.router.fdb.flows_at(2)), [(MAC1, MAC2), (MAC3, MAC2)])
+        eq_([output_ports(actions) for (_, actions)
+             in packet_outs(self.datapaths[1])], [[2], [2]])
+        eq_(self.router.counters["route_setup"], 2)
+        eq_(len(self.router.pending_routes), 0)
+
+    def test_duplicate_packet_ins_deduplicated(self):
+        self.pipeline(4)
+        self.router.packet_buffers = PacketBufferPool(4, 2048, 1)
+        for _ in range(3):
+            self.packet_in(1, 1, MAC1, MAC2)
+        hub.sleep(0)
+        # One lookup for the pair, one packet kept for it and one dropped
+        eq_(self.router.route_setups_in_flight, 1)
+        eq_(self.router.counters["route_setup"], 1)
+        eq_(self.router.counters["buffered"], 1)
+        eq_(self.router.counters["deduplicated"], 1)
+        self.finish_route_setups()
+
+    def test_buffered_packets_released(self):
+        self.pipeline(4)
+        for _ in range(3):
+            self.packet_in(1, 1, MAC1, MAC2)
+        hub.sleep(0)
+        eq_(self.router.counters["buffered"], 2)
+
+        self.finish_route_setups()
+        # The packet that triggered the setup is output to the route, the
+        # buffered ones go through the flow table in arrival order
+        eq_([(in_port, output_ports(actions)) for (in_port, actions)
+             in packet_outs(self.datapaths[1])],
+            [(ofproto_v1_0.OFPP_NONE, [2]),
+             (1, [ofproto_v1_0.OFPP_TABLE]),
+             (1, [ofproto_v1_0.OFPP_TABLE])])
+        eq_(self.router.counters["released"], 2)
+        eq_(len(self.router.packet_buffers), 0)
+        eq_(self.router.packet_buffers.free_slots,
+            Router.PACKET_BUFFER_SLOTS)
+
+    def test_buffered_packets_freed_on_failure(self):
+        self.pipeline(4)
+        self.packet_in(1, 1, MAC1, MAC4)
+        self.packet_in(1, 1, MAC1, MAC4)
+        hub.sleep(0)
+        eq_(self.router.counters["buffered"], 1)
+
+        self.finish_route_setups()
+        eq_(len(self.broadcasts), 1)
+        eq_(packet_outs(self.datapaths[1]), [])
+        eq_(self.router.counters["discarded"], 1)
+        eq_(self.router.packet_buffers.free_slots,
+            Router.PACKET_BUFFER_SLOTS)
+
+    def test_buffered_packets_freed_on_expiry(self):
+        self.now = 0
+        self.router.pending_routes = PendingTable(
+            Router.PENDING_ROUTE_TIMEOUT, clock=lambda: self.now)
+        # The pair stays pending after its route setup failed, and the
+        # packets received meanwhile are kept until it expires
+        self.packet_in(1, 1, MAC1, MAC4)
+        self.packet_in(1, 1, MAC1, MAC4)
+        eq_(self.router.counters["buffered"], 1)
+        eq_(len(self.broadcasts), 1)
+
+        self.now += Router.PENDING_ROUTE_TIMEOUT + 1
+        self.router._expire_pending_routes()
+        eq_(self.router.counters["discarded"], 1)
+        eq_(self.router.packet_buffers.free_slots,
+            Router.PACKET_BUFFER_SLOTS)
+        # The next packet of the pair sets up its route again
+        self.packet_in(1, 1, MAC1, MAC4)
+        eq_(self.router.counters["route_setup"], 2)
+        eq_(len(self.broadcasts), 2)
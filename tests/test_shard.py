@@ -0,0 +1,219 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.identity import IdentityTable
+from sdnmpi.util.rank_allocation_db import RankAllocationDB
+from sdnmpi.util.records import (DatapathRecord, SwitchRecord, PortRecord,
+                                 LinkRecord, HostRecord)
+from sdnmpi.util.shard import (ShardMap, ShardReplicator, LocalReplicatedLog,
+                               FileReplicatedLog, RemoteLinks,
+                               parse_assignments)
+from sdnmpi.util.topology_db import TopologyDB
+
+MAC1 = "02:00:00:00:00:01"
+MAC2 = "02:00:00:00:00:02"
+# Broadcast of rank 0 to every rank of its job
+BCAST_MAC = "06:00:00:00:ff:ff"
+
+
+class ShardMapTestCase(TestCase):
+    def test_default_assignment(self):
+        shard_map = ShardMap(1, 2)
+        ok_(shard_map.owns(1))
+        ok_(not shard_map.owns(2))
+        eq_(shard_map.owner(5), 1)
+
+    def test_explicit_assignment(self):
+        shard_map = ShardMap(0, 2, parse_assignments(["0a:0", "b:1"]))
+        ok_(shard_map.owns(10))
+        eq_(shard_map.owner(11), 1)
+        eq_(shard_map.owner(3), 1)
+
+
+class LocalReplicatedLogTestCase(TestCase):
+    def test_shared_by_name(self):
+        log1 = LocalReplicatedLog.open("test_shared_by_name")
+        log2 = LocalReplicatedLog.open("test_shared_by_name")
+        eq_(log1.append((0, "process_add", 0, "02:00:00:00:00:01")), 0)
+        eq_(log2.append((1, "process_delete", 0)), 1)
+        eq_(log1.read(1), [(1, "process_delete", 0)])
+        eq_(len(log2.read(0)), 2)
+        eq_(log2.read(0, 1), [(0, "process_add", 0, "02:00:00:00:00:01")])
+
+    def test_separate_names(self):
+        log1 = LocalReplicatedLog.open("test_separate_names1")
+        log2 = LocalReplicatedLog.open("test_separate_names2")
+        log1.append((0, "process_delete", 0))
+        eq_(log2.read(0), [])
+
+
+class FileReplicatedLogTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "shard.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_shared_by_path(self):
+        log1 = FileReplicatedLog.open(self.path)
+        log2 = FileReplicatedLog.open(self.path)
+        eq_(log1.append((0, "process_add", 0, MAC1)), 0)
+        eq_(log2.append((1, "process_delete", 0)), 1)
+        eq_(log1.append((0, "process_delete", 1)), 2)
+        eq_(log2.read(0), [(0, "process_add", 0, MAC1),
+                           (1, "process_delete", 0),
+                           (0, "process_delete", 1)])
+        eq_(log1.read(1, 1), [(1, "process_delete", 0)])
+        eq_(log1.read(3), [])
+
+    def test_reopen(self):
+        FileReplicatedLog.open(self.path).append((0, "process_delete", 0))
+        log = FileReplicatedLog.open(self.path)
+        eq_(log.append((1, "process_delete", 1)), 1)
+        eq_(log.read(0), [(0, "process_delete", 0), (1, "process_delete", 1)])
+
+
+class RemoteLinksTestCase(TestCase):
+    def setUp(self):
+        self.now = 0
+        self.topology = TopologyDB(IdentityTable())
+        for dpid in [1, 2]:
+            self.topology.add_switch(SwitchRecord(DatapathRecord(dpid)))
+        self.links = RemoteLinks(self.topology, 10, lambda: self.now)
+        self.links.seen(1, 2, 2, 2)
+
+    def link(self):
+        return self.topology.links.get(1, {}).get(2)
+
+    def test_expire(self):
+        eq_((self.link().src.port_no, self.link().dst.port_no), (2, 2))
+        self.now = 8
+        eq_(self.links.expire(), 0)
+        # Each LLDP packet keeps the link alive
+        self.links.seen(1, 2, 2, 2)
+        self.now = 16
+        eq_(self.links.expire(), 0)
+        self.now = 19
+        eq_(self.links.expire(), 1)
+        ok_(self.link() is None)
+        eq_(len(self.links), 0)
+
+    def test_ports_changed(self):
+        version = self.topology.version
+        self.links.seen(1, 2, 2, 2)
+        eq_(self.topology.version, version)
+        self.links.seen(1, 3, 2, 2)
+        eq_(self.link().src.port_no, 3)
+
+    def test_switch_deleted(self):
+        self.topology.delete_switch(SwitchRecord(DatapathRecord(1)))
+        eq_(self.links.expire(), 1)
+        ok_(self.link() is None)
+        eq_(self.links.expire(), 0)
+
+
+class Shard(object):
+    """Databases of a shard and the calls made by its replicator"""
+    def __init__(self, shard_id, log):
+        super(Shard, self).__init__()
+        identities = IdentityTable()
+        self.topology = TopologyDB(identities)
+        self.rankdb = RankAllocationDB(identities)
+        self.flows = []
+        self.deleted_hosts = []
+        self.replicator = ShardReplicator(
+            ShardMap(shard_id, 2), log, self.topology, self.rankdb,
+            lambda *flow: self.flows.append(flow),
+            lambda host, reason: self.deleted_hosts.append((host.mac,
+                                                            reason)))
+
+
+class ShardReplicatorTestCase(TestCase):
+    def setUp(self):
+        self.log = LocalReplicatedLog([])
+        # Shard 0 owns switch 2, shard 1 owns switch 1
+        self.shard0 = Shard(0, self.log)
+        self.shard1 = Shard(1, self.log)
+
+        topology = self.shard1.topology
+        topology.add_switch(SwitchRecord(DatapathRecord(1)))
+        topology.add_host(HostRecord(MAC1, PortRecord(1, 1)))
+        topology = self.shard0.topology
+        topology.add_switch(SwitchRecord(DatapathRecord(2)))
+        topology.add_host(HostRecord(MAC2, PortRecord(2, 1)))
+        # LLDP from switch 1 is received by switch 2
+        topology.add_link(LinkRecord(PortRecord(1, 2), PortRecord(2, 2)))
+
+    def sync(self):
+        for shard in [self.shard0, self.shard1]:
+            shard.replicator.publish_topology_changes()
+        for shard in [self.shard0, self.shard1]:
+            shard.replicator.apply_entries()
+
+    def test_apply_topology(self):
+        self.sync()
+        for shard in [self.shard0, self.shard1]:
+            eq_(sorted(shard.topology.switches), [1, 2])
+            eq_(shard.topology.find_route(MAC1, MAC2), [(1, 2), (2, 1)])
+        # Changes applied from the log are not published again
+        entries = len(self.log.read(0))
+        self.sync()
+        eq_(len(self.log.read(0)), entries)
+
+    def test_apply_processes(self):
+        self.shard0.replicator.publish("process_batch_add", 1,
+                                       [(0, MAC1), (1, MAC2)])
+        self.shard0.replicator.publish("process_delete", 0)
+        self.sync()
+        eq_(self.shard1.rankdb.get_mac(0), None)
+        eq_(self.shard1.rankdb.get_mac(1), MAC2)
+        eq_(self.shard1.rankdb.get_job(1), 1)
+
+    def test_stitch_flows(self):
+        self.sync()
+        # Shard 0 computed the route from MAC1 to MAC2
+        route = self.shard0.topology.find_route(MAC1, MAC2)
+        for (dpid, port) in route:
+            self.shard0.replicator.publish_flow(dpid, MAC1, MAC2, port)
+        self.sync()
+        # Only the flow on switch 1 is installed by shard 1
+        eq_(self.shard1.flows, [(1, MAC1, MAC2, 2, None, None)])
+        eq_(self.shard0.flows, [])
+
+    def test_stitch_tree_flows(self):
+        self.sync()
+        # Shard 0 built a tree replicating packets of MAC1 on switch 1
+        branches = [(2, None), (3, MAC2)]
+        self.shard0.replicator.publish_flow(1, MAC1, BCAST_MAC, 2,
+                                            branches=branches)
+        self.sync()
+        eq_(self.shard1.flows, [(1, MAC1, BCAST_MAC, 2, None, branches)])
+
+    def test_host_delete(self):
+        self.sync()
+        host = self.shard0.topology.get_host(MAC2)
+        self.shard0.topology.delete_host(MAC2)
+        self.shard0.replicator.publish_host_delete(host, "port down")
+        # Hosts at switches of other shards are published by their owner
+        self.shard0.replicator.publish_host_delete(
+            self.shard0.topology.get_host(MAC1), "port down")
+        self.sync()
+        eq_(self.shard1.deleted_hosts, [(MAC2, "port down")])
+        eq_(self.shard0.deleted_hosts, [])
+        ok_(self.shard1.topology.get_host(MAC2) is None)
+
+    def test_remote_link_deleted_with_switch(self):
+        # Shard 0 learned the link from switch 1 from its LLDP packets
+        remote_links = RemoteLinks(self.shard0.topology, 10)
+        remote_links.seen(1, 2, 2, 2)
+        self.sync()
+        self.shard1.topology.delete_switch(SwitchRecord(DatapathRecord(1)))
+        self.sync()
+        eq_(remote_links.expire(), 1)
+        self.sync()
+        for shard in [self.shard0, self.shard1]:
+            eq_(shard.topology.links.get(1, {}), {})
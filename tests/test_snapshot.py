@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from nose.tools import eq_, ok_, raises
+
+from tests.mock import MockPort, MockLink, MockHost, MockSwitch
+from sdnmpi.util.topology_db import TopologyDB
+from sdnmpi.util.switch_fdb import SwitchFDB
+from sdnmpi.util.rank_allocation_db import RankAllocationDB, DEFAULT_JOB
+from sdnmpi.util.snapshot import (write_snapshot, load_snapshot,
+                                  SnapshotReader, SnapshotError)
+
+MAC1 = "02:00:00:00:00:01"
+MAC2 = "02:00:00:00:00:02"
+# SDN-MPI MAC of rank 0 sending to rank 1, rewritten to MAC2
+RANK1_MAC = "02:00:00:00:01:00"
+# SDN-MPI MAC of rank 0 broadcasting to every rank of its job
+BCAST_MAC = "06:00:00:00:ff:ff"
+
+
+class SnapshotTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "state.snapshot")
+
+        self.topology = TopologyDB()
+        self.topology.add_switch(MockSwitch(1))
+        self.topology.add_switch(MockSwitch(2))
+        self.topology.add_link(MockLink(MockPort(1, 2), MockPort(2, 2)))
+        self.topology.add_link(MockLink(MockPort(2, 2), MockPort(1, 2)))
+        self.topology.add_host(MockHost(MAC1, MockPort(1, 1)))
+        self.topology.add_host(MockHost(MAC2, MockPort(2, 1)))
+
+        self.fdb = SwitchFDB()
+        self.fdb.update(1, MAC1, MAC2, 2)
+        self.fdb.update(2, MAC1, MAC2, 1)
+        self.fdb.update(1, MAC1, RANK1_MAC, 2)
+        self.fdb.update(2, MAC1, RANK1_MAC, 1)
+        self.fdb.update(1, MAC1, BCAST_MAC, 2, [(2, None)])
+        self.fdb.update(2, MAC1, BCAST_MAC, 1, [(1, MAC2)])
+        self.true_dsts = {RANK1_MAC: MAC2}
+
+        self.rankdb = RankAllocationDB()
+        self.rankdb.add_process(0, MAC1)
+        self.rankdb.add_processes(3, [(1, MAC2), (2, MAC1)])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        write_snapshot(self.path, self.topology, self.fdb, self.rankdb, 42.0,
+                       self.true_dsts)
+
+        topology = TopologyDB()
+        topology.add_switch(MockSwitch(1))
+        topology.add_switch(MockSwitch(2))
+        fdb = SwitchFDB()
+        rankdb = RankAllocationDB()
+        true_dsts = {}
+        timestamp = load_snapshot(self.path, topology, fdb, rankdb,
+                                  true_dsts.__setitem__)
+
+        eq_(timestamp, 42.0)
+        eq_(topology.find_route(MAC1, MAC2), [(1, 2), (2, 1)])
+        eq_(sorted(fdb.entries()), sorted(self.fdb.entries()))
+        eq_(sorted(fdb.branch_entries()), sorted(self.fdb.branch_entries()))
+        eq_(true_dsts, self.true_dsts)
+        eq_(rankdb.to_dict(), {0: MAC1, 1: MAC2, 2: MAC1})
+        eq_(rankdb.jobs(), [DEFAULT_JOB, 3])
+        eq_(rankdb.job_ranks(3), [1, 2])
+        eq_(rankdb.get_job(0), DEFAULT_JOB)
+
+    def test_reader(self):
+        write_snapshot(self.path, self.topology, self.fdb, self.rankdb,
+                       true_dsts=self.true_dsts)
+        reader = SnapshotReader(self.path)
+        eq_(sorted(host.mac for host in reader.hosts()), [MAC1, MAC2])
+        links = list(reader.links())
+        eq_(len(links), 2)
+        ok_(all(link.restored for link in links))
+        entries = list(reader.fdb_entries())
+        ok_((1, MAC1, MAC2, 2, None) in entries)
+        ok_((2, MAC1, RANK1_MAC, 1, MAC2) in entries)
+        eq_(sorted(reader.branches()), [(1, MAC1, BCAST_MAC, 2, None),
+                                        (2, MAC1, BCAST_MAC, 1, MAC2)])
+        reader.close()
+
+    @raises(SnapshotError)
+    def test_truncated(self):
+        write_snapshot(self.path, self.topology, self.fdb, self.rankdb)
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        SnapshotReader(self.path)
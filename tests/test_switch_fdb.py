@@ -0,0 +1,92 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.identity import IdentityTable
+from sdnmpi.util.switch_fdb import SwitchFDB
+
+MAC1 = "02:00:00:00:00:01"
+MAC2 = "02:00:00:00:00:02"
+MAC3 = "02:00:00:00:00:03"
+
+
+class SwitchFDBTestCase(TestCase):
+    def setUp(self):
+        self.identities = IdentityTable()
+        self.fdb = SwitchFDB(self.identities)
+        self.fdb.update(1, MAC1, MAC2, 2)
+        self.fdb.update(2, MAC1, MAC2, 1)
+        self.fdb.update(2, MAC2, MAC1, 3)
+        self.fdb.update(1, MAC2, MAC3, 4)
+
+    def test_delete_mac(self):
+        deleted = self.fdb.delete_mac(MAC1)
+        eq_(sorted(deleted), [(1, MAC1, MAC2), (2, MAC1, MAC2),
+                              (2, MAC2, MAC1)])
+        eq_(list(self.fdb.entries()), [(1, MAC2, MAC3, 4)])
+        eq_(self.fdb.port_flow_counts(), {(1, 4): 1})
+        ok_(not self.fdb.has_flows(MAC1))
+        ok_(self.fdb.has_flows(MAC3))
+
+    def test_delete_mac_unknown(self):
+        eq_(self.fdb.delete_mac("02:00:00:00:00:09"), [])
+
+    def test_delete(self):
+        self.fdb.delete(1, MAC2, MAC3)
+        ok_(not self.fdb.has_flows(MAC3))
+        self.fdb.delete(1, MAC2, MAC3)
+        ok_(self.fdb.has_flows(MAC2))
+
+    def test_flows_at(self):
+        eq_(sorted(self.fdb.flows_at(1)), [(MAC1, MAC2), (MAC2, MAC3)])
+        eq_(self.fdb.flows_at(2, 3), [(MAC2, MAC1)])
+        eq_(self.fdb.flows_at(3), [])
+
+    def test_delete_pair(self):
+        eq_(self.fdb.delete_pair(MAC1, MAC2), [1, 2])
+        eq_(sorted(self.fdb.entries()), [(1, MAC2, MAC3, 4),
+                                         (2, MAC2, MAC1, 3)])
+        eq_(self.fdb.delete_pair(MAC1, MAC2), [])
+
+    def test_identities_released(self):
+        eq_(self.fdb.get_by_id(2, 0x020000000002, 0x020000000001), 3)
+        self.fdb.update(1, MAC1, MAC2, 5)
+        self.fdb.delete_mac(MAC1)
+        self.fdb.delete_mac(MAC2)
+        eq_(len(self.identities), 0)
+
+    def test_flow_to_itself(self):
+        self.fdb.update(3, MAC1, MAC1, 1)
+        ok_(self.fdb.has_flows(MAC1))
+        self.fdb.delete(3, MAC1, MAC1)
+        eq_(self.fdb.get(3, MAC1, MAC1), None)
+        self.fdb.update(3, MAC3, MAC3, 1)
+        eq_(sorted(self.fdb.delete_mac(MAC3)),
+            [(1, MAC2, MAC3), (3, MAC3, MAC3)])
+        self.fdb.delete_mac(MAC1)
+        self.fdb.delete_mac(MAC2)
+        eq_(len(self.identities), 0)
+
+    def test_branches(self):
+        branches = [(5, None), (6, MAC3), (7, MAC1)]
+        self.fdb.update(3, MAC1, MAC2, 5, branches)
+        eq_(self.fdb.get_branches(3, MAC1, MAC2), branches)
+        eq_(self.fdb.flows_at(3, 6), [(MAC1, MAC2)])
+        eq_(self.fdb.port_flow_counts()[(3, 7)], 1)
+        eq_(list(self.fdb.branch_entries()), [(3, MAC1, MAC2, branches)])
+        # A tree losing a branch keeps the same first port
+        self.fdb.update(3, MAC1, MAC2, 5, branches[:2])
+        ok_((3, 7) not in self.fdb.port_flow_counts())
+        eq_(self.fdb.delete_pair(MAC1, MAC2), [1, 2, 3])
+        eq_(self.fdb.get_branches(3, MAC1, MAC2), None)
+        ok_((3, 5) not in self.fdb.port_flow_counts())
+        eq_(list(self.fdb.branch_entries()), [])
+
+    def test_to_dict_cached(self):
+        view = self.fdb.to_dict()
+        ok_(self.fdb.to_dict() is view)
+        dpid1 = [switch for switch in view if switch["dpid"] == 1][0]
+        self.fdb.update(2, MAC3, MAC1, 1)
+        new_view = self.fdb.to_dict()
+        ok_(new_view is not view)
+        ok_(any(switch is dpid1 for switch in new_view))
+        eq_(sum(len(switch["fdb"]) for switch in new_view), 5)
@@ -0,0 +1,87 @@
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.identity import IdentityTable
+from sdnmpi.util.topology_db import TopologyDB
+from sdnmpi.util.topology_diff import TopologyDiffer
+from sdnmpi.util.records import (DatapathRecord, SwitchRecord, PortRecord,
+                                 LinkRecord, HostRecord)
+
+MAC1 = "02:00:00:00:00:01"
+
+
+def _link(src_dpid, src_port, dst_dpid, dst_port):
+    return LinkRecord(PortRecord(src_dpid, src_port),
+                      PortRecord(dst_dpid, dst_port))
+
+
+class TopologyDifferTestCase(TestCase):
+    def setUp(self):
+        self.topology = TopologyDB(IdentityTable())
+        for dpid in [1, 2]:
+            self.topology.add_switch(SwitchRecord(DatapathRecord(dpid)))
+        self.topology.add_link(_link(1, 2, 2, 2))
+        self.differ = TopologyDiffer(self.topology)
+
+    def test_empty(self):
+        diff = self.differ.diff()
+        ok_(not diff)
+        eq_(diff.since, diff.version)
+
+    def test_link_changes(self):
+        self.topology.add_link(_link(2, 2, 1, 2))
+        self.topology.delete_link(_link(1, 2, 2, 2))
+        diff = self.differ.diff()
+        eq_(diff.added_links, set([(2, 2, 1, 2)]))
+        eq_(diff.removed_links, set([(1, 2, 2, 2)]))
+        eq_(diff.affected_pairs(), set([(1, 2), (2, 1)]))
+        ok_(not self.differ.diff())
+
+    def test_flapping_link(self):
+        for _ in range(10):
+            self.topology.delete_link(_link(1, 2, 2, 2))
+            self.topology.add_link(_link(1, 2, 2, 2))
+        ok_(not self.differ.diff())
+
+    def test_link_port_changed(self):
+        self.topology.add_link(_link(1, 3, 2, 2))
+        diff = self.differ.diff()
+        eq_(diff.added_links, set([(1, 3, 2, 2)]))
+        eq_(diff.removed_links, set([(1, 2, 2, 2)]))
+        eq_(diff.affected_pairs(), set([(1, 2)]))
+
+    def test_switches_and_hosts(self):
+        self.topology.delete_switch(SwitchRecord(DatapathRecord(2)))
+        self.topology.add_switch(SwitchRecord(DatapathRecord(3)))
+        self.topology.add_host(HostRecord(MAC1, PortRecord(1, 1)))
+        diff = self.differ.diff()
+        eq_(diff.removed_switches, set([2]))
+        eq_(diff.added_switches, set([3]))
+        eq_(diff.added_hosts, set([(MAC1, 1, 1)]))
+
+        self.topology.add_host(HostRecord(MAC1, PortRecord(3, 1)))
+        diff = self.differ.diff()
+        eq_(diff.added_hosts, set([(MAC1, 3, 1)]))
+        eq_(diff.removed_hosts, set([(MAC1, 1, 1)]))
+
+    def test_truncated_change_log(self):
+        for port in range(TopologyDB.CHANGELOG_SIZE + 1):
+            self.topology.add_link(_link(2, port, 1, 1))
+        self.topology.delete_link(_link(1, 2, 2, 2))
+        diff = self.differ.diff()
+        eq_(diff.added_links, set([(2, TopologyDB.CHANGELOG_SIZE, 1, 1)]))
+        eq_(diff.removed_links, set([(1, 2, 2, 2)]))
+
+    def test_affected_routes(self):
+        self.topology.delete_link(_link(1, 2, 2, 2))
+        diff = self.differ.diff()
+        # Routes crossing the removed link, and one that does not
+        routes = [[(3, 4), (1, 2), (2, 1)], [(1, 2), (2, 3)],
+                  [(2, 2), (1, 1)]]
+        eq_(diff.affected_pairs(routes), set([(1, 2), (3, 2)]))
+
+    def test_affected_routes_removed_switch(self):
+        self.topology.delete_switch(SwitchRecord(DatapathRecord(2)))
+        diff = self.differ.diff()
+        eq_(diff.affected_pairs([[(1, 2), (2, 1)], [(1, 3), (3, 1)]]),
+            set([(1, 2)]))
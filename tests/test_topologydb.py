@@ -1,8 +1,11 @@
 from unittest import TestCase
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from tests.mock import MockPort, MockLink, MockHost, MockSwitch
 from sdnmpi.util.topology_db import TopologyDB
+from sdnmpi.util.records import (DatapathRecord, SwitchRecord, PortRecord,
+                                 LinkRecord, HostRecord)
+import ryu.ofproto.ofproto_v1_0 as ofproto
 
 MAC1 = "02:00:00:00:00:01"
 MAC2 = "02:00:00:00:00:02"
@@ -46,19 +49,13 @@ class TopologyDBTestCase(TestCase):
             },
         }
 
-        self.topology.hosts = {
-            MAC1: MockHost(MAC1, port11),
-            MAC2: MockHost(MAC2, port21),
-            MAC3: MockHost(MAC3, port31),
-            MAC4: MockHost(MAC4, port41),
-        }
+        self.topology.add_host(MockHost(MAC1, port11))
+        self.topology.add_host(MockHost(MAC2, port21))
+        self.topology.add_host(MockHost(MAC3, port31))
+        self.topology.add_host(MockHost(MAC4, port41))
 
-        self.topology.switches = {
-            1: MockSwitch(1),
-            2: MockSwitch(2),
-            3: MockSwitch(3),
-            4: MockSwitch(4),
-        }
+        for dpid in [1, 2, 3, 4]:
+            self.topology.add_switch(MockSwitch(dpid))
 
     def test_find_route_inter_switch(self):
         route = self.topology.find_route(MAC1, MAC1)
@@ -107,3 +104,142 @@ class TopologyDBTestCase(TestCase):
         eq_(routes, [])
         routes = self.topology.find_route(MAC1, MAC4, True)
         eq_(routes, [])
+
+    def test_find_route_local_port(self):
+        route = self.topology.find_route(MAC1, "00:00:00:00:00:04")
+        eq_(route, [(1, 3), (3, 2), (4, ofproto.OFPP_LOCAL)])
+
+    def test_find_route_unknown_host(self):
+        route = self.topology.find_route(MAC1, "02:00:00:00:00:05")
+        eq_(route, [])
+
+    def test_delete_host(self):
+        host = self.topology.delete_host(MAC4)
+        eq_(host.mac, MAC4)
+        eq_(self.topology.find_route(MAC1, MAC4), [])
+        ok_(self.topology.delete_host(MAC4) is None)
+
+    def test_get_hosts_at(self):
+        eq_([host.mac for host in self.topology.get_hosts_at(2, 1)], [MAC2])
+        eq_(self.topology.get_hosts_at(2, 2), [])
+
+    def test_find_multicast_tree(self):
+        tree = self.topology.find_multicast_tree(MAC1, [MAC2, MAC3, MAC4])
+        eq_(tree.receivers, [MAC2, MAC3, MAC4])
+        eq_(tree.actions(1), [(2, None), (3, None)])
+        eq_(tree.actions(2), [(3, None), (1, MAC2)])
+        eq_(tree.actions(3), [(1, MAC3)])
+        eq_(tree.actions(4), [(1, MAC4)])
+        eq_(tree.links, 6)
+        eq_(tree.unicast_links, 7)
+
+    def test_find_multicast_tree_unknown_hosts(self):
+        eq_(self.topology.find_multicast_tree("02:00:00:00:00:05", [MAC2]),
+            None)
+        tree = self.topology.find_multicast_tree(
+            MAC1, [MAC1, "02:00:00:00:00:05"])
+        eq_(tree.receivers, [])
+        eq_(tree.ports, {})
+
+    def test_find_multicast_tree_unreachable(self):
+        del self.topology.links[2][4]
+        del self.topology.links[3][4]
+        tree = self.topology.find_multicast_tree(MAC1, [MAC2, MAC4])
+        eq_(tree.receivers, [MAC2])
+        eq_(sorted(tree.ports), [1, 2])
+
+
+class TopologyDBChangeLogTestCase(TestCase):
+    def setUp(self):
+        self.topology = TopologyDB()
+        self.topology.add_switch(MockSwitch(1))
+        self.topology.add_switch(MockSwitch(2))
+        self.topology.add_link(MockLink(MockPort(1, 2), MockPort(2, 2)))
+        self.topology.add_link(MockLink(MockPort(2, 2), MockPort(1, 2)))
+        self.topology.add_host(MockHost(MAC1, MockPort(1, 1)))
+        self.topology.add_host(MockHost(MAC2, MockPort(2, 1)))
+
+    def test_replicate_dump(self):
+        replica = TopologyDB()
+        for change in self.topology.dump_changes():
+            replica.apply_change(change)
+        eq_(replica.find_route(MAC1, MAC2), [(1, 2), (2, 1)])
+
+    def test_replicate_changes_since(self):
+        replica = TopologyDB()
+        for change in self.topology.changes_since(0):
+            replica.apply_change(change)
+        version = self.topology.version
+
+        self.topology.delete_link(MockLink(MockPort(1, 2), MockPort(2, 2)))
+        for change in self.topology.changes_since(version):
+            replica.apply_change(change)
+        eq_(replica.find_route(MAC1, MAC2), [])
+        eq_(replica.find_route(MAC2, MAC1), [(2, 2), (1, 1)])
+
+    def test_replicate_delete_host(self):
+        replica = TopologyDB()
+        for change in self.topology.dump_changes():
+            replica.apply_change(change)
+        version = self.topology.version
+
+        self.topology.delete_host(MAC2)
+        for change in self.topology.changes_since(version):
+            replica.apply_change(change)
+        eq_(replica.find_route(MAC1, MAC2), [])
+
+    def test_change_listeners(self):
+        changes = []
+        self.topology.change_listeners.append(changes.append)
+        self.topology.delete_host(MAC2)
+        self.topology.delete_host(MAC2)
+        eq_(changes, [("delete_host", MAC2, 2, 1)])
+
+    def test_changes_since_truncated(self):
+        class SmallChangeLogTopologyDB(TopologyDB):
+            CHANGELOG_SIZE = 2
+
+        topology = SmallChangeLogTopologyDB()
+        for dpid in range(4):
+            topology.add_switch(MockSwitch(dpid))
+        eq_(topology.changes_since(topology.version), [])
+        eq_(len(topology.changes_since(topology.version - 2)), 2)
+        ok_(topology.changes_since(0) is None)
+
+
+class TopologyDBViewTestCase(TestCase):
+    def setUp(self):
+        self.topology = TopologyDB()
+        self.switch = SwitchRecord(DatapathRecord(1))
+        self.switch.ports = [PortRecord(1, 1), PortRecord(1, 2)]
+        self.topology.add_switch(self.switch)
+        self.topology.add_switch(SwitchRecord(DatapathRecord(2)))
+        self.topology.add_link(LinkRecord(PortRecord(1, 2), PortRecord(2, 2)))
+        self.topology.add_host(HostRecord(MAC1, PortRecord(1, 1)))
+
+    def test_to_dict_cached(self):
+        view = self.topology.to_dict()
+        ok_(self.topology.to_dict() is view)
+        eq_(len(view["switches"]), 2)
+        eq_(len(view["links"]), 1)
+        eq_(view["hosts"][0]["mac"], MAC1)
+
+    def test_entity_views_reused(self):
+        switch_view = self.topology.switch_dict(self.switch)
+        self.topology.add_host(HostRecord(MAC2, PortRecord(2, 1)))
+        view = self.topology.to_dict()
+        eq_(len(view["hosts"]), 2)
+        ok_(any(switch is switch_view for switch in view["switches"]))
+        ok_(self.topology.switch_dict(self.switch) is switch_view)
+
+    def test_switch_changed(self):
+        view = self.topology.switch_dict(self.switch)
+        self.switch.ports.append(PortRecord(1, 3))
+        self.topology.switch_changed(1)
+        eq_(len(self.topology.switch_dict(self.switch)["ports"]), 3)
+        ok_(self.topology.switch_dict(self.switch) is not view)
+
+    def test_deleted_entity_not_cached(self):
+        self.topology.delete_switch(self.switch)
+        eq_(self.topology.switch_dict(self.switch)["dpid"], "%016x" % 1)
+        eq_(len(self.topology.to_dict()["switches"]), 1)
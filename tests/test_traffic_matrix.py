@@ -0,0 +1,57 @@
+import struct
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.traffic_matrix import TrafficMatrix, decode_sdn_mpi_addr
+
+
+class DecodeSDNMPIAddrTestCase(TestCase):
+    def test_decode(self):
+        mac_bin = struct.pack("<BBhh", (3 << 2) | 0x02, 0, 5, 300)
+        eq_(decode_sdn_mpi_addr(mac_bin), (5, 300, 3))
+
+    def test_not_sdn_mpi(self):
+        ok_(decode_sdn_mpi_addr(b"\x00\x00\x00\x00\x00\x01") is None)
+
+    def test_broadcast(self):
+        ok_(decode_sdn_mpi_addr(b"\xff\xff\xff\xff\xff\xff") is None)
+
+    def test_ipv6_multicast(self):
+        ok_(decode_sdn_mpi_addr(b"\x33\x33\x00\x00\x00\x01") is None)
+
+
+class TrafficMatrixTestCase(TestCase):
+    def setUp(self):
+        self.matrix = TrafficMatrix()
+        # Flow of (0, 1, 0) seen on both switches of its route
+        self.matrix.update_datapath(1, {(0, 1, 0): (1000, 10),
+                                        (1, 0, 0): (500, 5)})
+        self.matrix.update_datapath(2, {(0, 1, 0): (900, 9)})
+
+    def test_max_over_hops(self):
+        changed, deleted = self.matrix.refresh(10.0)
+        eq_(sorted(changed), [(0, 1, 0), (1, 0, 0)])
+        eq_(deleted, [])
+        eq_(self.matrix.get(0, 1), (1000, 10, 0.0))
+
+    def test_rate(self):
+        self.matrix.refresh(10.0)
+        self.matrix.update_datapath(1, {(0, 1, 0): (3000, 30),
+                                        (1, 0, 0): (500, 5)})
+        changed, deleted = self.matrix.refresh(12.0)
+        eq_(changed, [(0, 1, 0)])
+        eq_(self.matrix.get(0, 1), (3000, 30, 1000.0))
+        eq_(self.matrix.hotspots(1), [(0, 1, 0)])
+
+    def test_deleted(self):
+        self.matrix.refresh(10.0)
+        self.matrix.update_datapath(1, {})
+        self.matrix.delete_datapath(2)
+        changed, deleted = self.matrix.refresh(11.0)
+        eq_(sorted(deleted), [(0, 1, 0), (1, 0, 0)])
+        eq_(len(self.matrix), 0)
+
+    def test_to_rows(self):
+        self.matrix.refresh(10.0)
+        eq_(sorted(self.matrix.to_rows()),
+            [[0, 1, 0, 1000, 10, 0.0], [1, 0, 0, 500, 5, 0.0]])
@@ -0,0 +1,52 @@
+import sys
+from unittest import TestCase
+from nose.tools import eq_, ok_
+
+from sdnmpi.util.watchdog import WatchdogStats, find_handler
+
+
+class App(object):
+    def handler(self):
+        return sys._getframe()
+
+
+def _event_loop(handler):
+    return handler()
+
+
+class FindHandlerTestCase(TestCase):
+    def test_find_handler(self):
+        frame = _event_loop(App().handler)
+        eq_(find_handler(frame), "App.handler")
+
+    def test_outside_event_loop(self):
+        ok_(find_handler(sys._getframe()) is None)
+
+
+class WatchdogStatsTestCase(TestCase):
+    def test_lag(self):
+        stats = WatchdogStats()
+        stats.add_lag(0.1)
+        stats.add_lag(0.3)
+        result = stats.to_dict()
+        eq_(result["samples"], 2)
+        eq_(result["max_lag"], 0.3)
+        ok_(abs(result["mean_lag"] - 0.2) < 1e-9)
+
+    def test_queue_lengths(self):
+        stats = WatchdogStats()
+        stats.set_queue_length("Router", 5)
+        stats.set_queue_length("Router", 2)
+        eq_(stats.to_dict()["queue_lengths"], {"Router": 2})
+        eq_(stats.to_dict()["max_queue_lengths"], {"Router": 5})
+
+    def test_stalls(self):
+        stats = WatchdogStats()
+        stats.add_stall("Router._packet_in_handler", 1.0, "stack")
+        stats.add_stall("Router._packet_in_handler", 0.5, "stack")
+        stats.add_stall(None, 0.7, "stack")
+        result = stats.to_dict()
+        eq_(result["stalls"]["Router._packet_in_handler"],
+            {"count": 2, "max_duration": 1.0})
+        eq_(result["stalls"]["unknown"]["count"], 1)
+        eq_(result["last_stall"]["duration"], 0.7)